@@ -282,6 +282,10 @@ CELERY_REDIS_SOCKET_TIMEOUT = 30
 CELERY_REDIS_RETRY_ON_TIMEOUT = True
 CELERY_REDIS_BACKEND_HEALTH_CHECK_INTERVAL = 30
 CELERY_REDIS_SOCKET_KEEPALIVE = True
+# The nightly collection of all metrics is spread over this period (in seconds).
+# Note: this should stay below the broker's visibility timeout (1h by default),
+# as tasks waiting for their ETA would otherwise be redelivered.
+COLLECT_ALL_LATEST_WINDOW = env.int("COLLECT_ALL_LATEST_WINDOW", default=30 * 60)
 
 # Static deployment
 STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
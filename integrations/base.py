@@ -3,13 +3,18 @@ import hashlib
 import os
 import re
 import string
+import time
 from abc import abstractmethod
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import date, timedelta
 from typing import (
     Callable,
     ClassVar,
+    Deque,
     Dict,
     Iterable,
+    Iterator,
     List,
     Literal,
     NamedTuple,
@@ -17,8 +22,14 @@ from typing import (
     Tuple,
 )
 
+import requests
+from requests.adapters import BaseAdapter
 from requests_oauthlib import OAuth2Session
 
+from .http import PooledAdapter, mount_adapter
+from .rate_limit import RateLimit, RateLimitedAdapter, TokenBucket, bucket_name
+from .response_cache import ConditionalCacheAdapter
+
 MeasurementTuple = NamedTuple("MeasurementTuple", [("date", date), ("value", float)])
 
 
@@ -43,6 +54,27 @@ class Integration:
 
     description: Optional[str] = None
 
+    # Relative cost of a nightly collection (in number of requests, duration..).
+    # Used to spread the nightly collection of all metrics over time.
+    collect_weight: ClassVar[float] = 1
+
+    # Provider rate limit, shared by all workers.
+    # Requests are counted per `rate_limit_key`.
+    rate_limit: ClassVar[Optional[RateLimit]] = None
+
+    # Cache responses of the sessions and revalidate them with conditional
+    # requests (ETag / Last-Modified)
+    cache_responses: ClassVar[bool] = False
+
+    # Backfills are split in shards of `backfill_shard_days` days,
+    # of which at most `backfill_concurrency` are collected in parallel.
+    backfill_shard_days: ClassVar[int] = 90
+    backfill_concurrency: ClassVar[int] = 4
+
+    # Number of `collect_past` calls the default `collect_past_range` runs in
+    # parallel. Only increase it if `collect_past` is thread safe.
+    collect_past_concurrency: ClassVar[int] = 1
+
     def __init__(self, config: Optional[Dict], *args, **kwargs):
         self.config = config or {}
 
@@ -62,6 +94,33 @@ class Integration:
     def get_label(cls):
         return string.capwords(cls.__module__.split(".")[-1].replace("_", " "), sep=" ")
 
+    def rate_limit_key(self) -> Optional[str]:
+        """Override to count requests per account or credentials
+        instead of per integration"""
+        return None
+
+    def response_cache_namespace(self) -> Optional[str]:
+        """Responses are cached per namespace (when `cache_responses` is set).
+        Defaults to the `Authorization` header of each request."""
+        return None
+
+    def mount_adapters(self, session: requests.Session) -> None:
+        """Makes requests of the session use the connection pool of the
+        process, go through `rate_limit` and use the response cache"""
+        adapter: BaseAdapter = PooledAdapter()
+        rate_limit = self.rate_limit
+        if rate_limit is not None:
+            integration_id = self.__module__.split(".")[-1]
+            adapter = RateLimitedAdapter(
+                lambda: TokenBucket(
+                    bucket_name(integration_id, self.rate_limit_key()), rate_limit
+                )
+            )
+        if self.cache_responses:
+            # Revalidations still go through the rate limiter
+            adapter = ConditionalCacheAdapter(adapter, self.response_cache_namespace)
+        mount_adapter(session, adapter)
+
     @abstractmethod
     def can_backfill(self) -> bool:
         pass
@@ -116,9 +175,53 @@ class Integration:
                 break
             else:
                 dates.append(new_date)
+        if self.collect_past_concurrency > 1:
+            return self._collect_past_concurrently(list(reversed(dates)))
         # Return a generator that won't take up memory
         return (self.collect_past(dt) for dt in reversed(dates))
 
+    def _collect_past_concurrently(
+        self, dates: List[date]
+    ) -> Iterator[MeasurementTuple]:
+        # Results are yielded in date order, while the next dates are being
+        # collected. At most `collect_past_concurrency` calls are in flight.
+        if isinstance(self, OAuth2Integration):
+            # Pool threads share the session, and mustn't refresh the token
+            self.refresh_token_ahead()
+        with ThreadPoolExecutor(max_workers=self.collect_past_concurrency) as executor:
+            futures: Deque[Future[MeasurementTuple]] = deque()
+            for dt in dates:
+                futures.append(executor.submit(self.collect_past, dt))
+                if len(futures) >= self.collect_past_concurrency:
+                    yield futures.popleft().result()
+            while futures:
+                yield futures.popleft().result()
+
+    def batch_key(self) -> Optional[str]:
+        """Metrics of the same integration sharing credentials and `batch_key`
+        will be collected together using `collect_past_range_batch`.
+        Returns None when the metric can't be collected with others."""
+        return None
+
+    @classmethod
+    def collect_past_range_batch(
+        cls, integrations: List["Integration"], date_start: date, date_end: date
+    ) -> List[List[MeasurementTuple]]:
+        """Collects the measurements of each integration (not yet entered).
+        Override when the API can serve several metrics per request."""
+        # Default implementation collects each metric separately
+        results = []
+        for integration in integrations:
+            with integration as inst:
+                results.append(
+                    list(
+                        inst.collect_past_range(
+                            date_start=date_start, date_end=date_end
+                        )
+                    )
+                )
+        return results
+
 
 class WebAuthIntegration(Integration):
     def __init__(
@@ -152,6 +255,10 @@ class WebAuthIntegration(Integration):
         pass
 
 
+# Longer than a task: tokens refreshed ahead don't expire while it runs
+TOKEN_REFRESH_MARGIN = 30 * 60  # seconds
+
+
 class OAuth2Integration(WebAuthIntegration):
     # Declare some required attribute
     # TODO: How do we make sure mypy understand that this attribute need
@@ -191,6 +298,7 @@ class OAuth2Integration(WebAuthIntegration):
         )
         for k, v in self.compliance_hooks.items():
             self.session.register_compliance_hook(k, v)
+        self.mount_adapters(self.session)
 
     def __enter__(self) -> "OAuth2Integration":
         assert self.session.authorized
@@ -200,6 +308,27 @@ class OAuth2Integration(WebAuthIntegration):
     def is_authorized(self) -> bool:
         return self.session.authorized
 
+    def response_cache_namespace(self) -> Optional[str]:
+        # Access tokens are refreshed, while the grant stays the same
+        return self.session.token.get("refresh_token")
+
+    def refresh_token_ahead(self) -> None:
+        """
+        Refreshes the access token if it expires within TOKEN_REFRESH_MARGIN.
+        To be called before requests are sent from another thread (e.g. when
+        prefetching pages): refreshing there would save the credentials from
+        a thread whose database connection is never closed.
+        """
+        expires_at = self.session.token.get("expires_at")
+        if self.refresh_url is None or expires_at is None:
+            return
+        if expires_at - time.time() > TOKEN_REFRESH_MARGIN:
+            return
+        token = self.session.refresh_token(
+            self.refresh_url, **self.session.auto_refresh_kwargs
+        )
+        self.session.token_updater(token)
+
     @classmethod
     def get_authorization_uri_and_code_verifier(
         cls, state: str, authorize_callback_uri: str
@@ -0,0 +1,103 @@
+import importlib.util
+import logging
+import os
+import socket
+import threading
+from typing import Dict, Optional
+
+import requests
+from environs import Env
+from requests.adapters import BaseAdapter, HTTPAdapter
+from urllib3.connection import HTTPConnection
+
+env = Env()
+env.read_env()  # read .env file, if it exists
+
+logger = logging.getLogger(__name__)
+
+# Number of hosts for which connections are kept
+HTTP_POOL_CONNECTIONS = env.int("HTTP_POOL_CONNECTIONS", default=32)
+# Number of connections kept per host (i.e. concurrent requests to a host)
+HTTP_POOL_MAXSIZE = env.int("HTTP_POOL_MAXSIZE", default=16)
+# Requires the `h2` package. Support in urllib3 is still experimental.
+HTTP2 = env.bool("HTTP2", default=False)
+
+_pool: Optional[HTTPAdapter] = None
+_pool_pid: Optional[int] = None
+_pool_lock = threading.Lock()
+
+
+class KeepAliveHTTPAdapter(HTTPAdapter):
+    """Enables TCP keep-alive, so that idle pooled connections stay open"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["socket_options"] = HTTPConnection.default_socket_options + [
+            (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        ]
+        super().init_poolmanager(*args, **kwargs)
+
+
+def _enable_http2() -> None:
+    if importlib.util.find_spec("h2") is None:
+        logger.warning("HTTP/2 isn't available (missing `h2`), using HTTP/1.1")
+        return
+    from urllib3.http2 import inject_into_urllib3
+
+    inject_into_urllib3()
+
+
+def get_pool() -> HTTPAdapter:
+    """Returns the connection pool of the process, keyed by host"""
+    global _pool, _pool_pid
+    with _pool_lock:
+        # Connections can't be shared with forked processes (e.g. workers)
+        if _pool is None or _pool_pid != os.getpid():
+            if HTTP2:
+                _enable_http2()
+            _pool = KeepAliveHTTPAdapter(
+                pool_connections=HTTP_POOL_CONNECTIONS,
+                pool_maxsize=HTTP_POOL_MAXSIZE,
+            )
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def pool_stats() -> Dict[str, Dict[str, int]]:
+    """Number of requests and connections made per host and port"""
+    pools = get_pool().poolmanager.pools
+    stats = {}
+    for key in pools.keys():
+        pool = pools.get(key)
+        if pool is None:
+            continue
+        stats[f"{pool.scheme}://{pool.host}:{pool.port}"] = {
+            "requests": pool.num_requests,
+            "connections": pool.num_connections,
+            "reused": pool.num_requests - pool.num_connections,
+        }
+    return stats
+
+
+class PooledAdapter(BaseAdapter):
+    """
+    Sends requests through the connection pool of the process. Sessions only
+    hold their own credentials (headers, tokens..) and share connections.
+    """
+
+    def send(self, request, *args, **kwargs):
+        return get_pool().send(request, *args, **kwargs)
+
+    def close(self):
+        # Closing a session must not close the shared connections
+        pass
+
+
+def mount_adapter(session: requests.Session, adapter: BaseAdapter) -> None:
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+
+def pooled_session() -> requests.Session:
+    session = requests.Session()
+    mount_adapter(session, PooledAdapter())
+    return session
@@ -1,9 +1,15 @@
-from datetime import date, datetime, timedelta
-from typing import final
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple, final
 
 import requests
 
 from ..base import Integration, MeasurementTuple
+from ..rate_limit import RateLimit
+from ..utils import fill_mesurement_range, paginate
+
+# Maximum number of posts per search page
+PAGE_LIMIT = 100
 
 
 def validate_http_response(response: requests.models.Response):
@@ -21,10 +27,35 @@ def validate_http_response(response: requests.models.Response):
         raise
 
 
+def utc_datetime(value: str) -> datetime:
+    dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    # Timestamps without an offset are in UTC
+    if dt.tzinfo is None:
+        return dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
+
+
+def sort_date(post: Dict) -> date:
+    """
+    UTC day of the timestamp `since` and `until` filter posts on: the
+    earliest of the creation and indexing times
+    """
+    indexed_at = utc_datetime(post["indexedAt"])
+    try:
+        created_at = utc_datetime(post["record"]["createdAt"])
+    except (KeyError, TypeError, ValueError):
+        return indexed_at.date()
+    return min(created_at, indexed_at).date()
+
+
 @final
 class Bluesky(Integration):
     description = "Mentions on Bluesky."
     protected_field_paths = [["password"]]
+    # Each collection requires a full (paginated) search sweep
+    collect_weight = 3
+    # See https://docs.bsky.app/docs/advanced-guides/rate-limits
+    rate_limit = RateLimit(3000, 5 * 60)
 
     def callable_config_schema(self):
         # Use https://bhch.github.io/react-json-form/playground
@@ -68,13 +99,14 @@ class Bluesky(Integration):
         super().__enter__()
         username, password = self.config.get("username"), self.config.get("password")
         if username and password:
-            r = requests.post(
+            self.session = requests.Session()
+            self.mount_adapters(self.session)
+            r = self.session.post(
                 "https://bsky.social/xrpc/com.atproto.server.createSession",
                 json={"identifier": username, "password": password},
             )
             r.raise_for_status()
             accessJwt = r.json()["accessJwt"]
-            self.session = requests.Session()
             self.session.headers.update({"Authorization": f"Bearer {accessJwt}"})
         return self
 
@@ -82,23 +114,46 @@ class Bluesky(Integration):
         return True
 
     def collect_past(self, date: date) -> MeasurementTuple:
+        return self.collect_past_range(date_start=date, date_end=date)[0]
+
+    def collect_past_range(
+        self, date_start: date, date_end: date
+    ) -> List[MeasurementTuple]:
+        # Each post has an int being one of likeCount,replyCount,repostCount,quoteCount
+        metric = self.config["metric"]
+        if metric == "query_mention_count":
+            get_value = lambda post: 1
+        elif metric == "query_mention_likes":
+            get_value = lambda post: post["likeCount"]
+        elif metric == "query_mention_replies":
+            get_value = lambda post: post["replyCount"]
+        else:
+            raise KeyError(f"Unknown metric {metric}")
 
         # TODO: pass user timezone here tzinfo=ZoneInfo(...)
         start_time = datetime(
-            year=date.year, month=date.month, day=date.day, tzinfo=None
+            year=date_start.year,
+            month=date_start.month,
+            day=date_start.day,
+            tzinfo=timezone.utc,
         )
-        end_time = start_time + timedelta(days=1)
-        since = start_time.isoformat() + "Z"
-        until = end_time.isoformat() + "Z"
+        end_time = datetime(
+            year=date_end.year,
+            month=date_end.month,
+            day=date_end.day,
+            tzinfo=timezone.utc,
+        ) + timedelta(days=1)
+        since = start_time.isoformat().replace("+00:00", "Z")
+        until = end_time.isoformat().replace("+00:00", "Z")
 
-        posts = []
-        cursor = None
-        while True:
+        def fetch_page(cursor: Optional[str]) -> Tuple[List[Dict], Optional[str]]:
             # # https://docs.bsky.app/docs/api/app-bsky-feed-search-posts
             params = {
-                "q": '"Electricity Maps"',
+                "q": self.config["metric_query"],
+                "sort": "latest",
                 "since": since,  # Inclusive
                 "until": until,  # Not inclusive
+                "limit": PAGE_LIMIT,
             }
             if cursor:
                 params["cursor"] = cursor
@@ -108,18 +163,16 @@ class Bluesky(Integration):
             )
             r.raise_for_status()
             data = r.json()
-            posts += data["posts"]
-            cursor = data.get("cursor")
-            if not cursor:
-                break
+            return data["posts"], data.get("cursor") or None
 
-        # Each post has an int being one of likeCount,replyCount,repostCount,quoteCount
-        if self.config["metric"] == "query_mention_count":
-            value = len(posts)
-        elif self.config["metric"] == "query_mention_likes":
-            value = sum([post["likeCount"] for post in posts])
-        elif self.config["metric"] == "query_mention_replies":
-            value = sum([post["replyCount"] for post in posts])
-        else:
-            raise KeyError(f"Unknown metric {self.config['metric']}")
-        return MeasurementTuple(date=date, value=value)
+        # Posts are aggregated per (UTC) day as they stream in, and dropped
+        values: Dict[date, int] = defaultdict(int)
+        for post in paginate(fetch_page):
+            dt = sort_date(post)
+            if date_start <= dt <= date_end:
+                values[dt] += get_value(post)
+        return fill_mesurement_range(
+            [MeasurementTuple(date=dt, value=value) for dt, value in values.items()],
+            date_start,
+            date_end,
+        )
@@ -1,92 +1,230 @@
+import json
+import logging
+import re
+from collections import deque
 from datetime import date, timedelta
-from typing import Iterable, final
+from typing import Deque, Dict, Iterable, List, NamedTuple, Optional, Tuple, cast, final
+from urllib.parse import urlencode
 
 import requests
 from oauthlib.oauth2 import InvalidGrantError
 from requests_oauthlib import OAuth2Session
 
-from integrations.base import MeasurementTuple, OAuth2Integration
-from integrations.utils import batch_range_by_max_batch, get_secret
-
-
-def collect_insights_for_account(
-    session: OAuth2Session,
-    access_token_override: str | None,
-    account_id: str,
-    metric: str,
-    max_days: int,
-    date_start: date,
-    date_end: date,
-) -> Iterable[MeasurementTuple]:
-    if (date_end - date_start).days > max_days:
-        yield from batch_range_by_max_batch(
-            date_start=date_start,
-            date_end=date_end,
-            max_days=max_days,
-            callable=lambda date_start, date_end: collect_insights_for_account(
-                session,
-                access_token_override,
-                account_id,
-                metric,
-                max_days,
-                date_start,
-                date_end,
+from integrations.base import Integration, MeasurementTuple, OAuth2Integration
+from integrations.rate_limit import WEIGHT_HEADER, RateLimit, RateLimitExceeded
+from integrations.utils import get_secret
+
+logger = logging.getLogger(__name__)
+
+GRAPH_URL = "https://graph.facebook.com/v19.0"
+# Paging links are absolute and versioned, unlike relative urls of batches
+GRAPH_URL_PREFIX_RE = re.compile(r"^https://graph\.facebook\.com/(?:v[\d.]+/)?")
+# See https://developers.facebook.com/docs/graph-api/batch-requests
+GRAPH_BATCH_MAX_SIZE = 50
+# Calls of a batch can time out, in which case they are sent again
+GRAPH_BATCH_MAX_ATTEMPTS = 3
+# Requests are slowed down once the usage of a rate limit reaches that percentage
+USAGE_THROTTLE_THRESHOLD = 75
+# Delay before requests are sent again when the usage is at 100%
+USAGE_MAX_DELAY = 30  # seconds
+
+
+def pace_graph_usage(response: requests.Response, *args, **kwargs) -> None:
+    """
+    Response hook slowing down requests as the usage of the app and business
+    use case rate limits increases, before Graph starts rejecting them.
+    Instead of waiting in the worker, `RateLimitExceeded` is raised with the
+    delay, after which the task is retried.
+    See https://developers.facebook.com/docs/graph-api/overview/rate-limiting/
+    """
+    usages: List[float] = []
+    regain_access_minutes = 0
+    try:
+        if "x-app-usage" in response.headers:
+            usages += json.loads(response.headers["x-app-usage"]).values()
+        if "x-business-use-case-usage" in response.headers:
+            for entries in json.loads(
+                response.headers["x-business-use-case-usage"]
+            ).values():
+                for entry in entries:
+                    usages += [
+                        entry.get("call_count", 0),
+                        entry.get("total_cputime", 0),
+                        entry.get("total_time", 0),
+                    ]
+                    regain_access_minutes = max(
+                        regain_access_minutes,
+                        entry.get("estimated_time_to_regain_access", 0),
+                    )
+    except (ValueError, AttributeError, TypeError):
+        logger.warning("Could not parse Graph API usage headers", exc_info=True)
+        return
+    if regain_access_minutes:
+        raise RateLimitExceeded(
+            f"Graph API rate limit reached (access regained in {regain_access_minutes} minutes)",
+            retry_after=regain_access_minutes * 60,
+        )
+    usage = max(usages, default=0)
+    if usage >= USAGE_THROTTLE_THRESHOLD:
+        delay = (
+            min(usage - USAGE_THROTTLE_THRESHOLD, 100 - USAGE_THROTTLE_THRESHOLD)
+            / (100 - USAGE_THROTTLE_THRESHOLD)
+            * USAGE_MAX_DELAY
+        )
+        raise RateLimitExceeded(
+            f"Graph API usage at {usage}%, waiting {delay:.1f}s", retry_after=delay
+        )
+
+
+def _raise_for_graph_error(status_code: int, body: Dict) -> None:
+    error = body.get("error", {})
+    if status_code == 401 and error.get("type") == "OAuthException":
+        raise InvalidGrantError(error["message"])
+    raise requests.HTTPError(
+        f"{status_code} Graph API error: {error.get('message', body)}"
+    )
+
+
+def graph_batch(
+    session: OAuth2Session, relative_urls: List[str]
+) -> List[Optional[Tuple[int, Dict]]]:
+    """
+    Sends GET calls in a single batch request, and returns the status code
+    and body of each, in order. Calls that timed out are returned as None.
+    """
+    assert len(relative_urls) <= GRAPH_BATCH_MAX_SIZE
+    response = session.post(
+        f"{GRAPH_URL}/",
+        # Each call of the batch counts towards rate limits
+        headers={WEIGHT_HEADER: str(len(relative_urls))},
+        data={
+            "batch": json.dumps(
+                [{"method": "GET", "relative_url": url} for url in relative_urls]
             ),
+            "include_headers": "false",
+        },
+    )
+    try:
+        response.raise_for_status()
+    except requests.HTTPError as e:
+        if e.response is not None and e.response.status_code == 401:
+            data = e.response.json()
+            if data["error"]["type"] == "OAuthException":
+                raise InvalidGrantError(data["error"]["message"]) from None
+        raise
+    return [
+        (result["code"], json.loads(result["body"])) if result else None
+        for result in response.json()
+    ]
+
+
+def graph_batch_get(session: OAuth2Session, relative_urls: List[str]) -> List[Dict]:
+    """Bodies of GET calls, sent in as few batch requests as possible"""
+    bodies: List[Optional[Dict]] = [None] * len(relative_urls)
+    pending: Deque[Tuple[int, int]] = deque(
+        (index, 1) for index in range(len(relative_urls))
+    )
+    while pending:
+        calls = [
+            pending.popleft() for _ in range(min(len(pending), GRAPH_BATCH_MAX_SIZE))
+        ]
+        results = graph_batch(session, [relative_urls[index] for index, _ in calls])
+        for (index, attempt), result in zip(calls, results):
+            if result is None:
+                if attempt >= GRAPH_BATCH_MAX_ATTEMPTS:
+                    raise requests.Timeout(
+                        f"Graph API call timed out: {relative_urls[index]}"
+                    )
+                pending.append((index, attempt + 1))
+                continue
+            status_code, body = result
+            if status_code != 200:
+                _raise_for_graph_error(status_code, body)
+            bodies[index] = body
+    return cast(List[Dict], bodies)
+
+
+class InsightsQuery(NamedTuple):
+    account_id: str
+    metric: str
+    # Page insights require a page access token
+    access_token: Optional[str]
+    date_start: date
+    date_end: date
+
+
+def collect_insights(
+    session: OAuth2Session, queries: List[InsightsQuery], max_days: int
+) -> List[List[MeasurementTuple]]:
+    """
+    Collects daily insights of several metrics and accounts. Time windows of
+    all queries are requested together, in batches, as well as next pages.
+    """
+    # Each query is split in windows of at most `max_days`
+    windows: List[Tuple[int, date, date]] = []
+    for query_index, query in enumerate(queries):
+        window_start = query.date_start
+        while window_start <= query.date_end:
+            window_end = min(
+                window_start + timedelta(days=max_days - 1), query.date_end
+            )
+            windows.append((query_index, window_start, window_end))
+            window_start = window_end + timedelta(days=1)
+
+    results: List[List[MeasurementTuple]] = [[] for _ in windows]
+    # Calls to make: window index, relative url, and days already processed
+    calls: List[Tuple[int, str, int]] = []
+    for window_index, (query_index, window_start, window_end) in enumerate(windows):
+        query = queries[query_index]
+        params = {
+            "period": "day",  # The aggregation period
+            "since": window_start.isoformat(),
+            "until": (window_end + timedelta(days=1)).isoformat(),
+            "metric": query.metric,
+        }
+        if query.access_token:
+            params["access_token"] = query.access_token
+        calls.append(
+            (window_index, f"{query.account_id}/insights?{urlencode(params)}", 0)
         )
-    else:
-        next_url = None
-        processed_data_count = 0
-        while True:
-            # Request
-            if not next_url:
-                params = {
-                    "period": "day",  # The aggregation period
-                    "since": date_start.isoformat(),
-                    "until": (date_end + timedelta(days=1)).isoformat(),
-                    "metric": metric,
-                }
-                if access_token_override:
-                    params["access_token"] = access_token_override
-                response = session.get(
-                    f"https://graph.facebook.com/v19.0/{account_id}/insights",
-                    params=params,
-                )
-            else:
-                # Paging
-                response = session.get(next_url)
-            try:
-                response.raise_for_status()
-            except requests.HTTPError as e:
-                if e.response is not None and e.response.status_code == 401:
-                    data = e.response.json()
-                    if data["error"]["type"] == "OAuthException":
-                        raise InvalidGrantError(data["error"]["message"]) from None
-                raise
-            obj = response.json()
+
+    while calls:
+        bodies = graph_batch_get(session, [url for _, url, _ in calls])
+        next_calls = []
+        for (window_index, _, processed_data_count), obj in zip(calls, bodies):
+            _, window_start, window_end = windows[window_index]
             if not obj["data"]:
-                return
+                continue
             assert (
                 len(obj["data"]) == 1
             ), f'Incorrect length of data returned ({len(obj["data"])}). Expected 1'
             values = obj["data"][0]["values"]
             for d in values:
-                dt = date_start + timedelta(days=processed_data_count)
+                dt = window_start + timedelta(days=processed_data_count)
                 # For some reason the API forces us to page to future dates
-                if dt <= date_end:
-                    yield MeasurementTuple(date=dt, value=d["value"])
+                if dt <= window_end:
+                    results[window_index].append(
+                        MeasurementTuple(date=dt, value=d["value"])
+                    )
                 processed_data_count += 1
-
             # Only page if we expect more items
-            expected_count = (date_end - date_start).days
-            if len(values) >= expected_count:
-                break
-            else:
-                # Attempt paging
-                paging = obj["paging"]
-                if "next" in paging:
-                    next_url = paging["next"]
-                else:
-                    break
+            expected_count = (window_end - window_start).days
+            next_url = obj.get("paging", {}).get("next")
+            if len(values) < expected_count and next_url:
+                next_calls.append(
+                    (
+                        window_index,
+                        GRAPH_URL_PREFIX_RE.sub("", next_url),
+                        processed_data_count,
+                    )
+                )
+        calls = next_calls
+
+    # Windows are in chronological order for each query
+    measurements: List[List[MeasurementTuple]] = [[] for _ in queries]
+    for (query_index, _, _), window_measurements in zip(windows, results):
+        measurements[query_index] += window_measurements
+    return measurements
 
 
 @final
@@ -107,11 +245,23 @@ class Facebook(OAuth2Integration):
     description = (
         "Collect metrics such as likes, impressions and reach from your Facebook page."
     )
+    # See https://developers.facebook.com/docs/graph-api/overview/rate-limiting/
+    rate_limit = RateLimit(200, 3600)
 
     # Only the last two years of insights data is available.
     def earliest_backfill(self) -> date:
         return date.today().replace(year=date.today().year - 2)
 
+    def __enter__(self):
+        super().__enter__()
+        if pace_graph_usage not in self.session.hooks["response"]:
+            self.session.hooks["response"].append(pace_graph_usage)
+        return self
+
+    def rate_limit_key(self):
+        # Limits apply per user access token
+        return self.session.access_token
+
     def can_backfill(self):
         return True
 
@@ -183,27 +333,48 @@ class Facebook(OAuth2Integration):
     def collect_past_range(
         self, date_start: date, date_end: date
     ) -> Iterable[MeasurementTuple]:
-        # Get page access token
-        response = self.session.get(
-            f'https://graph.facebook.com/v19.0/{self.config["account_id"]}?fields=access_token'
-        )
-        try:
-            response.raise_for_status()
-        except requests.HTTPError as e:
-            if e.response is not None and e.response.status_code == 401:
-                data = e.response.json()
-                if data["error"]["type"] == "OAuthException":
-                    raise InvalidGrantError(data["error"]["message"]) from None
-            raise
-        access_token = response.json()["access_token"]
+        return self._collect_insights([self], date_start, date_end)[0]
 
-        yield from collect_insights_for_account(
-            session=self.session,
-            access_token_override=access_token,
-            account_id=self.config["account_id"],
-            metric=self.config["metric"],
+    def _collect_insights(
+        self, integrations: List["Facebook"], date_start: date, date_end: date
+    ) -> List[List[MeasurementTuple]]:
+        # Get page access tokens
+        account_ids = sorted({i.config["account_id"] for i in integrations})
+        access_tokens = {
+            account_id: body["access_token"]
+            for account_id, body in zip(
+                account_ids,
+                graph_batch_get(
+                    self.session,
+                    [f"{account_id}?fields=access_token" for account_id in account_ids],
+                ),
+            )
+        }
+        return collect_insights(
+            self.session,
+            [
+                InsightsQuery(
+                    account_id=i.config["account_id"],
+                    metric=i.config["metric"],
+                    access_token=access_tokens[i.config["account_id"]],
+                    date_start=date_start,
+                    date_end=date_end,
+                )
+                for i in integrations
+            ],
             # There cannot be more than 93 days (8035200 s) between since and from
             max_days=90,
-            date_start=date_start,
-            date_end=date_end,
         )
+
+    def batch_key(self) -> Optional[str]:
+        # Calls for all pages and metrics sharing a token go in the same batches
+        return ""
+
+    @classmethod
+    def collect_past_range_batch(
+        cls, integrations: List[Integration], date_start: date, date_end: date
+    ) -> List[List[MeasurementTuple]]:
+        # Metrics share credentials: the first one queries for all
+        batch = cast(List[Facebook], integrations)
+        with batch[0]:
+            return batch[0]._collect_insights(batch, date_start, date_end)
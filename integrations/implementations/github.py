@@ -2,6 +2,7 @@ from datetime import date, datetime, timedelta
 from typing import Dict, List, Union, final
 
 from ..base import MeasurementTuple, OAuth2Integration
+from ..rate_limit import RateLimit
 from ..utils import fill_mesurement_range, get_secret
 
 REPO_METRICS: List[Dict[str, Union[str, int]]] = [
@@ -39,6 +40,14 @@ class Github(OAuth2Integration):
     description = (
         "Github repository metrics such as stars, issues, page views and visitors."
     )
+    # See https://docs.github.com/en/rest/using-the-rest-api/rate-limits-for-the-rest-api
+    rate_limit = RateLimit(5000, 3600)
+    # Conditional requests answered with 304 don't count against the limit
+    cache_responses = True
+
+    def rate_limit_key(self):
+        # Limits apply per user access token
+        return self.session.access_token
 
     def callable_config_schema(self):
         r = self.session.get("https://api.github.com/user/repos")
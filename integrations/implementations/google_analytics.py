@@ -1,10 +1,16 @@
+import json
 from datetime import date, datetime
-from typing import Dict, Iterable, final
+from typing import Dict, Iterable, List, Optional, cast, final
 
 import requests
 
-from ..base import MeasurementTuple, OAuth2Integration
-from ..utils import batch_range_by_max_batch, fill_mesurement_range, get_secret
+from ..base import Integration, MeasurementTuple, OAuth2Integration
+from ..utils import (
+    batch_range_by_max_batch,
+    fill_mesurement_range,
+    get_secret,
+    paginate_offset,
+)
 
 MAX_DAYS = 300  # Maximum number of days per paginated query
 ROW_LIMIT = 10000  # Number of rows to fetch at a time
@@ -106,38 +112,24 @@ class GoogleAnalytics(OAuth2Integration):
     def can_backfill(self):
         return True
 
-    def _paginated_query(
-        self,
-        url,
-        date_start: date,
-        date_end: date,
-        request_data: Dict,
-        offset=0,
-    ):
-        if offset:
-            request_data = {
-                **request_data,
-                "offset": offset,
-            }
-        response = self.session.post(url, json=request_data)
-        try:
-            response.raise_for_status()
-        except requests.exceptions.HTTPError as e:
-            if e.response is not None and e.response.status_code == 400:
-                # Try to explain to the user
-                data = e.response.json()
-                raise Exception(data["error"]["message"])
-            else:
-                raise
-        data = response.json()
-        rows = data.get("rows", [])
-        if len(rows) < request_data["limit"]:
-            return rows
-        else:
-            offset += data["rowCount"]
-            return rows + self._paginated_query(
-                url, date_start, date_end, request_data, offset=offset
-            )
+    def _paginated_query(self, url, request_data: Dict) -> List[Dict]:
+        def fetch_page(offset: int) -> List[Dict]:
+            response = self.session.post(url, json={**request_data, "offset": offset})
+            try:
+                response.raise_for_status()
+            except requests.exceptions.HTTPError as e:
+                if e.response is not None and e.response.status_code == 400:
+                    # Try to explain to the user
+                    data = e.response.json()
+                    raise Exception(data["error"]["message"])
+                else:
+                    raise
+            return response.json().get("rows", [])
+
+        self.refresh_token_ahead()
+        return list(
+            paginate_offset(fetch_page, page_size=request_data["limit"], prefetch=True)
+        )
 
     def collect_past_range(
         self, date_start: date, date_end: date
@@ -151,9 +143,15 @@ class GoogleAnalytics(OAuth2Integration):
                 callable=self.collect_past_range,
             )
 
+        return self._query(date_start, date_end, [self.config["metric"]])[
+            self.config["metric"]
+        ]
+
+    def _query(
+        self, date_start: date, date_end: date, metrics: List[str]
+    ) -> Dict[str, List[MeasurementTuple]]:
         # Parameters
         property_id = self.config["property_id"]
-        metric = self.config["metric"]
 
         # Documentation:
         # https://developers.google.com/analytics/devguides/reporting/data/v1/rest/v1beta/properties/runReport
@@ -182,7 +180,7 @@ class GoogleAnalytics(OAuth2Integration):
                     ],
                 }
             },
-            "metrics": [{"name": metric}],
+            "metrics": [{"name": metric} for metric in metrics],
             "limit": ROW_LIMIT,
         }
 
@@ -191,17 +189,42 @@ class GoogleAnalytics(OAuth2Integration):
             del request_data["dimensionFilter"]
 
         request_url = f"https://analyticsdata.googleapis.com/v1beta/properties/{property_id}:runReport"
-        rows = self._paginated_query(request_url, date_start, date_end, request_data)
+        rows = self._paginated_query(request_url, request_data)
         if not rows:
-            return []
-        measurements = [
-            MeasurementTuple(
-                date=datetime.strptime(row["dimensionValues"][0]["value"], "%Y%m%d"),
-                value=float(row["metricValues"][0]["value"]),
+            return {metric: [] for metric in metrics}
+        results = {}
+        for i, metric in enumerate(metrics):
+            measurements = [
+                MeasurementTuple(
+                    date=datetime.strptime(
+                        row["dimensionValues"][0]["value"], "%Y%m%d"
+                    ),
+                    value=float(row["metricValues"][i]["value"]),
+                )
+                for row in rows
+            ]
+            # GA doesn't return data for rows that are 0
+            results[metric] = fill_mesurement_range(
+                measurements, date_start=date_start, date_end=date_end, fill_value=0
             )
-            for row in rows
-        ]
-        # GA doesn't return data for rows that are 0
-        return fill_mesurement_range(
-            measurements, date_start=date_start, date_end=date_end, fill_value=0
+        return results
+
+    def batch_key(self) -> Optional[str]:
+        # A report can contain several metrics for the same property and filters
+        return json.dumps(
+            [self.config["property_id"], self.config["filters"]], sort_keys=True
         )
+
+    @classmethod
+    def collect_past_range_batch(
+        cls, integrations: List[Integration], date_start: date, date_end: date
+    ) -> List[List[MeasurementTuple]]:
+        if (date_end - date_start).days > MAX_DAYS:
+            # Long ranges are paginated per metric
+            return super().collect_past_range_batch(integrations, date_start, date_end)
+        # Metrics share credentials: the first one queries for all
+        batch = cast(List[GoogleAnalytics], integrations)
+        metrics = sorted({integration.config["metric"] for integration in batch})
+        with batch[0]:
+            results = batch[0]._query(date_start, date_end, metrics)
+        return [results[integration.config["metric"]] for integration in batch]
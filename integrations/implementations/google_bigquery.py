@@ -1,10 +1,34 @@
+import hashlib
+import json
+import logging
+import time
 from datetime import date, datetime, timedelta
-from typing import List, Optional, final
+from typing import Dict, Iterator, List, Optional, Tuple, cast, final
 
+import redis
 import requests
 
 from ..base import MeasurementTuple, OAuth2Integration, UserFixableError
-from ..utils import get_secret
+from ..rate_limit import get_redis_client
+from ..utils import env, get_secret, paginate
+
+logger = logging.getLogger(__name__)
+
+# Number of rows per page of results
+PAGE_SIZE = 10000
+# Each poll waits for the job to complete for that long on the server
+POLL_TIMEOUT_MS = 10000
+# Delays between polls, in seconds
+POLL_INITIAL_DELAY = 1
+POLL_MAX_DELAY = 30
+# Jobs still running after that long are cancelled
+POLL_MAX_DURATION = 10 * 60  # seconds
+# Estimates the bytes processed by queries before running them (dry run)
+BIGQUERY_DRY_RUN = env.bool("BIGQUERY_DRY_RUN", default=False)
+# Queries processing more bytes than that aren't run (0 means no limit)
+BIGQUERY_MAX_BYTES_PROCESSED = env.int("BIGQUERY_MAX_BYTES_PROCESSED", default=0)
+# Estimates are computed again after that long
+ESTIMATE_CACHE_TTL = 24 * 3600  # seconds
 
 
 @final
@@ -83,46 +107,156 @@ class GoogleBigQuery(OAuth2Integration):
         sql_query_template = self.config["sql_query_template"]
         return "@date_start" in sql_query_template and "@date_end" in sql_query_template
 
-    def _query(
+    def _query_parameters(
+        self, date_start: Optional[date], date_end: Optional[date]
+    ) -> List[Dict]:
+        date_start_str = date_start.strftime("%Y-%m-%d") if date_start else None
+        date_end_str = date_end.strftime("%Y-%m-%d") if date_end else None
+        return [
+            {
+                "name": "date_start",
+                "parameterType": {"type": "DATE"},
+                "parameterValue": {"value": date_start_str},
+            },
+            {
+                "name": "date_end",
+                "parameterType": {"type": "DATE"},
+                "parameterValue": {"value": date_end_str},
+            },
+        ]
+
+    def _insert_job(
         self,
         sql_query: str,
         project_id: str,
-        date_start: Optional[date] = None,
-        date_end: Optional[date] = None,
-    ) -> List[MeasurementTuple]:
-        date_start_str = date_start.strftime("%Y-%m-%d") if date_start else None
-        date_end_str = date_end.strftime("%Y-%m-%d") if date_end else None
-        data = self._parse_response(
+        query_parameters: List[Dict],
+        dry_run: bool = False,
+    ) -> Dict:
+        # See https://cloud.google.com/bigquery/docs/reference/rest/v2/jobs/insert
+        return self._parse_response(
             self.session.post(
-                f"https://bigquery.googleapis.com/bigquery/v2/projects/{project_id}/queries",
+                f"https://bigquery.googleapis.com/bigquery/v2/projects/{project_id}/jobs",
                 json={
-                    "query": sql_query,
-                    "useLegacySql": False,
-                    "parameterMode": "NAMED",
-                    "queryParameters": [
-                        {
-                            "name": "date_start",
-                            "parameterType": {"type": "DATE"},
-                            "parameterValue": {"value": date_start_str},
-                        },
-                        {
-                            "name": "date_end",
-                            "parameterType": {"type": "DATE"},
-                            "parameterValue": {"value": date_end_str},
+                    "configuration": {
+                        "dryRun": dry_run,
+                        "query": {
+                            "query": sql_query,
+                            "useLegacySql": False,
+                            "parameterMode": "NAMED",
+                            "queryParameters": query_parameters,
                         },
-                    ],
+                    }
                 },
             )
         )
-        fields = data["schema"]["fields"]
-        rows = (
-            {fields[i]["name"]: f["v"] for i, f in enumerate(row["f"])}
-            for row in data.get("rows", [])
+
+    def _get_query_results(
+        self, project_id: str, job_reference: Dict, page_token: Optional[str] = None
+    ) -> Dict:
+        # See https://cloud.google.com/bigquery/docs/reference/rest/v2/jobs/getQueryResults
+        params = {
+            "location": job_reference.get("location"),
+            "maxResults": PAGE_SIZE,
+            # The request waits for the job to complete for that long
+            "timeoutMs": POLL_TIMEOUT_MS,
+        }
+        if page_token:
+            params["pageToken"] = page_token
+        return self._parse_response(
+            self.session.get(
+                f"https://bigquery.googleapis.com/bigquery/v2/projects/{project_id}/queries/{job_reference['jobId']}",
+                params=params,
+            )
         )
-        return [
-            MeasurementTuple(date=_date_getter(row), value=_value_getter(row))
-            for row in rows
+
+    def _cancel_job(self, project_id: str, job_reference: Dict) -> None:
+        # See https://cloud.google.com/bigquery/docs/reference/rest/v2/jobs/cancel
+        try:
+            self._parse_response(
+                self.session.post(
+                    f"https://bigquery.googleapis.com/bigquery/v2/projects/{project_id}/jobs/{job_reference['jobId']}/cancel",
+                    params={"location": job_reference.get("location")},
+                )
+            )
+        except (requests.RequestException, UserFixableError):
+            # The job keeps running, but its results are never read
+            logger.warning("Could not cancel BigQuery job", exc_info=True)
+
+    def estimate_bytes_processed(
+        self, sql_query: str, project_id: str, query_parameters: List[Dict]
+    ) -> int:
+        """Bytes processed by the query, according to a dry run.
+        Estimates are cached per query template."""
+        cache_key = _estimate_cache_key(project_id, sql_query)
+        try:
+            cached = cast(Optional[bytes], get_redis_client().get(cache_key))
+        except redis.RedisError:
+            logger.warning("Estimate cache unavailable", exc_info=True)
+            cached = None
+        if cached is not None:
+            return int(cached)
+        job = self._insert_job(sql_query, project_id, query_parameters, dry_run=True)
+        estimate = int(job["statistics"]["totalBytesProcessed"])
+        try:
+            get_redis_client().set(cache_key, estimate, ex=ESTIMATE_CACHE_TTL)
+        except redis.RedisError:
+            logger.warning("Estimate cache unavailable", exc_info=True)
+        return estimate
+
+    def _query(
+        self,
+        sql_query: str,
+        project_id: str,
+        date_start: Optional[date] = None,
+        date_end: Optional[date] = None,
+    ) -> Iterator[MeasurementTuple]:
+        query_parameters = self._query_parameters(date_start, date_end)
+        if BIGQUERY_DRY_RUN:
+            estimate = self.estimate_bytes_processed(
+                sql_query, project_id, query_parameters
+            )
+            logger.info(f"Query of project {project_id} processes {estimate} bytes")
+            if BIGQUERY_MAX_BYTES_PROCESSED and estimate > BIGQUERY_MAX_BYTES_PROCESSED:
+                raise UserFixableError(
+                    f"The query would process {estimate} bytes, which is more than the allowed {BIGQUERY_MAX_BYTES_PROCESSED} bytes."
+                )
+
+        # Jobs are polled (with backoff) rather than waited for in a single
+        # request, which would time out for long queries
+        job_reference = self._insert_job(sql_query, project_id, query_parameters)[
+            "jobReference"
         ]
+        deadline = time.monotonic() + POLL_MAX_DURATION
+        delay = POLL_INITIAL_DELAY
+        while True:
+            first_page = self._get_query_results(project_id, job_reference)
+            if first_page["jobComplete"]:
+                break
+            if time.monotonic() + delay > deadline:
+                # Don't keep paying for a query whose results won't be read
+                self._cancel_job(project_id, job_reference)
+                raise UserFixableError(
+                    f"The query did not complete within {POLL_MAX_DURATION // 60} minutes."
+                )
+            time.sleep(delay)
+            delay = min(delay * 2, POLL_MAX_DELAY)
+
+        fields = first_page["schema"]["fields"]
+
+        def fetch_page(page_token: Optional[str]) -> Tuple[List[Dict], Optional[str]]:
+            if page_token is None:
+                data = first_page
+            else:
+                data = self._get_query_results(project_id, job_reference, page_token)
+            return data.get("rows", []), data.get("pageToken")
+
+        self.refresh_token_ahead()
+        # Rows are yielded as pages arrive, while the next page is fetched
+        for row in paginate(fetch_page, prefetch=True):
+            values = {fields[i]["name"]: f["v"] for i, f in enumerate(row["f"])}
+            yield MeasurementTuple(
+                date=_date_getter(values), value=_value_getter(values)
+            )
 
     def collect_latest(self) -> MeasurementTuple:
         sql_query_template = self.config["sql_query_template"]
@@ -130,14 +264,14 @@ class GoogleBigQuery(OAuth2Integration):
         if self.can_backfill():
             return self.collect_past(date.today() - timedelta(days=1))
         else:
-            return self._query(sql_query_template, project_id)[0]
+            return list(self._query(sql_query_template, project_id))[0]
 
     def collect_past(self, date: date) -> MeasurementTuple:
-        return self.collect_past_range(date_start=date, date_end=date)[0]
+        return list(self.collect_past_range(date_start=date, date_end=date))[0]
 
     def collect_past_range(
         self, date_start: date, date_end: date
-    ) -> List[MeasurementTuple]:
+    ) -> Iterator[MeasurementTuple]:
         assert self.can_backfill()
         sql_query_template = self.config["sql_query_template"]
         project_id = self.config["project_id"]
@@ -146,6 +280,11 @@ class GoogleBigQuery(OAuth2Integration):
         )
 
 
+def _estimate_cache_key(*parts: str) -> str:
+    key = json.dumps(parts)
+    return f"bigqueryestimate:{hashlib.sha256(key.encode('utf-8')).hexdigest()}"
+
+
 def _date_getter(row: dict) -> date:
     try:
         dt = datetime.strptime(row["date"], "%Y-%m-%d").date()
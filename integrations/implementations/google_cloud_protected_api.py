@@ -7,6 +7,7 @@ from typing import final
 import requests
 
 from ..base import MeasurementTuple, OAuth2Integration, UserFixableError
+from ..http import pooled_session
 from ..utils import get_secret
 
 
@@ -122,10 +123,11 @@ class GoogleSheets(OAuth2Integration):
                 raise
         id_token = response.json()["token"]
         # Query
-        response = requests.get(
-            self.config["URL"],
-            headers={"Authorization": f"Bearer {id_token}"},
-        )
+        with pooled_session() as session:
+            response = session.get(
+                self.config["URL"],
+                headers={"Authorization": f"Bearer {id_token}"},
+            )
         response.raise_for_status()
         # Assume CSV for now
         assert (
@@ -1,14 +1,21 @@
-from datetime import date
+import hashlib
+import json
+import logging
+from datetime import date, timedelta
 from io import StringIO
-from typing import Iterable, final
+from typing import Iterable, Optional, cast, final
 
 import numpy as np
 import pandas as pd
+import redis
 import requests
 
 from ..base import MeasurementTuple, OAuth2Integration
+from ..rate_limit import get_redis_client
 from ..utils import batch_range_per_month, get_secret
 
+logger = logging.getLogger(__name__)
+
 """
 https://support.google.com/googleplay/android-developer/answer/139628?hl=en-GB&co=GENIE.Platform%3DDesktop#zippy=%2Cinstall-related-statistics
 
@@ -20,6 +27,17 @@ METRICS = [
     "Active Device Installs",
 ]
 
+# Reports of a month can still be updated a few days after it ends
+REPORT_SETTLE_DAYS = 7
+# Cached reports are evicted when they haven't been read for that long
+REPORT_CACHE_TTL = 90 * 24 * 3600  # seconds
+
+
+def _report_cache_key(*parts: str) -> str:
+    # Keys can contain credentials: make sure they don't end up in Redis
+    key = json.dumps(parts)
+    return f"playstorereport:{hashlib.sha256(key.encode('utf-8')).hexdigest()}"
+
 
 @final
 class GooglePlayStore(OAuth2Integration):
@@ -32,6 +50,9 @@ class GooglePlayStore(OAuth2Integration):
     authorize_extras = {"access_type": "offline", "prompt": "consent"}
 
     description = "Extract installs are ratings for your Google Play app."
+    # Reports of the current month are revalidated. Those of closed months
+    # are cached by `_download_report` instead.
+    cache_responses = True
 
     # Use https://bhch.github.io/react-json-form/playground
     config_schema = {
@@ -86,10 +107,58 @@ class GooglePlayStore(OAuth2Integration):
             raise NotImplementedError(f"Unknown metric '{self.config['metric']}'")
         column = self.config["metric"]
 
+        next_month = (date_start.replace(day=1) + timedelta(days=32)).replace(day=1)
+        closed = next_month + timedelta(days=REPORT_SETTLE_DAYS) <= date.today()
+        content = self._download_report(bucket, obj, closed=closed)
+        if content is None:
+            # No data, simply return empty list
+            return []
+        # Only the requested column is parsed
+        df = pd.read_csv(
+            StringIO(content),
+            usecols=["Date", column],
+            parse_dates=["Date"],
+            index_col="Date",
+        )
+        if "Rating" in self.config["metric"]:
+            # Replace "0" by np.nan
+            df = df.replace(0, np.nan)
+        df_filtered = df[
+            (df.index >= date_start.isoformat()) & (df.index <= date_end.isoformat())
+        ].sort_index()
+        return (
+            MeasurementTuple(date=index.to_pydatetime().date(), value=value)  # type: ignore[attr-defined]
+            for index, value in df_filtered[column].items()
+        )
+
+    def _download_report(self, bucket: str, obj: str, closed: bool) -> Optional[str]:
+        """
+        Reports of closed months can't change anymore: they are cached by
+        content (bucket, object and generation), and aren't downloaded again.
+        The generation is looked up per credentials, so that access to the
+        bucket is still required to read a cached report.
+        """
+        namespace = self.response_cache_namespace()
+        index_key = None
+        if closed and namespace is not None:
+            index_key = _report_cache_key(namespace, bucket, obj)
+            try:
+                content = self._read_cached_report(index_key, bucket, obj)
+            except redis.RedisError:
+                # The cache should never prevent collection
+                logger.warning("Report cache unavailable", exc_info=True)
+                content = None
+            if content is not None:
+                return content
+
         request_url = (
             f"https://storage.googleapis.com/storage/v1/b/{bucket}/o/{obj}?alt=media"
         )
-        response = self.session.get(request_url)
+        response = self.session.get(
+            request_url,
+            # Don't store closed reports in the response cache as well
+            headers={"Cache-Control": "no-store"} if index_key is not None else None,
+        )
         try:
             response.raise_for_status()
         except requests.HTTPError as e:
@@ -102,21 +171,37 @@ class GooglePlayStore(OAuth2Integration):
                     ) from None
                 except requests.exceptions.InvalidJSONError:
                     raise e from None
-            if e.response and e.response.status_code == 404:
-                # No data, simply return empty list
-                return []
+            if e.response is not None and e.response.status_code == 404:
+                return None
             else:
                 raise
-        df = pd.read_csv(
-            StringIO(response.text), parse_dates=["Date"], index_col="Date"
-        )
-        if "Rating" in self.config["metric"]:
-            # Replace "0" by np.nan
-            df = df.replace(0, np.nan)
-        df_filtered = df[
-            (df.index >= date_start.isoformat()) & (df.index <= date_end.isoformat())
-        ].sort_index()
-        return (
-            MeasurementTuple(date=index.to_pydatetime().date(), value=value)  # type: ignore[attr-defined]
-            for index, value in df_filtered[column].items()
-        )
+        text = response.text
+
+        generation = response.headers.get("x-goog-generation")
+        if index_key is not None and generation:
+            content_key = _report_cache_key(bucket, obj, generation)
+            try:
+                pipeline = get_redis_client().pipeline()
+                pipeline.set(content_key, text.encode("utf-8"), ex=REPORT_CACHE_TTL)
+                pipeline.set(index_key, generation, ex=REPORT_CACHE_TTL)
+                pipeline.execute()
+            except redis.RedisError:
+                logger.warning("Report cache unavailable", exc_info=True)
+        return text
+
+    def _read_cached_report(
+        self, index_key: str, bucket: str, obj: str
+    ) -> Optional[str]:
+        client = get_redis_client()
+        generation = cast(Optional[bytes], client.get(index_key))
+        if generation is None:
+            return None
+        content_key = _report_cache_key(bucket, obj, generation.decode("utf-8"))
+        pipeline = client.pipeline()
+        pipeline.get(content_key)
+        pipeline.expire(content_key, REPORT_CACHE_TTL)
+        pipeline.expire(index_key, REPORT_CACHE_TTL)
+        content, _, _ = pipeline.execute()
+        if content is None:
+            return None
+        return content.decode("utf-8")
@@ -1,9 +1,10 @@
+import json
 import urllib.parse
 from datetime import date
-from typing import Dict, List, final
+from typing import Dict, List, Optional, cast, final
 
-from ..base import MeasurementTuple, OAuth2Integration
-from ..utils import get_secret
+from ..base import Integration, MeasurementTuple, OAuth2Integration
+from ..utils import get_secret, paginate_offset
 
 ROW_LIMIT = 10000  # Number of rows to fetch at a time
 
@@ -82,28 +83,21 @@ class GoogleSearchConsole(OAuth2Integration):
     def can_backfill(self):
         return True
 
-    def _paginated_query(
-        self, url, date_start: date, date_end: date, request_data: Dict, startRow=0
-    ):
-        response = self.session.post(
-            url, json={**request_data, "rowLimit": ROW_LIMIT, "startRow": startRow}
-        )
-        response.raise_for_status()
-        data = response.json()
-        rows: List = data["rows"]
-        if len(rows) < ROW_LIMIT:
-            return rows
-        else:
-            return rows + self._paginated_query(
-                url, date_start, date_end, request_data, startRow=startRow + len(rows)
+    def _paginated_query(self, url, request_data: Dict) -> List[Dict]:
+        def fetch_page(start_row: int) -> List[Dict]:
+            response = self.session.post(
+                url,
+                json={**request_data, "rowLimit": ROW_LIMIT, "startRow": start_row},
             )
+            response.raise_for_status()
+            return response.json()["rows"]
 
-    def collect_past_range(
-        self, date_start: date, date_end: date
-    ) -> List[MeasurementTuple]:
+        self.refresh_token_ahead()
+        return list(paginate_offset(fetch_page, page_size=ROW_LIMIT, prefetch=True))
+
+    def _query_rows(self, date_start: date, date_end: date) -> List[Dict]:
         # Parameters
         site_url = self.config["site_url"]
-        metric = self.config["metric"]
 
         request_data = {
             # dates must be given in PT time
@@ -118,8 +112,10 @@ class GoogleSearchConsole(OAuth2Integration):
         }
 
         request_url = f"https://www.googleapis.com/webmasters/v3/sites/{urllib.parse.quote_plus(site_url)}/searchAnalytics/query"
-        rows = self._paginated_query(request_url, date_start, date_end, request_data)
+        return self._paginated_query(request_url, request_data)
 
+    def _measurements(self, rows: List[Dict]) -> List[MeasurementTuple]:
+        metric = self.config["metric"]
         return [
             MeasurementTuple(
                 date=date.fromisoformat(row["keys"][0]),
@@ -132,3 +128,24 @@ class GoogleSearchConsole(OAuth2Integration):
             )
             for row in rows
         ]
+
+    def collect_past_range(
+        self, date_start: date, date_end: date
+    ) -> List[MeasurementTuple]:
+        return self._measurements(self._query_rows(date_start, date_end))
+
+    def batch_key(self) -> Optional[str]:
+        # All metrics are returned for each row
+        return json.dumps(
+            [self.config["site_url"], self.config["filters"]], sort_keys=True
+        )
+
+    @classmethod
+    def collect_past_range_batch(
+        cls, integrations: List[Integration], date_start: date, date_end: date
+    ) -> List[List[MeasurementTuple]]:
+        # Metrics share credentials: the first one queries for all
+        batch = cast(List[GoogleSearchConsole], integrations)
+        with batch[0]:
+            rows = batch[0]._query_rows(date_start, date_end)
+        return [integration._measurements(rows) for integration in batch]
@@ -1,10 +1,41 @@
+import hashlib
+import json
+import logging
 from datetime import date, datetime, timedelta
-from typing import Iterable, final
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    cast,
+    final,
+)
 
+import redis
 import requests
 
 from ..base import MeasurementTuple, OAuth2Integration, UserFixableError
-from ..utils import get_secret
+from ..rate_limit import RateLimit, get_redis_client
+from ..utils import env, get_secret
+
+logger = logging.getLogger(__name__)
+
+# Allows reading the modification time of spreadsheets
+DRIVE_METADATA_SCOPE = "https://www.googleapis.com/auth/drive.metadata.readonly"
+# Cache the columns of sheets until they're modified. This requests the
+# (restricted) Drive metadata scope to new grants, which requires the app's
+# OAuth verification to cover it.
+GOOGLE_SHEETS_CACHE_COLUMNS = env.bool("GOOGLE_SHEETS_CACHE_COLUMNS", default=False)
+RENDER_PARAMS = {
+    # See https://developers.google.com/sheets/api/reference/rest/v4/DateTimeRenderOption
+    "dateTimeRenderOption": "SERIAL_NUMBER",
+    "valueRenderOption": "UNFORMATTED_VALUE",
+}
+# Cached columns of sheets that aren't modified anymore are evicted after that long
+SHEET_CACHE_TTL = 30 * 24 * 3600  # seconds
 
 
 @final
@@ -14,10 +45,22 @@ class GoogleSheets(OAuth2Integration):
     authorization_url = "https://accounts.google.com/o/oauth2/v2/auth"
     token_url = "https://oauth2.googleapis.com/token"
     refresh_url = "https://oauth2.googleapis.com/token"
-    scopes = ["https://www.googleapis.com/auth/spreadsheets.readonly"]
+    scopes = ["https://www.googleapis.com/auth/spreadsheets.readonly"] + (
+        [DRIVE_METADATA_SCOPE] if GOOGLE_SHEETS_CACHE_COLUMNS else []
+    )
     authorize_extras = {"access_type": "offline", "prompt": "consent"}
 
     description = "Import any data from a Google Sheet."
+    # Read requests per minute per user
+    # See https://developers.google.com/sheets/api/limits
+    rate_limit = RateLimit(60, 60)
+    # Sheets rarely change between collections
+    cache_responses = True
+    # The whole sheet is read for any range: don't shard backfills
+    backfill_shard_days = 100 * 365
+
+    def rate_limit_key(self):
+        return self.session.access_token
 
     config_schema = {
         "type": "dict",
@@ -66,33 +109,8 @@ class GoogleSheets(OAuth2Integration):
         days = int(xldate)
         return (epoch + timedelta(days, 0, 0, 0)).date()
 
-    def collect_latest(self) -> MeasurementTuple:
-        results = self.collect_past_range(
-            date_start=date.min,
-            date_end=date.today() - timedelta(days=1),
-        )
-        if not results:
-            raise UserFixableError("No matching rows were found")
-        return list(results)[-1]
-
-    def collect_past_range(
-        self, date_start: date, date_end: date
-    ) -> Iterable[MeasurementTuple]:
-        # Parameters
-        spreadsheet_id = self.config["spreadsheet_id"]
-        sheet_range = self.config["sheet_range"]
-        date_column = self.config["date_column"]
-        value_column = self.config["value_column"]
-        filters = self.config["filters"]
-
-        params = {
-            # See https://developers.google.com/sheets/api/reference/rest/v4/DateTimeRenderOption
-            "dateTimeRenderOption": "SERIAL_NUMBER",
-            "valueRenderOption": "UNFORMATTED_VALUE",
-        }
-
-        request_url = f"https://sheets.googleapis.com/v4/spreadsheets/{spreadsheet_id}/values/{sheet_range}"
-        response = self.session.get(request_url, params=params)
+    def _get(self, url: str, params=None) -> Dict:
+        response = self.session.get(url, params=params)
         try:
             response.raise_for_status()
         except requests.HTTPError as e:
@@ -104,36 +122,109 @@ class GoogleSheets(OAuth2Integration):
                 ) from None
             else:
                 raise
-        data = response.json()["values"]
-        header = data[0]
-        data = data[1:]
+        return response.json()
 
-        def get_cell(row: dict, column_name: str) -> str:
-            if not column_name in header:
-                raise UserFixableError(
-                    f"Column '{column_name}' wasn't found in the header (should be one of {header})."
-                )
+    def _sheet_version(self) -> Optional[str]:
+        """Last modification time of the spreadsheet, if the grant allows reading it"""
+        if not GOOGLE_SHEETS_CACHE_COLUMNS:
+            return None
+        if DRIVE_METADATA_SCOPE not in self.session.token.get("scope", []):
+            # Grants obtained before this scope was requested
+            return None
+        spreadsheet_id = self.config["spreadsheet_id"]
+        data = self._get(
+            f"https://www.googleapis.com/drive/v3/files/{spreadsheet_id}",
+            params={"fields": "modifiedTime", "supportsAllDrives": "true"},
+        )
+        return data["modifiedTime"]
+
+    def _read_columns(self, column_names: List[str]) -> List[List[str]]:
+        """Returns the cells of the given columns (header excluded), as strings.
+        With GOOGLE_SHEETS_CACHE_COLUMNS, columns are cached until the
+        spreadsheet is modified."""
+        spreadsheet_id = self.config["spreadsheet_id"]
+        sheet_range = self.config["sheet_range"]
+        version = self._sheet_version()
+        cache_key = None
+        if version is not None:
+            cache_key = _sheet_cache_key(
+                self.response_cache_namespace() or "",
+                spreadsheet_id,
+                sheet_range,
+                json.dumps(column_names),
+                version,
+            )
             try:
-                # Cast to str is required dict value can be float, str...
-                # This ensures we always return the same type.
-                return str(row[header.index(column_name)])
-            except IndexError:
-                # This can happen if a row only has the first column but rest is empty values:
-                # the row vector will be shorter. We simply mark this as empty.
-                return ""
-
-        def try_convert_cell_to_float(cell_value: str) -> float:
-            if cell_value == "":
-                return float("nan")
-            if cell_value.startswith("#N/A"):
-                return float("nan")
-            return float(cell_value)
-
-        # Parse data
-        for row_index, row in enumerate(data):
-            if not all([get_cell(row, f["column"]) == f["value"] for f in filters]):
+                cached = cast(Optional[bytes], get_redis_client().get(cache_key))
+            except redis.RedisError:
+                # The cache should never prevent collection
+                logger.warning("Sheet cache unavailable", exc_info=True)
+                cached = None
+            if cached is not None:
+                return json.loads(cached)
+
+        base_url = f"https://sheets.googleapis.com/v4/spreadsheets/{spreadsheet_id}"
+        if "!" in sheet_range:
+            # An explicit range is read at once (in a single request), and
+            # columns are extracted
+            data = self._get(f"{base_url}/values/{sheet_range}", params=RENDER_PARAMS)
+            rows = data.get("values", [])
+            header, rows = (rows[0], rows[1:]) if rows else ([], [])
+            indices = _column_indices(header, column_names)
+            columns = [[_cell(row, index) for row in rows] for index in indices]
+        else:
+            # Only the header, and then the required columns, are read
+            sheet = "'" + sheet_range.replace("'", "''") + "'"
+            data = self._get(f"{base_url}/values/{sheet}!1:1", params=RENDER_PARAMS)
+            header = (data.get("values") or [[]])[0]
+            indices = _column_indices(header, column_names)
+            data = self._get(
+                f"{base_url}/values:batchGet",
+                params={
+                    **RENDER_PARAMS,
+                    "majorDimension": "COLUMNS",
+                    "ranges": [
+                        f"{sheet}!{_column_letter(index)}2:{_column_letter(index)}"
+                        for index in indices
+                    ],
+                },
+            )
+            columns = [
+                [str(cell) for cell in (value_range.get("values") or [[]])[0]]
+                for value_range in data["valueRanges"]
+            ]
+            # Trailing empty cells are omitted
+            row_count = max(len(column) for column in columns)
+            columns = [column + [""] * (row_count - len(column)) for column in columns]
+
+        if cache_key is not None:
+            try:
+                get_redis_client().set(
+                    cache_key, json.dumps(columns), ex=SHEET_CACHE_TTL
+                )
+            except redis.RedisError:
+                logger.warning("Sheet cache unavailable", exc_info=True)
+        return columns
+
+    def _iter_rows(
+        self, reverse: bool = False
+    ) -> Iterator[Tuple[int, date, Callable[[], float]]]:
+        """Yields the row index, date and value getter of rows matching the filters"""
+        date_column = self.config["date_column"]
+        value_column = self.config["value_column"]
+        filters = self.config["filters"]
+        filter_columns = [f["column"] for f in filters]
+        column_names = list(dict.fromkeys([date_column, value_column, *filter_columns]))
+        columns = dict(zip(column_names, self._read_columns(column_names)))
+        dates, values = columns[date_column], columns[value_column]
+
+        row_indices = range(len(dates))
+        for row_index in reversed(row_indices) if reverse else row_indices:
+            if not all(
+                [columns[f["column"]][row_index] == f["value"] for f in filters]
+            ):
                 continue
-            date_cell = get_cell(row, date_column)
+            date_cell = dates[row_index]
             if date_cell == "":
                 # Silently ignore if the date is empty
                 continue
@@ -143,13 +234,76 @@ class GoogleSheets(OAuth2Integration):
                 raise UserFixableError(
                     f'Could not convert cell value "{date_cell}" to date at row {row_index + 1}.'
                 ) from e
+
+            def get_value(row_index=row_index) -> float:
+                value_cell = values[row_index]
+                try:
+                    return try_convert_cell_to_float(value_cell)
+                except ValueError as e:
+                    raise UserFixableError(
+                        f'Could not convert cell value "{value_cell}" to number at row {row_index + 1}'
+                    ) from e
+
+            yield row_index, dt, get_value
+
+    def collect_latest(self) -> MeasurementTuple:
+        # The sheet is scanned from its end, until the last matching row
+        yesterday = date.today() - timedelta(days=1)
+        for _, dt, get_value in self._iter_rows(reverse=True):
+            if dt <= yesterday:
+                return MeasurementTuple(date=dt, value=get_value())
+        raise UserFixableError("No matching rows were found")
+
+    def collect_past_range(
+        self, date_start: date, date_end: date
+    ) -> Iterable[MeasurementTuple]:
+        for _, dt, get_value in self._iter_rows():
             if not (dt >= date_start and dt <= date_end):
                 continue
-            value_cell = get_cell(row, value_column)
-            try:
-                value = try_convert_cell_to_float(value_cell)
-            except ValueError as e:
-                raise UserFixableError(
-                    f'Could not convert cell value "{value_cell}" to number at row {row_index + 1}'
-                ) from e
-            yield MeasurementTuple(date=dt, value=value)
+            yield MeasurementTuple(date=dt, value=get_value())
+
+
+def _column_indices(header: List, column_names: List[str]) -> List[int]:
+    indices = []
+    for column_name in column_names:
+        if not column_name in header:
+            raise UserFixableError(
+                f"Column '{column_name}' wasn't found in the header (should be one of {header})."
+            )
+        indices.append(header.index(column_name))
+    return indices
+
+
+def _column_letter(index: int) -> str:
+    # 0 -> A, 25 -> Z, 26 -> AA..
+    letters = ""
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord("A") + remainder) + letters
+    return letters
+
+
+def _cell(row: List, index: int) -> str:
+    try:
+        # Cast to str is required dict value can be float, str...
+        # This ensures we always return the same type.
+        return str(row[index])
+    except IndexError:
+        # This can happen if a row only has the first column but rest is empty values:
+        # the row vector will be shorter. We simply mark this as empty.
+        return ""
+
+
+def try_convert_cell_to_float(cell_value: str) -> float:
+    if cell_value == "":
+        return float("nan")
+    if cell_value.startswith("#N/A"):
+        return float("nan")
+    return float(cell_value)
+
+
+def _sheet_cache_key(*parts: str) -> str:
+    # Keys can contain credentials: make sure they don't end up in Redis
+    key = json.dumps(parts)
+    return f"sheetcolumns:{hashlib.sha256(key.encode('utf-8')).hexdigest()}"
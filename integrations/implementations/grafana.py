@@ -49,6 +49,7 @@ class Grafana(Integration):
         ), "Configuration is required in order to run this integration"
         self.r = requests.Session()
         self.r.headers.update({"Authorization": f"Bearer {self.config['api_key']}"})
+        self.mount_adapters(self.r)
         return self
 
     def can_backfill(self):
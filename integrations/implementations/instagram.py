@@ -1,13 +1,14 @@
 from datetime import date, timedelta
-from typing import Iterable, final
+from typing import Iterable, List, Optional, cast, final
 
 import requests
 from oauthlib.oauth2 import InvalidGrantError
 
-from integrations.base import MeasurementTuple, OAuth2Integration
+from integrations.base import Integration, MeasurementTuple, OAuth2Integration
+from integrations.rate_limit import RateLimit
 from integrations.utils import get_secret
 
-from .facebook import collect_insights_for_account
+from .facebook import InsightsQuery, collect_insights, pace_graph_usage
 
 
 @final
@@ -27,11 +28,23 @@ class Instagram(OAuth2Integration):
     }
 
     description = "Collect metrics such as followers, impressions and reach from your Instagram account."
+    # See https://developers.facebook.com/docs/graph-api/overview/rate-limiting/
+    rate_limit = RateLimit(200, 3600)
 
     # Only the last two years of insights data is available.
     def earliest_backfill(self) -> date:
         return date.today() - timedelta(days=365 * 2)
 
+    def __enter__(self):
+        super().__enter__()
+        if pace_graph_usage not in self.session.hooks["response"]:
+            self.session.hooks["response"].append(pace_graph_usage)
+        return self
+
+    def rate_limit_key(self):
+        # Limits apply per user access token
+        return self.session.access_token
+
     def can_backfill(self):
         return self.config["metric"] != "followers_count"
 
@@ -116,12 +129,35 @@ class Instagram(OAuth2Integration):
     def collect_past_range(
         self, date_start: date, date_end: date
     ) -> Iterable[MeasurementTuple]:
-        yield from collect_insights_for_account(
-            session=self.session,
-            access_token_override=None,
-            account_id=self.config["account_id"],
-            metric=self.config["metric"],
+        return self._collect_insights([self], date_start, date_end)[0]
+
+    def _collect_insights(
+        self, integrations: List["Instagram"], date_start: date, date_end: date
+    ) -> List[List[MeasurementTuple]]:
+        return collect_insights(
+            self.session,
+            [
+                InsightsQuery(
+                    account_id=i.config["account_id"],
+                    metric=i.config["metric"],
+                    access_token=None,
+                    date_start=date_start,
+                    date_end=date_end,
+                )
+                for i in integrations
+            ],
             max_days=30,
-            date_start=date_start,
-            date_end=date_end,
         )
+
+    def batch_key(self) -> Optional[str]:
+        # Calls for all accounts and metrics sharing a token go in the same batches
+        return "" if self.can_backfill() else None
+
+    @classmethod
+    def collect_past_range_batch(
+        cls, integrations: List[Integration], date_start: date, date_end: date
+    ) -> List[List[MeasurementTuple]]:
+        # Metrics share credentials: the first one queries for all
+        batch = cast(List[Instagram], integrations)
+        with batch[0]:
+            return batch[0]._collect_insights(batch, date_start, date_end)
@@ -1,13 +1,14 @@
 import time
 from datetime import date, timedelta
-from typing import Any, Dict, Iterable, List, final
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, final
 
 import requests
 
 from ..base import MeasurementTuple, OAuth2Integration, UserFixableError
-from ..utils import batch_range_by_max_batch, get_secret
+from ..utils import batch_range_by_max_batch, get_secret, paginate
 
 ELEMENTS_PER_CALL = 10000
+MAX_QUERIES = 10
 LINKEDIN_VERSION_HEADER = "202509"
 
 METRICS: List[Dict[str, Any]] = [
@@ -143,9 +144,9 @@ class LinkedIn(OAuth2Integration):
         }
         return self
 
-    def _paginated_query(self, url, request_params, start=0) -> Iterable[Dict]:
-        queries = 0
-        while True:
+    def _paginated_query(self, url, request_params) -> Iterator[Dict]:
+        def fetch_page(start: Optional[int]) -> Tuple[List[Dict], Optional[int]]:
+            assert start is not None
             # Make request
             r = self.session.get(
                 url,
@@ -169,19 +170,17 @@ class LinkedIn(OAuth2Integration):
             assert (
                 len(elements) <= count
             ), "More elements returned than requested. Does this API support pagination?"
-            # Request done
-            queries += 1
-            for element in elements:
-                yield element
             # You have reached the end of the dataset when your response contains fewer
             # elements in the entities block of the response than your count parameter request.
             if len(elements) < count:
                 # Done
-                return
-            if queries > 10:
+                return elements, None
+            if start // count + 1 > MAX_QUERIES:
                 raise Exception(f"Too many interations")
             # Prepare next iteration
-            start += count
+            return elements, start + count
+
+        return paginate(fetch_page, first=0)
 
     def collect_past_range(
         self, date_start: date, date_end: date
@@ -1,10 +1,10 @@
 import time
 from datetime import date, timedelta
-from typing import List, Optional, final
+from typing import Dict, Iterator, List, Optional, cast, final
 
 from oauthlib.oauth2 import InvalidGrantError
 
-from ..base import MeasurementTuple, OAuth2Integration
+from ..base import Integration, MeasurementTuple, OAuth2Integration
 from ..utils import get_secret
 
 METRICS = sorted(
@@ -31,6 +31,13 @@ METRICS = sorted(
     ],
     key=lambda o: o["title"],
 )
+# Maximum number of rows per page
+ACTIVITY_MAX_COUNT = 1000
+# Only the fields of activity metrics are returned
+ACTIVITY_FIELDS = ",".join(
+    ["activity.day"]
+    + [f"activity.{m['value']}" for m in METRICS if m["endpoint"] == "list-activity"]
+)
 
 
 @final
@@ -134,39 +141,72 @@ class Mailchimp(OAuth2Integration):
         obj = response.json()
         return MeasurementTuple(date=date.today(), value=obj["stats"][metric_key])
 
-    def collect_past_range(
-        self, date_start: date, date_end: date
-    ) -> List[MeasurementTuple]:
+    def _activity(self, date_start: date, date_end: date) -> List[Dict]:
+        """Daily list activity of the range, in chronological order"""
         list_id = self.config["list"]
-        metric_key = self.config["statistic"]
-        metric = next(m for m in METRICS if m["value"] == metric_key)
-        assert metric["endpoint"] == "list-activity"
-        # Note: the endpoint doesn't support query by date. It can
-        # paginate through the last 180 days though.
-        batch_size = 100
-        offset = 0
-        measurements: List[MeasurementTuple] = []
+        # Note: the endpoint doesn't support query by date. It returns a row
+        # per day for the last 180 days though, starting with today: the
+        # range can be seeked to directly.
+        offset = max(0, (date.today() - date_end).days - 1)
+        count = min(ACTIVITY_MAX_COUNT, (date_end - date_start).days + 3)
+        seeking = True
+        rows: List[Dict] = []
         while True:
             response = self.session.get(
-                f"{self.api_endpoint}/3.0/lists/{list_id}/activity?count={batch_size}&offset={offset}"
+                f"{self.api_endpoint}/3.0/lists/{list_id}/activity",
+                params={"count": count, "offset": offset, "fields": ACTIVITY_FIELDS},
             )
             response.raise_for_status()
-            obj = response.json()
-            measurements += sorted(
-                [
-                    MeasurementTuple(
-                        date=self._parse_date(o["day"]), value=o[metric_key]
-                    )
-                    for o in obj["activity"]
-                ],
-                key=lambda m: m.date,
-                reverse=True,
-            )
+            activity = response.json()["activity"]
+            if not activity:
+                break
+            newest = self._parse_date(activity[0]["day"])
+            if seeking and offset > 0 and newest < date_end:
+                # Some days are missing: seek back
+                offset = max(0, offset - max(count, (date_end - newest).days))
+                continue
+            seeking = False
+            rows += [
+                o
+                for o in activity
+                if date_start <= self._parse_date(o["day"]) <= date_end
+            ]
             # Check if we need to go back further
-            if obj["activity"] and measurements[-1].date > date_start:
-                # We must go further
-                offset += len(obj["activity"])
-            else:
+            if self._parse_date(activity[-1]["day"]) <= date_start:
                 break
+            offset += len(activity)
+        return sorted(rows, key=lambda o: o["day"])
 
-        return [m for m in measurements if m.date >= date_start and m.date <= date_end]
+    def collect_past_range(
+        self, date_start: date, date_end: date
+    ) -> Iterator[MeasurementTuple]:
+        metric_key = self.config["statistic"]
+        metric = next(m for m in METRICS if m["value"] == metric_key)
+        assert metric["endpoint"] == "list-activity"
+        return (
+            MeasurementTuple(date=self._parse_date(o["day"]), value=o[metric_key])
+            for o in self._activity(date_start, date_end)
+        )
+
+    def batch_key(self) -> Optional[str]:
+        # Activity metrics of a list come from the same rows
+        return self.config["list"] if self.can_backfill() else None
+
+    @classmethod
+    def collect_past_range_batch(
+        cls, integrations: List[Integration], date_start: date, date_end: date
+    ) -> List[List[MeasurementTuple]]:
+        # Metrics share credentials: the first one queries for all
+        batch = cast(List[Mailchimp], integrations)
+        with batch[0]:
+            rows = batch[0]._activity(date_start, date_end)
+        return [
+            [
+                MeasurementTuple(
+                    date=integration._parse_date(o["day"]),
+                    value=o[integration.config["statistic"]],
+                )
+                for o in rows
+            ]
+            for integration in batch
+        ]
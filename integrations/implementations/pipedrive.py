@@ -1,10 +1,13 @@
 from datetime import date
-from typing import final
+from typing import Dict, Iterator, List, Optional, Tuple, final
 
 from ..base import MeasurementTuple, OAuth2Integration
-from ..utils import get_secret
+from ..rate_limit import RateLimit
+from ..utils import get_secret, paginate
 
 BASE_URL = "https://api.pipedrive.com/api/v1"
+# Maximum number of items per page
+PAGE_LIMIT = 500
 
 
 @final
@@ -17,6 +20,12 @@ class Pipedrive(OAuth2Integration):
     scopes = ["base", "deals:read"]
 
     description = "Pipedrive deals by pipeline, status or stage."
+    # Burst limit per token (lowest plan)
+    # See https://pipedrive.readme.io/docs/core-api-concepts-rate-limiting
+    rate_limit = RateLimit(80, 2)
+
+    def rate_limit_key(self):
+        return self.session.access_token
 
     def callable_config_schema(self):
         # Get all pipelines
@@ -95,44 +104,64 @@ class Pipedrive(OAuth2Integration):
     def can_backfill(self):
         return False
 
-    def _paginated_request(self, url, params, start=0):
-        response = self.session.get(url, params={**params, "start": start})
-        response.raise_for_status()
-        obj = response.json()
-        data = obj["data"] or []
-        pagination = obj["additional_data"]["pagination"]
-        if pagination["more_items_in_collection"]:
-            return data + self._paginated_request(
-                url, params, start=pagination["next_start"]
+    def _paginated_request(self, url, params) -> Iterator[Dict]:
+        def fetch_page(start: Optional[int]) -> Tuple[List[Dict], Optional[int]]:
+            response = self.session.get(
+                url, params={**params, "start": start, "limit": PAGE_LIMIT}
             )
-        return data
+            response.raise_for_status()
+            obj = response.json()
+            pagination = obj["additional_data"]["pagination"]
+            if not pagination["more_items_in_collection"]:
+                return obj["data"] or [], None
+            return obj["data"] or [], pagination["next_start"]
 
-    def collect_latest(self) -> MeasurementTuple:
-        # Parameters
-        metric = self.config["metric"]
-        pipeline = self.config["pipeline"]
-        stage = self.config["stage"]
-        status = self.config["status"]
+        return paginate(fetch_page, first=0)
 
+    def _get(self, url, params=None) -> Dict:
+        response = self.session.get(url, params=params)
+        response.raise_for_status()
+        return response.json()["data"]
+
+    def _count_deals(self, pipeline: str, stage: str, status: str) -> int:
         # Documentation:
         # https://developers.pipedrive.com/docs/api/v1/Deals#getDeals
-        url = f"{BASE_URL}/deals"
+        # https://developers.pipedrive.com/docs/api/v1/Deals#getDealsSummary
         params = {
             "status": status,
         }
         if stage != "<any>":
             params["stage_id"] = stage
-        data = self._paginated_request(url, params)
+            if pipeline != "<any>":
+                # The stage determines the pipeline
+                stage_pipeline = self._get(f"{BASE_URL}/stages/{stage}")["pipeline_id"]
+                if stage_pipeline != int(pipeline):
+                    return 0
+                pipeline = "<any>"
+        if pipeline == "<any>":
+            # All filters are applied by the API, which only returns totals.
+            # Summaries include all deals that aren't deleted by default.
+            if status == "all_not_deleted":
+                del params["status"]
+            return self._get(f"{BASE_URL}/deals/summary", params=params)["total_count"]
 
-        def keep_deal(deal):
-            if pipeline != "<any>" and deal["pipeline_id"] != int(pipeline):
-                return False
-            return True
+        # Deals can't be filtered by pipeline along with status: they are
+        # streamed and counted without being kept
+        return sum(
+            1
+            for deal in self._paginated_request(f"{BASE_URL}/deals", params)
+            if deal["pipeline_id"] == int(pipeline)
+        )
 
-        deals = [d for d in data if keep_deal(d)]
+    def collect_latest(self) -> MeasurementTuple:
+        # Parameters
+        metric = self.config["metric"]
+        pipeline = self.config["pipeline"]
+        stage = self.config["stage"]
+        status = self.config["status"]
 
         if metric == "count":
-            value = len(deals)
+            value = self._count_deals(pipeline, stage, status)
         else:
             raise NotImplementedError(f"Unknown metric {metric}")
         return MeasurementTuple(
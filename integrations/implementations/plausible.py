@@ -1,9 +1,14 @@
 from datetime import date
-from typing import List, final
+from typing import Iterable, List, final
 
 import requests
 
 from ..base import Integration, MeasurementTuple
+from ..rate_limit import RateLimit
+from ..utils import batch_range_by_max_batch, fill_mesurement_range
+
+# Maximum number of days returned by a timeseries request
+TIMESERIES_MAX_DAYS = 180
 
 
 @final
@@ -50,6 +55,10 @@ class Plausible(Integration):
         "Daily visitors, pageviews, visits or events for your Plausible website."
     )
     protected_field_paths = [["api_key"]]
+    # See https://plausible.io/docs/stats-api#rate-limiting
+    rate_limit = RateLimit(600, 3600)
+    # Rolling periods are collected one request per day: collect several days at once
+    collect_past_concurrency = 4
 
     def __enter__(self):
         assert (
@@ -57,8 +66,12 @@ class Plausible(Integration):
         ), "Configuration is required in order to run this integration"
         self.r = requests.Session()
         self.r.headers.update({"Authorization": f"Bearer {self.config['api_key']}"})
+        self.mount_adapters(self.r)
         return self
 
+    def rate_limit_key(self):
+        return self.config["api_key"]
+
     def can_backfill(self):
         return True
 
@@ -83,3 +96,52 @@ class Plausible(Integration):
         data = response.json()
         visitor_count = int(data["results"][metric]["value"])
         return MeasurementTuple(date=date, value=visitor_count)
+
+    def collect_past_range(
+        self, date_start: date, date_end: date
+    ) -> Iterable[MeasurementTuple]:
+        # Rolling periods (e.g. unique visitors of the last 7 days) can't be
+        # derived from daily values
+        if self.config.get("aggregation_period", "day") != "day":
+            return super().collect_past_range(date_start, date_end)
+        return batch_range_by_max_batch(
+            date_start=date_start,
+            date_end=date_end,
+            max_days=TIMESERIES_MAX_DAYS,
+            callable=self._collect_timeseries,
+        )
+
+    def _collect_timeseries(
+        self, date_start: date, date_end: date
+    ) -> List[MeasurementTuple]:
+        site_id = self.config["site_id"]
+        metric = self.config["metric"]
+        filters: List[str] = self.config["filters"]
+
+        # See https://plausible.io/docs/stats-api#get-apiv1statstimeseries
+        params = {
+            "site_id": site_id,
+            "period": "custom",
+            # Plausible uses timezones defined in the plausible site config
+            "date": f"{date_start.strftime('%Y-%m-%d')},{date_end.strftime('%Y-%m-%d')}",
+            "interval": "date",
+            "metrics": metric,
+            "with_imported": "true",
+        }
+        if filters:
+            # See https://plausible.io/docs/stats-api#filtering
+            params["filters"] = ";".join(filters)
+        response = self.r.get(
+            "https://plausible.io/api/v1/stats/timeseries", params=params
+        )
+        response.raise_for_status()
+        data = response.json()
+        measurements = [
+            MeasurementTuple(
+                date=date.fromisoformat(result["date"]),
+                # Like the aggregate endpoint, days without visits count as 0
+                value=int(result[metric] or 0),
+            )
+            for result in data["results"]
+        ]
+        return fill_mesurement_range(measurements, date_start, date_end)
@@ -1,11 +1,103 @@
+import json
+import os
+import re
+import threading
+import time
+import uuid
 from datetime import date, datetime, timedelta
 from decimal import Decimal
-from typing import List, final
+from typing import Dict, Iterator, List, Optional, Set, Tuple, final
 
 import psycopg2
+from psycopg2.extensions import connection, cursor
 from psycopg2.extras import RealDictCursor, RealDictRow
 
 from ..base import Integration, MeasurementTuple, UserFixableError
+from ..utils import env
+
+# Number of idle connections kept per database, per worker process
+POSTGRESQL_POOL_MAXCONN = env.int("POSTGRESQL_POOL_MAXCONN", default=2)
+# Idle connections are closed after that long (in seconds), instead of being
+# reused
+POSTGRESQL_POOL_MAX_IDLE = env.int("POSTGRESQL_POOL_MAX_IDLE", default=10 * 60)
+# Number of rows fetched at once from server-side cursors
+CURSOR_ITERSIZE = 2000
+# Queries running for longer are cancelled (0 disables the timeout)
+POSTGRESQL_STATEMENT_TIMEOUT = env.int("POSTGRESQL_STATEMENT_TIMEOUT", default=300)
+# Server-side cursors can only run a single SELECT (or VALUES) statement
+SINGLE_SELECT_RE = re.compile(
+    r"^\s*(?:SELECT|WITH|VALUES|\()[^;]*;?\s*$", re.IGNORECASE | re.DOTALL
+)
+
+
+class ConnectionPool:
+    """Keeps connections to a database open after use, for later collections"""
+
+    def __init__(self, database_connection: Dict):
+        self.database_connection = database_connection
+        # Idle connections, along with the time they were put back
+        self.idle: List[Tuple[connection, float]] = []
+        self.lock = threading.Lock()
+
+    def getconn(self) -> connection:
+        self.close_stale()
+        with self.lock:
+            while self.idle:
+                conn, _ = self.idle.pop()
+                if not conn.closed:
+                    return conn
+        return psycopg2.connect(**self.database_connection, connect_timeout=15)
+
+    def putconn(self, conn: connection, close: bool = False) -> None:
+        if not close and not conn.closed:
+            try:
+                # Pending transactions must not leak into the next collection
+                conn.rollback()
+            except psycopg2.Error:
+                close = True
+            else:
+                with self.lock:
+                    if len(self.idle) < POSTGRESQL_POOL_MAXCONN:
+                        self.idle.append((conn, time.monotonic()))
+                        return
+        conn.close()
+
+    def close_stale(self) -> None:
+        """Closes connections idle for longer than POSTGRESQL_POOL_MAX_IDLE"""
+        deadline = time.monotonic() - POSTGRESQL_POOL_MAX_IDLE
+        with self.lock:
+            stale = [conn for conn, idle_since in self.idle if idle_since < deadline]
+            self.idle = [
+                (conn, idle_since)
+                for conn, idle_since in self.idle
+                if idle_since >= deadline
+            ]
+        for conn in stale:
+            conn.close()
+
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_pid: Optional[int] = None
+_pools_lock = threading.Lock()
+
+
+def get_pool(database_connection: Dict) -> ConnectionPool:
+    """Returns the connection pool of the process for these connection parameters"""
+    global _pools_pid
+    key = json.dumps(database_connection, sort_keys=True)
+    with _pools_lock:
+        # Connections can't be shared with forked processes (e.g. workers)
+        if _pools_pid != os.getpid():
+            _pools.clear()
+            _pools_pid = os.getpid()
+        if key not in _pools:
+            _pools[key] = ConnectionPool(database_connection)
+        pool = _pools[key]
+        pools = list(_pools.values())
+    # Connections to databases which aren't queried anymore don't stay open
+    for other in pools:
+        other.close_stale()
+    return pool
 
 
 @final
@@ -45,23 +137,60 @@ class Postgresql(Integration):
         assert (
             self.config is not None
         ), "Configuration is required in order to run this integration"
+        # Metrics querying the same database reuse connections
+        self.pool = get_pool(self.config["database_connection"])
+        self.cursors: Set[cursor] = set()
         try:
-            self.conn = psycopg2.connect(
-                **self.config["database_connection"], connect_timeout=15
-            )
+            self.conn = self.pool.getconn()
+            try:
+                self._prepare_session()
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                # The pooled connection was closed (e.g. by the server)
+                self.pool.putconn(self.conn, close=True)
+                self.conn = self.pool.getconn()
+                self._prepare_session()
         except psycopg2.OperationalError as e:
             raise UserFixableError(
                 f"Database connection failed\nFull error: {str(e).rstrip()}"
             )
-        self.conn.set_session(readonly=True)
-        self.cur = self.conn.cursor(cursor_factory=RealDictCursor)
         return self
 
+    def _prepare_session(self) -> None:
+        self.conn.set_session(readonly=True)
+        with self.conn.cursor() as cur:
+            cur.execute(
+                "SET statement_timeout = %s", (POSTGRESQL_STATEMENT_TIMEOUT * 1000,)
+            )
+
     def __exit__(self, exc_type, exc_val, exc_tb):
-        if hasattr(self, "cur"):
-            self.cur.close()
         if hasattr(self, "conn"):
-            self.conn.close()
+            # Cursors of partially consumed results can't outlive the session
+            for cur in list(self.cursors):
+                _close_cursor(cur)
+            # Pending transactions are rolled back, which also resets
+            # `statement_timeout`
+            self.pool.putconn(self.conn)
+            del self.conn
+
+    def _execute(
+        self, query: str, vars: Optional[Dict] = None
+    ) -> Iterator[RealDictRow]:
+        if SINGLE_SELECT_RE.match(query):
+            # Named cursors are server-side: rows are fetched by batches
+            cur = self.conn.cursor(
+                name=f"polynomial_{uuid.uuid4().hex}", cursor_factory=RealDictCursor
+            )
+            cur.itersize = CURSOR_ITERSIZE
+        else:
+            # e.g. several statements: results are fetched at once
+            cur = self.conn.cursor(cursor_factory=RealDictCursor)
+        self.cursors.add(cur)
+        try:
+            cur.execute(query, vars=vars)
+            yield from cur
+        finally:
+            _close_cursor(cur)
+            self.cursors.discard(cur)
 
     def can_backfill(self):
         if not "sql_query_template" in self.config:
@@ -77,27 +206,36 @@ class Postgresql(Integration):
         if self.can_backfill():
             return self.collect_past(date.today() - timedelta(days=1))
         else:
-            self.cur.execute(sql_query_template)
             return [
                 MeasurementTuple(date=_date_getter(row), value=_value_getter(row))
-                for row in self.cur
+                for row in self._execute(sql_query_template)
             ][0]
 
     def collect_past(self, date: date) -> MeasurementTuple:
-        return self.collect_past_range(date_start=date, date_end=date)[0]
+        return list(self.collect_past_range(date_start=date, date_end=date))[0]
 
     def collect_past_range(
         self, date_start: date, date_end: date
-    ) -> List[MeasurementTuple]:
+    ) -> Iterator[MeasurementTuple]:
         assert self.can_backfill()
         sql_query_template = self.config["sql_query_template"]
-        self.cur.execute(
-            sql_query_template, vars={"date_start": date_start, "date_end": date_end}
-        )
-        return [
+        return (
             MeasurementTuple(date=_date_getter(row), value=_value_getter(row))
-            for row in self.cur
-        ]
+            for row in self._execute(
+                sql_query_template,
+                vars={"date_start": date_start, "date_end": date_end},
+            )
+        )
+
+
+def _close_cursor(cur: cursor) -> None:
+    if cur.closed:
+        return
+    try:
+        cur.close()
+    except psycopg2.Error:
+        # e.g. the transaction failed: it will be rolled back anyway
+        pass
 
 
 def _date_getter(row: RealDictRow) -> date:
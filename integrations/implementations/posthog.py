@@ -1,9 +1,51 @@
+import logging
+import re
 from datetime import date, timedelta
-from typing import Iterator, Optional, final
+from typing import Iterator, List, Optional, Tuple, final
 
 import requests
 
 from ..base import Integration, MeasurementTuple, UserFixableError
+from ..utils import (
+    batch_range_by_max_batch,
+    env,
+    fill_mesurement_range,
+    replace_null_with_nan,
+)
+
+logger = logging.getLogger(__name__)
+
+# Collect several days at once by rewriting simple %(date)s queries into a
+# query grouped by day
+POSTHOG_GROUP_BY_DAY = env.bool("POSTHOG_GROUP_BY_DAY", default=True)
+# HogQL queries return at most 100 rows, unless a LIMIT is given
+RANGE_MAX_DAYS = 100
+
+SELECT_RE = re.compile(
+    r"^\s*SELECT\s+(?P<value>.+?)\s+FROM\s+(?P<rest>.+?)\s*;?\s*$",
+    re.IGNORECASE | re.DOTALL,
+)
+# Aggregates which are 0 when there are no rows
+AGGREGATE_RE = re.compile(
+    r"^(?P<aggregate>(?:count|countIf|sum|sumIf|uniq|uniqExact)\s*\([^()]*\))"
+    r"(?:\s+AS\s+\w+)?$",
+    re.IGNORECASE,
+)
+# A single table, filtered by conditions (which are checked separately)
+FROM_WHERE_RE = re.compile(
+    r"^(?P<table>[\w.]+(?:\s+(?:AS\s+)?\w+)?)\s+WHERE\s+(?P<conditions>.+)$",
+    re.IGNORECASE | re.DOTALL,
+)
+# Anything that isn't a flat SELECT of a single table
+UNSUPPORTED_RE = re.compile(
+    r"\b(?:SELECT|JOIN|UNION|GROUP\s+BY|ORDER\s+BY|LIMIT|HAVING|SETTINGS)\b",
+    re.IGNORECASE,
+)
+DAY_FILTER_RE = re.compile(
+    r"^(?P<day>toStartOfDay\(\s*[\w.]+\s*\))\s*==?\s*%\(date\)s$", re.IGNORECASE
+)
+AND_RE = re.compile(r"\s+AND\s+", re.IGNORECASE)
+OR_RE = re.compile(r"\bOR\b", re.IGNORECASE)
 
 
 @final
@@ -26,38 +68,45 @@ class PostHog(Integration):
                 "type": "string",
                 "widget": "textarea",
                 "required": True,
-                "helpText": "Use the HogQL language to query (see https://posthog.com/docs/hogql). Use %(date)s to insert the date requested by Polynomial.",
+                "helpText": "Use the HogQL language to query (see https://posthog.com/docs/hogql). Use %(date)s to insert the date requested by Polynomial. Alternatively, use %(date_start)s and %(date_end)s (inclusive) and return two columns: the day and its value.",
                 "default": "SELECT COUNT(*) as value\nFROM events\nWHERE toStartOfDay(timestamp) == %(date)s",
             },
         },
     }
 
     description = "Use HogQL to query your PostHog database."
+    # PostHog limits the number of concurrent queries per team
+    collect_past_concurrency = 2
     protected_field_paths = [["api_key"]]
 
-    def execute(
-        self, query, query_date: Optional[date] = None
-    ) -> Iterator[MeasurementTuple]:
-        if query_date:
-            query = query.replace(
-                "%(date)s", f"toStartOfDay(toDateTime('{query_date.isoformat()}'))"
-            )
+    def __enter__(self):
+        assert (
+            self.config is not None
+        ), "Configuration is required in order to run this integration"
+        self.session = requests.Session()
+        self.session.headers.update(
+            {"Authorization": f'Bearer {self.config["api_key"]}'}
+        )
+        self.mount_adapters(self.session)
+        return self
 
-        r = requests.post(
+    def _query(self, query: str) -> Tuple[List[str], List[List]]:
+        r = self.session.post(
             f"{self.config['endpoint']}/api/projects/{self.config['project_id']}/query",
-            headers={
-                "Authorization": f'Bearer {self.config["api_key"]}',
-                "Content-Type": "application/json",
-            },
             json={"query": {"kind": "HogQLQuery", "query": query}},
         )
         r.raise_for_status()
         data = r.json()
-        columns = data["columns"]
-        results = data["results"]
+        return data["columns"], data["results"]
+
+    def execute(
+        self, query, query_date: Optional[date] = None
+    ) -> Iterator[MeasurementTuple]:
+        if query_date:
+            query = _substitute_dates(query, date=query_date)
+
+        columns, results = self._query(query)
 
-        # Note: HogQL doesn't seem to support emitting a date (only a datetime)
-        # so we don't allow making range queries (which require returning a date)
         if len(columns) != 1:
             raise UserFixableError("Only one column should be returned")
 
@@ -66,11 +115,48 @@ class PostHog(Integration):
             for r in results
         )
 
+    def execute_range(
+        self, query: str, date_start: date, date_end: date
+    ) -> List[MeasurementTuple]:
+        query = _substitute_dates(query, date_start=date_start, date_end=date_end)
+
+        columns, results = self._query(query)
+
+        # HogQL doesn't seem to support emitting a date (only a datetime):
+        # only the date part of the first column is kept
+        if len(columns) != 2:
+            raise UserFixableError(
+                "Two columns should be returned: the day, followed by the value"
+            )
+        measurements = []
+        for row in results:
+            try:
+                dt = date.fromisoformat(str(row[0])[:10])
+            except ValueError:
+                raise UserFixableError(
+                    f"Expected the first column to be a date. Received {row[0]} instead."
+                ) from None
+            measurements.append(
+                MeasurementTuple(date=dt, value=replace_null_with_nan(row[1]))
+            )
+        return measurements
+
+    def _range_query(self) -> Optional[str]:
+        """Query collecting a range of dates at once, if possible"""
+        query = self.config["query"]
+        if "%(date_start)s" in query and "%(date_end)s" in query:
+            return query
+        if POSTHOG_GROUP_BY_DAY:
+            return _rewrite_as_range_query(query)
+        return None
+
     def can_backfill(self):
         if not "query" in self.config:
             return False
         query = self.config["query"]
-        return "%(date)s" in query
+        return "%(date)s" in query or (
+            "%(date_start)s" in query and "%(date_end)s" in query
+        )
 
     def collect_latest(self) -> MeasurementTuple:
         query = self.config["query"]
@@ -82,4 +168,155 @@ class PostHog(Integration):
     def collect_past(self, date: date) -> MeasurementTuple:
         assert self.can_backfill()
         query = self.config["query"]
+        if "%(date)s" not in query:
+            for measurement in self.collect_past_range(date_start=date, date_end=date):
+                if measurement.date == date:
+                    return measurement
+            raise UserFixableError(
+                f"The query didn't return any row for {date.isoformat()}"
+            )
         return next(self.execute(query, query_date=date))
+
+    def collect_past_range(
+        self, date_start: date, date_end: date
+    ) -> List[MeasurementTuple]:
+        range_query = self._range_query()
+        if range_query is None:
+            return list(super().collect_past_range(date_start, date_end))
+        rewritten = range_query != self.config["query"]
+        collect_past_range = super().collect_past_range
+
+        def collect_batch(date_start: date, date_end: date) -> List[MeasurementTuple]:
+            if not rewritten:
+                return self.execute_range(range_query, date_start, date_end)
+            try:
+                measurements = self.execute_range(range_query, date_start, date_end)
+            except (requests.HTTPError, UserFixableError) as e:
+                if isinstance(e, requests.HTTPError) and (
+                    e.response is None or e.response.status_code != 400
+                ):
+                    raise
+                # The rewrite isn't understood by PostHog: run the original
+                # query for each day instead
+                logger.warning(
+                    "Could not collect a range with the rewritten query",
+                    exc_info=True,
+                )
+                return list(collect_past_range(date_start, date_end))
+            # Days without events aren't returned by GROUP BY, whereas the
+            # original query would have given 0
+            return fill_mesurement_range(measurements, date_start, date_end)
+
+        # Results are limited to RANGE_MAX_DAYS rows by default
+        return list(
+            batch_range_by_max_batch(
+                date_start=date_start,
+                date_end=date_end,
+                max_days=RANGE_MAX_DAYS,
+                callable=collect_batch,
+            )
+        )
+
+
+def _substitute_dates(query: str, **dates: date) -> str:
+    for name, dt in dates.items():
+        query = query.replace(
+            f"%({name})s", f"toStartOfDay(toDateTime('{dt.isoformat()}'))"
+        )
+    return query
+
+
+def _top_level_conjuncts(conditions: str) -> Optional[List[str]]:
+    """Splits conditions on their top-level ANDs. Returns None if they can't
+    be, e.g. with a top-level OR, unbalanced parentheses or quotes"""
+    conjuncts = []
+    depth = 0
+    start = 0
+    index = 0
+    quote: Optional[str] = None
+    while index < len(conditions):
+        char = conditions[index]
+        separator = None
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in "'\"`":
+            quote = char
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+            if depth < 0:
+                return None
+        elif depth == 0:
+            separator = AND_RE.match(conditions, index)
+        if separator:
+            conjuncts.append(conditions[start:index])
+            start = index = separator.end()
+        else:
+            index += 1
+    if depth != 0 or quote:
+        return None
+    conjuncts.append(conditions[start:])
+    conjuncts = [conjunct.strip() for conjunct in conjuncts]
+    if any(OR_RE.search(_strip_parentheses(c)) for c in conjuncts):
+        return None
+    return conjuncts
+
+
+def _strip_parentheses(condition: str) -> str:
+    """Removes the parenthesized parts of a condition"""
+    stripped = ""
+    depth = 0
+    for char in condition:
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif depth == 0:
+            stripped += char
+    return stripped
+
+
+def _rewrite_as_range_query(query: str) -> Optional[str]:
+    """
+    Rewrites a single-day query such as
+        SELECT COUNT(*) FROM events WHERE toStartOfDay(timestamp) == %(date)s
+    into a query returning the value of each day of a range. Only flat
+    queries of a single table are rewritten: a single aggregate which is 0 on
+    days without events, and a day filter which is one of the top-level AND
+    conditions. Returns None otherwise.
+    """
+    match = SELECT_RE.match(query)
+    if match is None or query.count("%(date)s") != 1:
+        return None
+    aggregate = AGGREGATE_RE.match(match["value"])
+    if aggregate is None or UNSUPPORTED_RE.search(match["rest"]):
+        return None
+    from_where = FROM_WHERE_RE.match(match["rest"])
+    if from_where is None:
+        return None
+    conjuncts = _top_level_conjuncts(from_where["conditions"])
+    if conjuncts is None:
+        return None
+    conditions = []
+    day = None
+    for conjunct in conjuncts:
+        day_filter = DAY_FILTER_RE.match(conjunct)
+        if day_filter is None:
+            conditions.append(conjunct)
+        else:
+            day = day_filter["day"]
+            conditions.append(f"{day} >= %(date_start)s AND {day} <= %(date_end)s")
+    if day is None:
+        # The date is used elsewhere
+        return None
+    return (
+        f"SELECT {day} AS date, {aggregate['aggregate']} AS value\n"
+        f"FROM {from_where['table']}\n"
+        f"WHERE {' AND '.join(conditions)}\n"
+        "GROUP BY date\n"
+        "ORDER BY date\n"
+        # Ranges are collected by batches of RANGE_MAX_DAYS days
+        f"LIMIT {RANGE_MAX_DAYS}"
+    )
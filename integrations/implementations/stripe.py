@@ -1,12 +1,16 @@
-from datetime import date, datetime
-from typing import Callable, Dict, Iterator, Optional, Tuple, final
+import bisect
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, final
 
 import requests
 from oauthlib.oauth2.rfc6749.parameters import parse_authorization_code_response
 from requests.auth import HTTPBasicAuth
 
 from ..base import MeasurementTuple, WebAuthIntegration
-from ..utils import get_secret
+from ..rate_limit import RateLimit
+from ..utils import get_secret, paginate
+
+PAGE_LIMIT = 100  # Maximum allowed by Stripe
 
 
 @final
@@ -22,6 +26,13 @@ class Stripe(WebAuthIntegration):
     authorization_url = "https://marketplace.stripe.com/oauth/v2/authorize"
 
     description = "Track daily subscription revenue and customer count."
+    # Metrics page through all customers or subscriptions
+    collect_weight = 3
+    # See https://docs.stripe.com/rate-limits
+    # (all connected accounts are queried using our API key)
+    rate_limit = RateLimit(100, 1)
+    # Customers are listed once for any range: don't shard backfills
+    backfill_shard_days = 100 * 365
 
     _metric_choices = [
         {"title": "Customer count", "value": "customer_count", "can_backfill": True},
@@ -74,6 +85,7 @@ class Stripe(WebAuthIntegration):
         self.r = requests.Session()
         self.r.headers.update({"Stripe-Account": self.stripeAccountId})
         self.r.auth = HTTPBasicAuth(self.api_key, "")
+        self.mount_adapters(self.r)
         return self
 
     @classmethod
@@ -102,32 +114,50 @@ class Stripe(WebAuthIntegration):
     def paginated_request(
         self, url: str, params: Optional[dict] = None
     ) -> Iterator[dict]:
-        r = self.r.get(url, params=params)
-        r.raise_for_status()
-        obj = r.json()
-        yield from obj["data"]
-        if obj["has_more"]:
-            starting_after = obj["data"][-1]["id"]
-            new_params = {**(params or {}), "starting_after": starting_after}
-            yield from self.paginated_request(url, params=new_params)
-
-    def _collect_past_customer_count(self, date: date) -> MeasurementTuple:
-        start_time = datetime(
-            year=date.year, month=date.month, day=date.day, tzinfo=None
-        )
-        end_time = start_time.replace(hour=23, minute=59, second=59)
-        end_time_int = int(end_time.timestamp())
-        return MeasurementTuple(
-            date=date,
-            value=len(
-                list(
-                    self.paginated_request(
-                        f"https://api.stripe.com/v1/customers",
-                        params={"created[lte]": end_time_int, "limit": 50},
-                    )
-                )
-            ),
+        params = {"limit": PAGE_LIMIT, **(params or {})}
+
+        def fetch_page(
+            starting_after: Optional[str],
+        ) -> Tuple[List[dict], Optional[str]]:
+            page_params = {**params}
+            if starting_after:
+                page_params["starting_after"] = starting_after
+            r = self.r.get(url, params=page_params)
+            r.raise_for_status()
+            obj = r.json()
+            if not obj["has_more"]:
+                return obj["data"], None
+            return obj["data"], obj["data"][-1]["id"]
+
+        # Pages are only consumed locally: the next one can be fetched meanwhile
+        return paginate(fetch_page, prefetch=True)
+
+    def _collect_past_range_customer_count(
+        self, date_start: date, date_end: date
+    ) -> List[MeasurementTuple]:
+        # Customers are listed once for the whole range (instead of once per
+        # day), and the daily count is computed from their creation dates
+        end_time = datetime(
+            year=date_end.year, month=date_end.month, day=date_end.day, tzinfo=None
+        ).replace(hour=23, minute=59, second=59)
+        created_dates = sorted(
+            date.fromtimestamp(customer["created"])
+            for customer in self.paginated_request(
+                f"https://api.stripe.com/v1/customers",
+                params={"created[lte]": int(end_time.timestamp())},
+            )
         )
+        return [
+            MeasurementTuple(
+                date=day,
+                # Number of customers created on that day or before
+                value=bisect.bisect_right(created_dates, day),
+            )
+            for day in (
+                date_start + timedelta(days=i)
+                for i in range((date_end - date_start).days + 1)
+            )
+        ]
 
     def _collect_latest_subscription_count(self, status: str) -> MeasurementTuple:
         # Valid status: incomplete, incomplete_expired, trialing, active, past_due, canceled, unpaid, or paused
@@ -138,7 +168,7 @@ class Stripe(WebAuthIntegration):
                 list(
                     self.paginated_request(
                         f"https://api.stripe.com/v1/subscriptions",
-                        params={"status": status, "limit": 50},
+                        params={"status": status},
                     )
                 )
             ),
@@ -156,7 +186,7 @@ class Stripe(WebAuthIntegration):
                     / 100
                     for subscription in self.paginated_request(
                         f"https://api.stripe.com/v1/subscriptions",
-                        params={"status": status, "limit": 50},
+                        params={"status": status},
                     )
                     for subscription_item in subscription["items"]["data"]
                 ]
@@ -173,10 +203,11 @@ class Stripe(WebAuthIntegration):
         metric_config = self._get_metric_config_for_key(self.config["metric"])
         return metric_config.get("can_backfill", True)
 
-    def collect_past(self, date: date) -> MeasurementTuple:
-        """Will be called by `collect_past_range` when `can_backfill` returns True"""
+    def collect_past_range(
+        self, date_start: date, date_end: date
+    ) -> List[MeasurementTuple]:
         if self.config["metric"] == "customer_count":
-            return self._collect_past_customer_count(date)
+            return self._collect_past_range_customer_count(date_start, date_end)
         raise KeyError(f"Couldn't find metric with value '{self.config['metric']}'")
 
     def collect_latest(self) -> MeasurementTuple:
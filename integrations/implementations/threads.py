@@ -18,6 +18,7 @@ class Threads(OAuth2Integration):
     scopes = ["threads_basic,threads_manage_insights"]
     description = "Collect metrics such as followers, impressions and reach from your Threads account."
     token_extras = {"include_client_id": True}
+    collect_past_concurrency = 4
 
     # Only the last two years of insights data is available.
     def earliest_backfill(self) -> date:
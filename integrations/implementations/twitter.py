@@ -1,10 +1,12 @@
+from collections import defaultdict
 from datetime import date, datetime, timedelta, timezone
-from typing import final
+from typing import Dict, List, Optional, Tuple, final
 
 import requests
 
 from ..base import Integration, MeasurementTuple
-from ..utils import get_secret
+from ..rate_limit import RateLimit
+from ..utils import fill_mesurement_range, get_secret, paginate
 
 
 def validate_http_response(response: requests.models.Response):
@@ -22,6 +24,11 @@ def validate_http_response(response: requests.models.Response):
         raise
 
 
+def utc_iso(dt: datetime) -> str:
+    # Twitter API expects datetimes in isoformat with UTC zone
+    return dt.astimezone(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
 @final
 class Twitter(Integration):
     # Twitter uses the "app-only" credential mode
@@ -49,11 +56,17 @@ class Twitter(Integration):
     }
 
     description = "Followers and mentions of your Twitter account."
+    # Twitter has very strict rate limits
+    collect_weight = 2
+    # See https://developer.twitter.com/en/docs/twitter-api/rate-limits
+    # (app-only authentication, shared by all metrics)
+    rate_limit = RateLimit(300, 15 * 60)
 
     def __enter__(self):
         super().__enter__()
         self.session = requests.Session()
         self.session.headers.update({"Authorization": f"Bearer {self.api_key}"})
+        self.mount_adapters(self.session)
         return self
 
     def can_backfill(self):
@@ -79,38 +92,66 @@ class Twitter(Integration):
             return super().collect_latest()
 
     def collect_past(self, date: date) -> MeasurementTuple:
-        # Twitter API expects datetimes in isoformat with UTC zone
+        return self.collect_past_range(date_start=date, date_end=date)[0]
+
+    def collect_past_range(
+        self, date_start: date, date_end: date
+    ) -> List[MeasurementTuple]:
+        # Days are in UTC, like the buckets they are built from
         # TODO: pass user timezone here tzinfo=ZoneInfo(...)
         start_time = datetime(
-            year=date.year, month=date.month, day=date.day, tzinfo=None
-        )
-        end_time = start_time.replace(hour=23, minute=59, second=59)
-        start_time_utc_iso = (
-            start_time.astimezone(timezone.utc).isoformat().replace("+00:00", "Z")
-        )
-        end_time_utc_iso = (
-            end_time.astimezone(timezone.utc).isoformat().replace("+00:00", "Z")
+            year=date_start.year,
+            month=date_start.month,
+            day=date_start.day,
+            tzinfo=timezone.utc,
         )
+        end_time = datetime(
+            year=date_end.year,
+            month=date_end.month,
+            day=date_end.day,
+            tzinfo=timezone.utc,
+        ) + timedelta(days=1)
         # Make sure we never have the @ (this will allow us to support both cases)
         account = self.config["account"].replace("@", "")
 
         metric = self.config["metric"]
-        if metric == "mention_count":
+        if metric != "mention_count":
+            raise NotImplementedError(
+                f"Unknown metric {metric}. Are you sure it can backfill?"
+            )
+
+        def fetch_page(
+            next_token: Optional[str],
+        ) -> Tuple[List[Dict], Optional[str]]:
+            params = {
+                # See https://developer.twitter.com/en/docs/twitter-api/tweets/counts/integrate/build-a-query
+                "query": f'"@{account}"',
+                "start_time": utc_iso(start_time),
+                "end_time": utc_iso(end_time),
+                "granularity": "day",
+            }
+            if next_token:
+                params["next_token"] = next_token
             response = self.session.get(
-                "https://api.twitter.com/2/tweets/counts/recent",
-                params={
-                    # See https://developer.twitter.com/en/docs/twitter-api/tweets/counts/integrate/build-a-query
-                    "query": f'"@{account}"',
-                    "start_time": start_time_utc_iso,
-                    "end_time": end_time_utc_iso,
-                },
+                "https://api.twitter.com/2/tweets/counts/recent", params=params
             )
             validate_http_response(response)
             data = response.json()
-            mentions = data["meta"]["total_tweet_count"]
-        else:
-            raise NotImplementedError(
-                f"Unknown metric {metric}. Are you sure it can backfill?"
-            )
+            return data.get("data", []), data["meta"].get("next_token")
 
-        return MeasurementTuple(date=date, value=mentions)
+        mentions: Dict[date, int] = defaultdict(int)
+        for bucket in paginate(fetch_page):
+            # Buckets start at midnight UTC
+            dt = (
+                datetime.fromisoformat(bucket["start"].replace("Z", "+00:00"))
+                .astimezone(timezone.utc)
+                .date()
+            )
+            if date_start <= dt <= date_end:
+                mentions[dt] += bucket["tweet_count"]
+        # Days without mentions may not have a bucket
+        return fill_mesurement_range(
+            [MeasurementTuple(date=dt, value=value) for dt, value in mentions.items()],
+            date_start,
+            date_end,
+        )
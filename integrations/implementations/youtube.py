@@ -1,10 +1,10 @@
 from datetime import date, datetime, timedelta
-from typing import Dict, Iterable, final
+from typing import Dict, Iterable, List, Optional, cast, final
 
 import requests
 
-from ..base import MeasurementTuple, OAuth2Integration
-from ..utils import get_secret
+from ..base import Integration, MeasurementTuple, OAuth2Integration
+from ..utils import get_secret, paginate_offset
 
 # See https://developers.google.com/youtube/analytics/metrics
 METRICS = sorted(
@@ -95,40 +95,37 @@ class Youtube(OAuth2Integration):
     def can_backfill(self):
         return True
 
-    def _paginated_query(
-        self,
-        url,
-        date_start: date,
-        date_end: date,
-        request_data: Dict,
-        start_index=1,
-    ):
-        request_data = {
-            **request_data,
-            "startIndex": start_index,
-            "maxResults": MAX_ROWS,
-        }
-        response = self.session.get(url, params=request_data)
-        response.raise_for_status()
-        data = response.json()
-        rows = data["rows"]
-        if len(rows) < MAX_ROWS:
-            return rows
-        else:
-            new_start_index = len(rows) + start_index
-            assert (
-                new_start_index > start_index
-            ), f"New start index ({new_start_index}) is smaller or equal to old ({start_index})"
-            return rows + self._paginated_query(
-                url, date_start, date_end, request_data, start_index=new_start_index
+    def _paginated_query(self, url, request_data: Dict) -> List[List]:
+        def fetch_page(start_index: int) -> List[List]:
+            response = self.session.get(
+                url,
+                params={
+                    **request_data,
+                    "startIndex": start_index,
+                    "maxResults": MAX_ROWS,
+                },
             )
+            response.raise_for_status()
+            return response.json()["rows"]
+
+        self.refresh_token_ahead()
+        # Indices are 1-based
+        return list(
+            paginate_offset(fetch_page, page_size=MAX_ROWS, first=1, prefetch=True)
+        )
 
     def collect_past_range(
         self, date_start: date, date_end: date
     ) -> Iterable[MeasurementTuple]:
+        return self._query(date_start, date_end, [self.config["metric"]])[
+            self.config["metric"]
+        ]
+
+    def _query(
+        self, date_start: date, date_end: date, metrics: List[str]
+    ) -> Dict[str, List[MeasurementTuple]]:
         # Parameters
         channel = self.config["channel"]
-        metric = self.config["metric"]
 
         # Documentation:
         # https://youtubeanalytics.googleapis.com/v2/reports
@@ -137,20 +134,39 @@ class Youtube(OAuth2Integration):
             "startDate": date_start.strftime("%Y-%m-%d"),
             "endDate": date_end.strftime("%Y-%m-%d"),
             "ids": f"channel=={channel}",
-            "metrics": metric,
+            "metrics": ",".join(metrics),
             "dimensions": "day",
             # TODO: add filters
         }
 
         request_url = f"https://youtubeanalytics.googleapis.com/v2/reports"
-        rows = self._paginated_query(request_url, date_start, date_end, request_data)
-        return (
-            MeasurementTuple(
-                date=datetime.strptime(row[0], "%Y-%m-%d").date(),
-                value=float(row[1]),
-            )
-            for row in rows
-        )
+        rows = self._paginated_query(request_url, request_data)
+        # Columns are the day followed by the requested metrics
+        return {
+            metric: [
+                MeasurementTuple(
+                    date=datetime.strptime(row[0], "%Y-%m-%d").date(),
+                    value=float(row[i + 1]),
+                )
+                for row in rows
+            ]
+            for i, metric in enumerate(metrics)
+        }
+
+    def batch_key(self) -> Optional[str]:
+        # A report can contain several metrics for the same channel
+        return self.config["channel"]
+
+    @classmethod
+    def collect_past_range_batch(
+        cls, integrations: List[Integration], date_start: date, date_end: date
+    ) -> List[List[MeasurementTuple]]:
+        # Metrics share credentials: the first one queries for all
+        batch = cast(List[Youtube], integrations)
+        metrics = sorted({integration.config["metric"] for integration in batch})
+        with batch[0]:
+            results = batch[0]._query(date_start, date_end, metrics)
+        return [results[integration.config["metric"]] for integration in batch]
 
     def collect_latest(self) -> MeasurementTuple:
         # API returns delayed results
@@ -0,0 +1,136 @@
+import hashlib
+import logging
+import time
+from typing import Callable, NamedTuple, Optional
+
+import redis
+import requests
+from environs import Env
+from redis.commands.core import Script
+
+from .http import PooledAdapter
+
+env = Env()
+env.read_env()  # read .env file, if it exists
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = env.str("REDIS_URL", default="redis://127.0.0.1:6379")
+# Requests that would have to wait longer than this are not sent. Instead,
+# `RateLimitExceeded` is raised so that the task can be retried later.
+MAX_WAIT = 60  # seconds
+# Number of tokens a request takes, when it counts as several calls upstream
+# (e.g. batch requests). The header is removed before the request is sent.
+WEIGHT_HEADER = "X-Rate-Limit-Weight"
+
+# Token bucket where each request reserves a token, even if the bucket is
+# empty. The returned value is the time the caller has to wait before
+# its token becomes available, which makes concurrent callers queue up
+# instead of polling.
+# KEYS[1]: bucket key
+# ARGV: capacity, refill rate (tokens/s), current time (s), max wait (s),
+# number of tokens
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local max_wait = tonumber(ARGV[4])
+local count = tonumber(ARGV[5])
+local state = redis.call("HMGET", KEYS[1], "tokens", "updated_at")
+local tokens = tonumber(state[1]) or capacity
+local updated_at = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated_at) * rate) - count
+local wait = math.max(0, -tokens / rate)
+if wait > max_wait then
+    return tostring(-wait)
+end
+redis.call("HSET", KEYS[1], "tokens", tostring(tokens), "updated_at", tostring(now))
+redis.call("EXPIRE", KEYS[1], math.ceil((capacity - tokens) / rate) + 1)
+return tostring(wait)
+"""
+
+_redis_client: Optional[redis.Redis] = None
+_token_bucket_script: Optional[Script] = None
+
+
+def get_redis_client() -> redis.Redis:
+    global _redis_client
+    if _redis_client is None:
+        _redis_client = redis.Redis.from_url(REDIS_URL)
+    return _redis_client
+
+
+def get_token_bucket_script() -> Script:
+    # Registered scripts are sent once, and then called by their hash
+    global _token_bucket_script
+    if _token_bucket_script is None:
+        _token_bucket_script = get_redis_client().register_script(TOKEN_BUCKET_SCRIPT)
+    return _token_bucket_script
+
+
+class RateLimit(NamedTuple):
+    requests: int
+    period: float  # seconds
+
+
+class RateLimitExceeded(requests.RequestException):
+    def __init__(self, *args, retry_after: Optional[float] = None, **kwargs):
+        # Seconds after which requests can be sent again, when known
+        self.retry_after = retry_after
+        super().__init__(*args, **kwargs)
+
+
+class TokenBucket:
+    def __init__(self, name: str, rate_limit: RateLimit):
+        self.key = f"ratelimit:{name}"
+        self.rate_limit = rate_limit
+
+    def reserve(self, count: int = 1) -> float:
+        """Reserves `count` tokens and returns how long to wait before using them"""
+        capacity, period = self.rate_limit
+        wait = float(
+            get_token_bucket_script()(
+                keys=[self.key],
+                args=[capacity, capacity / period, time.time(), MAX_WAIT, count],
+            )
+        )
+        if wait < 0:
+            raise RateLimitExceeded(
+                f"Rate limit of {capacity} requests per {period}s reached (would need to wait {-wait:.0f}s)",
+                retry_after=-wait,
+            )
+        return wait
+
+    def acquire(self, count: int = 1) -> None:
+        try:
+            wait = self.reserve(count)
+        except redis.RedisError:
+            # The rate limiter should never prevent collection
+            logger.warning(f"Rate limiter unavailable for {self.key}", exc_info=True)
+            return
+        if wait > 0:
+            logger.debug(f"Waiting {wait:.2f}s for {self.key}")
+            time.sleep(wait)
+
+
+def bucket_name(integration_id: str, key: Optional[str] = None) -> str:
+    if key is None:
+        return integration_id
+    # Keys can be credentials: make sure they don't end up in Redis
+    return f"{integration_id}:{hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]}"
+
+
+class RateLimitedAdapter(PooledAdapter):
+    """Transport adapter acquiring a token before each request is sent
+    (or as many tokens as its `WEIGHT_HEADER`)"""
+
+    def __init__(self, get_bucket: Callable[[], TokenBucket]):
+        # The bucket is resolved at each request, as its key might change
+        # during the lifetime of a session (e.g. after `__enter__`)
+        self.get_bucket = get_bucket
+        super().__init__()
+
+    def send(self, request, *args, **kwargs):
+        weight = int(request.headers.pop(WEIGHT_HEADER, 1))
+        self.get_bucket().acquire(weight)
+        return super().send(request, *args, **kwargs)
@@ -0,0 +1,153 @@
+import hashlib
+import json
+import logging
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, Optional, cast
+from urllib.parse import urlsplit
+
+import redis
+from requests import PreparedRequest, Response
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from .rate_limit import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+# Cached responses are evicted when they haven't been validated for that long
+CACHE_TTL = 30 * 24 * 3600  # seconds
+# Larger responses aren't cached, to keep Redis memory in check
+CACHE_MAX_BODY_SIZE = 10 * 1024 * 1024  # bytes
+# Headers that don't apply to the (decoded) cached body
+EXCLUDED_HEADERS = ["content-encoding", "content-length", "transfer-encoding"]
+
+_stats: Dict[str, Dict[str, int]] = defaultdict(
+    lambda: {"hits": 0, "misses": 0, "stored": 0}
+)
+_stats_lock = threading.Lock()
+
+
+def _count(url: str, counter: str) -> None:
+    with _stats_lock:
+        _stats[urlsplit(url).netloc][counter] += 1
+
+
+def response_cache_stats() -> Dict[str, Dict[str, int]]:
+    """Number of cache hits (304), misses and stored responses per host"""
+    with _stats_lock:
+        return {host: dict(counters) for host, counters in _stats.items()}
+
+
+class ConditionalCacheAdapter(BaseAdapter):
+    """
+    Caches responses having an `ETag` or `Last-Modified` validator, and
+    revalidates them using conditional requests. When the server answers
+    with 304 Not Modified, the cached body is returned instead.
+    Requests with `Cache-Control: no-store` bypass the cache.
+    """
+
+    def __init__(
+        self, adapter: BaseAdapter, get_namespace: Callable[[], Optional[str]]
+    ):
+        # Cached responses are only shared between sessions of the same
+        # namespace (e.g. same credentials). Without namespace, the
+        # `Authorization` header is used.
+        self.adapter = adapter
+        self.get_namespace = get_namespace
+        super().__init__()
+
+    def _cache_key(self, request: PreparedRequest) -> str:
+        namespace = self.get_namespace()
+        if namespace is None:
+            namespace = request.headers.get("Authorization", "")
+        key = json.dumps([namespace, request.url])
+        # Keys can contain credentials: make sure they don't end up in Redis
+        return f"responsecache:{hashlib.sha256(key.encode('utf-8')).hexdigest()}"
+
+    def send(self, request: PreparedRequest, *args, **kwargs) -> Response:
+        if (
+            request.method != "GET"
+            or kwargs.get("stream")
+            or "no-store" in request.headers.get("Cache-Control", "")
+        ):
+            return self.adapter.send(request, *args, **kwargs)
+        cache_key = self._cache_key(request)
+        try:
+            cached = cast(Dict[bytes, bytes], get_redis_client().hgetall(cache_key))
+        except redis.RedisError:
+            # The cache should never prevent collection
+            logger.warning("Response cache unavailable", exc_info=True)
+            return self.adapter.send(request, *args, **kwargs)
+
+        if cached.get(b"etag"):
+            request.headers["If-None-Match"] = cached[b"etag"].decode("utf-8")
+        if cached.get(b"last_modified"):
+            request.headers["If-Modified-Since"] = cached[b"last_modified"].decode(
+                "utf-8"
+            )
+        response = self.adapter.send(request, *args, **kwargs)
+
+        if response.status_code == 304 and cached:
+            _count(request.url or "", "hits")
+            # Read the empty body of the 304 so that its connection goes back
+            # to the pool, before replacing the content
+            response.content
+            # Replay the cached response
+            response.status_code = 200
+            response.reason = "OK"
+            response.headers = CaseInsensitiveDict(
+                json.loads(cached[b"headers"].decode("utf-8"))
+            )
+            response.encoding = get_encoding_from_headers(response.headers)
+            response._content = cached[b"body"]
+            try:
+                get_redis_client().expire(cache_key, CACHE_TTL)
+            except redis.RedisError:
+                pass
+            return response
+
+        _count(request.url or "", "misses")
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if response.status_code == 200 and (etag or last_modified):
+            body = response.content
+            if len(body) <= CACHE_MAX_BODY_SIZE:
+                self._store(cache_key, response, body, etag, last_modified)
+        return response
+
+    def _store(
+        self,
+        cache_key: str,
+        response: Response,
+        body: bytes,
+        etag: Optional[str],
+        last_modified: Optional[str],
+    ) -> None:
+        headers = {
+            k: v
+            for k, v in response.headers.items()
+            if k.lower() not in EXCLUDED_HEADERS
+        }
+        try:
+            pipeline = get_redis_client().pipeline()
+            pipeline.delete(cache_key)
+            pipeline.hset(
+                cache_key,
+                mapping={
+                    "etag": etag or "",
+                    "last_modified": last_modified or "",
+                    "headers": json.dumps(headers),
+                    "body": body,
+                },
+            )
+            pipeline.expire(cache_key, CACHE_TTL)
+            pipeline.execute()
+        except redis.RedisError:
+            logger.warning("Response cache unavailable", exc_info=True)
+            return
+        _count(response.url, "stored")
+
+    def close(self):
+        self.adapter.close()
@@ -0,0 +1,119 @@
+import threading
+import time
+from datetime import date, timedelta
+from unittest import TestCase
+from unittest.mock import patch
+
+from integrations.base import Integration, MeasurementTuple, OAuth2Integration
+
+
+class SlowIntegration(Integration):
+    collect_past_concurrency = 3
+
+    def __init__(self):
+        super().__init__(None)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def can_backfill(self):
+        return True
+
+    def collect_past(self, date: date) -> MeasurementTuple:
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        # Later dates answer faster
+        time.sleep(0.01 * (31 - date.day))
+        with self.lock:
+            self.in_flight -= 1
+        return MeasurementTuple(date=date, value=date.day)
+
+
+class RefreshedIntegration(OAuth2Integration):
+    client_id = "client"
+    client_secret = "secret"
+    authorization_url = "https://example.com/authorize"
+    token_url = refresh_url = "https://example.com/token"
+    collect_past_concurrency = 2
+
+    def can_backfill(self):
+        return True
+
+    def collect_past(self, date: date) -> MeasurementTuple:
+        return MeasurementTuple(date=date, value=self.session.token["access_token"])
+
+
+class UnitTestCase(TestCase):
+    def test_collect_past_concurrently(self):
+        integration = SlowIntegration()
+        date_start = date(2024, 1, 1)
+        measurements = list(
+            integration.collect_past_range(
+                date_start=date_start, date_end=date(2024, 1, 10)
+            )
+        )
+        # Results are in date order
+        self.assertEqual(
+            [m.date for m in measurements],
+            [date_start + timedelta(days=i) for i in range(10)],
+        )
+        self.assertEqual(integration.max_in_flight, 3)
+
+    def test_refresh_token_ahead(self):
+        saved = []
+
+        def integration(expires_in):
+            return RefreshedIntegration(
+                None,
+                credentials={
+                    "access_token": "old",
+                    "refresh_token": "refresh",
+                    "token_type": "Bearer",
+                    "expires_at": time.time() + expires_in,
+                },
+                credentials_updater=saved.append,
+            )
+
+        refreshed = {"access_token": "new", "refresh_token": "refresh"}
+        with patch(
+            "requests_oauthlib.OAuth2Session.refresh_token", return_value=refreshed
+        ) as refresh_token:
+            integration(expires_in=3600).refresh_token_ahead()
+            self.assertEqual(saved, [])
+            integration(expires_in=60).refresh_token_ahead()
+        refresh_token.assert_called_once_with(
+            "https://example.com/token", client_id="client", client_secret="secret"
+        )
+        self.assertEqual(saved, [refreshed])
+
+    def test_refresh_token_before_collecting_concurrently(self):
+        saved = []
+        integration = RefreshedIntegration(
+            None,
+            credentials={
+                "access_token": "old",
+                "refresh_token": "refresh",
+                "token_type": "Bearer",
+                "expires_at": time.time() + 60,
+            },
+            credentials_updater=saved.append,
+        )
+        refreshed = {"access_token": "new", "refresh_token": "refresh"}
+
+        def refresh_token(*args, **kwargs):
+            # Refreshing from pool threads would save the metric there
+            self.assertIs(threading.current_thread(), threading.main_thread())
+            integration.session.token = refreshed
+            return refreshed
+
+        with patch(
+            "requests_oauthlib.OAuth2Session.refresh_token", side_effect=refresh_token
+        ):
+            measurements = list(
+                integration.collect_past_range(
+                    date_start=date(2024, 1, 1), date_end=date(2024, 1, 4)
+                )
+            )
+        self.assertEqual(saved, [refreshed])
+        self.assertEqual({m.value for m in measurements}, {"new"})
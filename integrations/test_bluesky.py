@@ -0,0 +1,78 @@
+from datetime import date
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from integrations.base import MeasurementTuple
+from integrations.implementations.bluesky import Bluesky, sort_date, utc_datetime
+
+POSTS = [
+    {
+        "indexedAt": "2024-01-01T10:00:00.000Z",
+        "record": {"createdAt": "2024-01-01T09:59:00.000Z"},
+        "likeCount": 1,
+    },
+    # Created on Jan 1st in UTC, with another offset
+    {
+        "indexedAt": "2024-01-01T22:30:00.000Z",
+        "record": {"createdAt": "2024-01-02T00:30:00+02:00"},
+        "likeCount": 2,
+    },
+    # Indexed the day after it was created
+    {
+        "indexedAt": "2024-01-03T00:10:00.000Z",
+        "record": {"createdAt": "2024-01-02T23:50:00.000Z"},
+        "likeCount": 4,
+    },
+    {"indexedAt": "2024-01-03T12:00:00.000Z", "record": {}, "likeCount": 8},
+]
+
+
+def sort_time(post):
+    times = [utc_datetime(post["indexedAt"])]
+    if "createdAt" in post["record"]:
+        times.append(utc_datetime(post["record"]["createdAt"]))
+    return min(times)
+
+
+class FakeSearchSession:
+    """Answers searchPosts filtering on the sort timestamp, a post per page"""
+
+    def get(self, url, params):
+        since = utc_datetime(params["since"])
+        until = utc_datetime(params["until"])
+        posts = [post for post in POSTS if since <= sort_time(post) < until]
+        index = int(params.get("cursor") or 0)
+        response = MagicMock()
+        response.json.return_value = {
+            "posts": posts[index : index + 1],
+            "cursor": str(index + 1) if index + 1 < len(posts) else None,
+        }
+        return response
+
+
+class UnitTestCase(TestCase):
+    def test_sort_date(self):
+        self.assertEqual(
+            [sort_date(post) for post in POSTS],
+            [date(2024, 1, 1), date(2024, 1, 1), date(2024, 1, 2), date(2024, 1, 3)],
+        )
+
+    def test_collect_past_range(self):
+        integration = Bluesky({"metric": "query_mention_likes", "metric_query": "acme"})
+        integration.session = FakeSearchSession()
+        measurements = integration.collect_past_range(
+            date_start=date(2024, 1, 1), date_end=date(2024, 1, 3)
+        )
+        self.assertEqual(
+            measurements,
+            [
+                MeasurementTuple(date=date(2024, 1, 1), value=1 + 2),
+                MeasurementTuple(date=date(2024, 1, 2), value=4),
+                MeasurementTuple(date=date(2024, 1, 3), value=8),
+            ],
+        )
+        # Same values as collecting each day on its own
+        self.assertEqual(
+            measurements,
+            [integration.collect_past(date(2024, 1, day)) for day in range(1, 4)],
+        )
@@ -0,0 +1,124 @@
+import json
+from datetime import date
+from typing import Callable, List, Optional
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+import requests
+
+from integrations.base import MeasurementTuple
+from integrations.implementations.facebook import (
+    GRAPH_BATCH_MAX_SIZE,
+    InsightsQuery,
+    collect_insights,
+    graph_batch_get,
+    pace_graph_usage,
+)
+from integrations.rate_limit import WEIGHT_HEADER, RateLimitExceeded
+
+
+class FakeGraphSession:
+    """Answers batch requests with `handler`, called with each relative url"""
+
+    def __init__(self, handler: Callable[[str], Optional[dict]]):
+        self.handler = handler
+        self.batches: List[List[str]] = []
+        self.weights: List[int] = []
+
+    def post(self, url, headers, data):
+        assert url == "https://graph.facebook.com/v19.0/"
+        relative_urls = [call["relative_url"] for call in json.loads(data["batch"])]
+        self.batches.append(relative_urls)
+        self.weights.append(int(headers[WEIGHT_HEADER]))
+        response = MagicMock()
+        response.json.return_value = [
+            (
+                None
+                if (body := self.handler(relative_url)) is None
+                else {"code": 200, "body": json.dumps(body)}
+            )
+            for relative_url in relative_urls
+        ]
+        return response
+
+
+class UnitTestCase(TestCase):
+    def test_graph_batch_get(self):
+        session = FakeGraphSession(lambda url: {"url": url})
+        urls = [f"{i}/insights" for i in range(GRAPH_BATCH_MAX_SIZE + 1)]
+        self.assertEqual(graph_batch_get(session, urls), [{"url": u} for u in urls])
+        self.assertEqual(session.batches, [urls[:-1], urls[-1:]])
+        # Each call of a batch counts towards the rate limit
+        self.assertEqual(session.weights, [GRAPH_BATCH_MAX_SIZE, 1])
+
+    def test_graph_batch_get_timeout(self):
+        timed_out = set()
+
+        def handler(url):
+            # Times out once, then succeeds
+            if url == "1/insights" and url not in timed_out:
+                timed_out.add(url)
+                return None
+            return {"url": url}
+
+        session = FakeGraphSession(handler)
+        urls = ["0/insights", "1/insights"]
+        self.assertEqual(graph_batch_get(session, urls), [{"url": u} for u in urls])
+        self.assertEqual(session.batches, [urls, ["1/insights"]])
+
+        with self.assertRaises(requests.Timeout):
+            graph_batch_get(FakeGraphSession(lambda url: None), urls)
+
+    def test_collect_insights_paging(self):
+        def handler(url):
+            if "since=" in url:
+                return {
+                    "data": [{"values": [{"value": 1}, {"value": 2}]}],
+                    "paging": {
+                        "next": "https://graph.facebook.com/v19.0/1/insights?page=2"
+                    },
+                }
+            # Next pages are requested without the version of their link
+            self.assertEqual(url, "1/insights?page=2")
+            # Days after the end are ignored
+            return {"data": [{"values": [{"value": 3}, {"value": 4}, {"value": 5}]}]}
+
+        session = FakeGraphSession(handler)
+        measurements = collect_insights(
+            session,
+            [
+                InsightsQuery(
+                    "1", "page_views", None, date(2024, 1, 1), date(2024, 1, 4)
+                )
+            ],
+            max_days=90,
+        )
+        self.assertEqual(
+            measurements,
+            [
+                [
+                    MeasurementTuple(date=date(2024, 1, 1), value=1),
+                    MeasurementTuple(date=date(2024, 1, 2), value=2),
+                    MeasurementTuple(date=date(2024, 1, 3), value=3),
+                    MeasurementTuple(date=date(2024, 1, 4), value=4),
+                ]
+            ],
+        )
+        self.assertEqual(len(session.batches), 2)
+
+    def test_pace_graph_usage(self):
+        response = requests.Response()
+        response.headers["x-app-usage"] = json.dumps({"call_count": 50})
+        pace_graph_usage(response)
+
+        response.headers["x-app-usage"] = json.dumps({"call_count": 100})
+        with self.assertRaises(RateLimitExceeded) as cm:
+            pace_graph_usage(response)
+        self.assertEqual(cm.exception.retry_after, 30)
+
+        response.headers["x-business-use-case-usage"] = json.dumps(
+            {"1": [{"call_count": 100, "estimated_time_to_regain_access": 5}]}
+        )
+        with self.assertRaises(RateLimitExceeded) as cm:
+            pace_graph_usage(response)
+        self.assertEqual(cm.exception.retry_after, 5 * 60)
@@ -0,0 +1,110 @@
+from datetime import date
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from integrations.base import MeasurementTuple, UserFixableError
+from integrations.implementations import google_bigquery
+from integrations.implementations.google_bigquery import GoogleBigQuery
+
+FIELDS = [{"name": "date"}, {"name": "value"}]
+
+
+def json_response(data):
+    response = MagicMock()
+    response.json.return_value = data
+    return response
+
+
+def row(day, value):
+    return {"f": [{"v": day}, {"v": value}]}
+
+
+class UnitTestCase(TestCase):
+    def setUp(self):
+        self.integration = GoogleBigQuery(
+            {
+                "project_id": "project",
+                "sql_query_template": "SELECT date, value FROM t"
+                " WHERE date BETWEEN @date_start AND @date_end",
+            },
+            credentials={
+                "access_token": "access",
+                "refresh_token": "refresh",
+                "token_type": "Bearer",
+            },
+            credentials_updater=lambda credentials: None,
+        )
+        self.posted = []
+
+    def post(self, url, json=None, params=None):
+        self.posted.append(url)
+        return json_response(
+            {"jobReference": {"jobId": "job", "location": "EU"}}
+            if url.endswith("/jobs")
+            else {}
+        )
+
+    def test_poll_until_complete(self):
+        pages = [
+            {"jobComplete": False},
+            {"jobComplete": False},
+            {
+                "jobComplete": True,
+                "schema": {"fields": FIELDS},
+                "rows": [row("2024-01-01", "1")],
+                "pageToken": "page2",
+            },
+            {"rows": [row("2024-01-02", "2")]},
+        ]
+        with patch.object(
+            self.integration.session, "post", side_effect=self.post
+        ), patch.object(
+            self.integration.session,
+            "get",
+            side_effect=lambda url, params: json_response(pages.pop(0)),
+        ) as get, patch(
+            "time.sleep"
+        ) as sleep:
+            measurements = list(
+                self.integration.collect_past_range(date(2024, 1, 1), date(2024, 1, 2))
+            )
+        self.assertEqual(
+            measurements,
+            [
+                MeasurementTuple(date=date(2024, 1, 1), value=1.0),
+                MeasurementTuple(date=date(2024, 1, 2), value=2.0),
+            ],
+        )
+        # Polls back off
+        self.assertEqual([c.args[0] for c in sleep.call_args_list], [1, 2])
+        self.assertEqual(get.call_args_list[-1].kwargs["params"]["pageToken"], "page2")
+
+    def test_poll_timeout(self):
+        now = [0.0]
+
+        def sleep(seconds):
+            now[0] += seconds
+
+        with patch.object(
+            self.integration.session, "post", side_effect=self.post
+        ), patch.object(
+            self.integration.session,
+            "get",
+            return_value=json_response({"jobComplete": False}),
+        ), patch(
+            "time.sleep", side_effect=sleep
+        ) as sleep_, patch(
+            "time.monotonic", side_effect=lambda: now[0]
+        ), patch.object(
+            google_bigquery, "POLL_MAX_DURATION", 10
+        ):
+            with self.assertRaises(UserFixableError):
+                list(
+                    self.integration.collect_past_range(
+                        date(2024, 1, 1), date(2024, 1, 2)
+                    )
+                )
+        # Waited 1 + 2 + 4 seconds, the next poll would be too late
+        self.assertEqual(sleep_.call_count, 3)
+        # The job is cancelled
+        self.assertTrue(self.posted[-1].endswith("/jobs/job/cancel"))
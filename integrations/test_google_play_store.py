@@ -0,0 +1,68 @@
+import uuid
+from datetime import date, timedelta
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from integrations.base import MeasurementTuple
+from integrations.implementations.google_play_store import GooglePlayStore
+
+REPORT = (
+    "Date,Package Name,Active Device Installs\n"
+    "{month}-01,com.acme,10\n"
+    "{month}-02,com.acme,12\n"
+)
+
+
+class UnitTestCase(TestCase):
+    def setUp(self):
+        self.integration = GooglePlayStore(
+            {
+                "developer_id": "123",
+                "package_name": "com.acme",
+                "metric": "Active Device Installs",
+            },
+            credentials={
+                "access_token": "access",
+                # Unique credentials, as the cache is shared between tests
+                "refresh_token": str(uuid.uuid4()),
+                "token_type": "Bearer",
+            },
+            credentials_updater=lambda credentials: None,
+        )
+
+    def collect(self, date_start):
+        def get(url, headers=None):
+            response = MagicMock()
+            response.text = REPORT.format(month=date_start.strftime("%Y-%m"))
+            response.headers = {"x-goog-generation": "1"}
+            return response
+
+        with patch.object(self.integration.session, "get", side_effect=get) as get_:
+            measurements = list(
+                self.integration.collect_past_range(
+                    date_start=date_start, date_end=date_start + timedelta(days=1)
+                )
+            )
+        self.assertEqual(
+            measurements,
+            [
+                MeasurementTuple(date=date_start, value=10),
+                MeasurementTuple(date=date_start + timedelta(days=1), value=12),
+            ],
+        )
+        return get_.call_args_list
+
+    def test_closed_month_cached(self):
+        calls = self.collect(date(2024, 1, 1))
+        self.assertEqual(len(calls), 1)
+        # Closed reports aren't stored in the response cache as well
+        self.assertEqual(calls[0].kwargs["headers"], {"Cache-Control": "no-store"})
+        self.assertEqual(self.collect(date(2024, 1, 1)), [])
+
+    def test_open_month_revalidated(self):
+        month_start = date.today().replace(day=1)
+        for _ in range(2):
+            calls = self.collect(month_start)
+            self.assertEqual(len(calls), 1)
+            # Left to the response cache
+            self.assertIsNone(calls[0].kwargs["headers"])
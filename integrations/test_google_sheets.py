@@ -0,0 +1,86 @@
+from datetime import date
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from integrations.base import MeasurementTuple
+from integrations.implementations.google_sheets import GoogleSheets
+
+# 2024-01-01 to 2024-01-03, as serial numbers
+ROWS = [
+    ["Date", "Notes", "Value", "Team"],
+    [45292, "x", 1, "a"],
+    [45293, "", 2, "b"],
+    [45294, "y", 3, "a"],
+]
+
+
+class UnitTestCase(TestCase):
+    def setUp(self):
+        self.requests = []
+
+    def integration(self, sheet_range):
+        return GoogleSheets(
+            {
+                "spreadsheet_id": "spreadsheet",
+                "sheet_range": sheet_range,
+                "date_column": "Date",
+                "value_column": "Value",
+                "filters": [{"column": "Team", "value": "a"}],
+            },
+            credentials={
+                "access_token": "access",
+                "refresh_token": "refresh",
+                "token_type": "Bearer",
+            },
+            credentials_updater=lambda credentials: None,
+        )
+
+    def get(self, url, params=None):
+        path = url.split("/spreadsheets/spreadsheet/")[1]
+        self.requests.append((path, params))
+        response = MagicMock()
+        if path.endswith("!1:1"):
+            response.json.return_value = {"values": ROWS[:1]}
+        elif path == "values:batchGet":
+            value_ranges = []
+            for value_range in params["ranges"]:
+                index = ord(value_range.split("!")[1][0]) - ord("A")
+                column = [row[index] for row in ROWS[1:]]
+                # Trailing empty cells are omitted
+                while column and column[-1] == "":
+                    column.pop()
+                value_ranges.append({"values": [column]})
+            response.json.return_value = {"valueRanges": value_ranges}
+        else:
+            response.json.return_value = {"values": ROWS}
+        return response
+
+    def collect(self, integration):
+        with patch.object(integration.session, "get", side_effect=self.get):
+            return list(
+                integration.collect_past_range(date(2024, 1, 1), date(2024, 1, 3))
+            )
+
+    def test_read_needed_columns(self):
+        measurements = self.collect(self.integration("Sheet 1"))
+        self.assertEqual(
+            measurements,
+            [
+                MeasurementTuple(date=date(2024, 1, 1), value=1.0),
+                MeasurementTuple(date=date(2024, 1, 3), value=3.0),
+            ],
+        )
+        # Only the header, then the date, value and filter columns are read
+        self.assertEqual(
+            [path for path, _ in self.requests],
+            ["values/'Sheet 1'!1:1", "values:batchGet"],
+        )
+        self.assertEqual(
+            self.requests[1][1]["ranges"],
+            ["'Sheet 1'!A2:A", "'Sheet 1'!C2:C", "'Sheet 1'!D2:D"],
+        )
+
+    def test_read_explicit_range(self):
+        measurements = self.collect(self.integration("Sheet 1!A1:D4"))
+        self.assertEqual([m.value for m in measurements], [1.0, 3.0])
+        self.assertEqual([path for path, _ in self.requests], ["values/Sheet 1!A1:D4"])
@@ -0,0 +1,41 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase
+
+from integrations.http import pool_stats, pooled_session
+
+
+class Handler(BaseHTTPRequestHandler):
+    # Keeps connections alive
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = self.headers.get("Authorization", "").encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class UnitTestCase(TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_sessions_share_connections(self):
+        for token in ["a", "b", "c"]:
+            with pooled_session() as session:
+                session.headers.update({"Authorization": token})
+                # Credentials stay per session
+                self.assertEqual(session.get(self.url).text, token)
+        stats = pool_stats()[f"http://127.0.0.1:{self.server.server_port}"]
+        self.assertEqual(stats["connections"], 1)
+        self.assertEqual(stats["reused"], 2)
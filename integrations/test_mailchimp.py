@@ -0,0 +1,85 @@
+from datetime import date, timedelta
+from typing import FrozenSet
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from integrations.base import MeasurementTuple
+from integrations.implementations.mailchimp import Mailchimp
+
+
+class UnitTestCase(TestCase):
+    def setUp(self):
+        self.integration = Mailchimp(
+            {"list": "list", "statistic": "subs"},
+            credentials={"access_token": "access", "token_type": "Bearer"},
+            credentials_updater=lambda credentials: None,
+        )
+        self.integration.api_endpoint = "https://us1.api.mailchimp.com"
+        self.offsets = []
+
+    def collect(
+        self, date_start, date_end, missing_days: FrozenSet[date] = frozenset()
+    ):
+        # A row per day of the last 180 days, starting with today
+        days = [
+            day
+            for day in (date.today() - timedelta(days=i) for i in range(180))
+            if day not in missing_days
+        ]
+
+        def get(url, params):
+            self.offsets.append(params["offset"])
+            rows = days[params["offset"] : params["offset"] + params["count"]]
+            response = MagicMock()
+            response.json.return_value = {
+                "activity": [
+                    {"day": day.isoformat(), "subs": day.toordinal()} for day in rows
+                ]
+            }
+            return response
+
+        with patch.object(self.integration.session, "get", side_effect=get):
+            return list(self.integration.collect_past_range(date_start, date_end))
+
+    def expected(
+        self, date_start, date_end, missing_days: FrozenSet[date] = frozenset()
+    ):
+        days = (
+            date_start + timedelta(days=i)
+            for i in range((date_end - date_start).days + 1)
+        )
+        return [
+            MeasurementTuple(date=day, value=day.toordinal())
+            for day in days
+            if day not in missing_days
+        ]
+
+    def test_seek_to_range(self):
+        date_end = date.today() - timedelta(days=100)
+        date_start = date_end - timedelta(days=9)
+        self.assertEqual(
+            self.collect(date_start, date_end), self.expected(date_start, date_end)
+        )
+        # The range is read directly
+        self.assertEqual(self.offsets, [99])
+
+    def test_seek_back_over_missing_days(self):
+        date_end = date.today() - timedelta(days=100)
+        date_start = date_end - timedelta(days=9)
+        # Days before the range are missing, shifting it to lower offsets
+        missing_days = {date.today() - timedelta(days=i) for i in range(20, 40)}
+        self.assertEqual(
+            self.collect(date_start, date_end, missing_days),
+            self.expected(date_start, date_end),
+        )
+        self.assertEqual(self.offsets[0], 99)
+        self.assertLess(self.offsets[-1], 99)
+
+    def test_missing_days_in_range(self):
+        date_end = date.today() - timedelta(days=10)
+        date_start = date_end - timedelta(days=9)
+        missing_days = {date_start + timedelta(days=3)}
+        self.assertEqual(
+            self.collect(date_start, date_end, missing_days),
+            self.expected(date_start, date_end, missing_days),
+        )
@@ -0,0 +1,72 @@
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from integrations.implementations.pipedrive import Pipedrive
+
+DEALS = [{"id": i, "pipeline_id": 1 if i % 3 else 2} for i in range(7)]
+
+
+class UnitTestCase(TestCase):
+    def setUp(self):
+        self.integration = Pipedrive(
+            None,
+            credentials={
+                "access_token": "access",
+                "refresh_token": "refresh",
+                "token_type": "Bearer",
+            },
+            credentials_updater=lambda credentials: None,
+        )
+        self.requests = []
+
+    def get(self, url, params=None):
+        self.requests.append((url.split("/v1/")[1], params))
+        response = MagicMock()
+        if url.endswith("/deals/summary"):
+            response.json.return_value = {"data": {"total_count": 42}}
+        elif "/stages/" in url:
+            response.json.return_value = {"data": {"pipeline_id": 1}}
+        else:
+            # Pages of 3 deals
+            start = params["start"]
+            more = start + 3 < len(DEALS)
+            response.json.return_value = {
+                "data": DEALS[start : start + 3],
+                "additional_data": {
+                    "pagination": {
+                        "more_items_in_collection": more,
+                        "next_start": start + 3 if more else None,
+                    }
+                },
+            }
+        return response
+
+    def count_deals(self, pipeline, stage, status):
+        with patch.object(self.integration.session, "get", side_effect=self.get):
+            return self.integration._count_deals(pipeline, stage, status)
+
+    def test_summary(self):
+        self.assertEqual(self.count_deals("<any>", "<any>", "all_not_deleted"), 42)
+        # Summaries include all deals that aren't deleted by default
+        self.assertEqual(self.requests, [("deals/summary", {})])
+
+    def test_summary_with_stage(self):
+        # The stage determines the pipeline
+        self.assertEqual(self.count_deals("1", "5", "won"), 42)
+        self.assertEqual(
+            self.requests,
+            [
+                ("stages/5", None),
+                ("deals/summary", {"status": "won", "stage_id": "5"}),
+            ],
+        )
+
+    def test_stage_of_another_pipeline(self):
+        self.assertEqual(self.count_deals("2", "5", "won"), 0)
+        self.assertEqual(self.requests, [("stages/5", None)])
+
+    def test_stream_and_count(self):
+        # Deals are filtered by pipeline locally
+        self.assertEqual(self.count_deals("2", "<any>", "open"), 3)
+        self.assertEqual([url for url, _ in self.requests], ["deals"] * 3)
+        self.assertEqual([params["start"] for _, params in self.requests], [0, 3, 6])
@@ -0,0 +1,86 @@
+import threading
+from datetime import date
+from typing import List
+from unittest import TestCase
+from unittest.mock import MagicMock
+from urllib.parse import parse_qs, urlparse
+
+from integrations.base import MeasurementTuple
+from integrations.implementations.plausible import Plausible
+
+
+class FakePlausibleSession:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.urls: List[str] = []
+        self.timeseries_params = None
+
+    def get(self, url, params=None):
+        with self.lock:
+            self.urls.append(url)
+        response = MagicMock()
+        if url.endswith("/timeseries"):
+            self.timeseries_params = params
+            # Days without data can be missing, or null
+            response.json.return_value = {
+                "results": [
+                    {"date": "2024-01-01", "visitors": 10},
+                    {"date": "2024-01-03", "visitors": None},
+                ]
+            }
+        else:
+            day = parse_qs(urlparse(url).query)["date"][0]
+            response.json.return_value = {
+                "results": {"visitors": {"value": int(day[-2:]) * 100}}
+            }
+        return response
+
+
+class UnitTestCase(TestCase):
+    def integration(self, aggregation_period):
+        integration = Plausible(
+            {
+                "api_key": "key",
+                "site_id": "example.com",
+                "metric": "visitors",
+                "aggregation_period": aggregation_period,
+                "filters": [],
+            }
+        )
+        integration.r = FakePlausibleSession()
+        return integration
+
+    def test_collect_past_range_timeseries(self):
+        integration = self.integration("day")
+        measurements = integration.collect_past_range(
+            date_start=date(2024, 1, 1), date_end=date(2024, 1, 3)
+        )
+        self.assertEqual(
+            list(measurements),
+            [
+                MeasurementTuple(date=date(2024, 1, 1), value=10),
+                MeasurementTuple(date=date(2024, 1, 2), value=0),
+                MeasurementTuple(date=date(2024, 1, 3), value=0),
+            ],
+        )
+        self.assertEqual(len(integration.r.urls), 1)
+        self.assertEqual(
+            integration.r.timeseries_params["date"], "2024-01-01,2024-01-03"
+        )
+
+    def test_collect_past_range_rolling(self):
+        # Rolling periods are still aggregated one day at a time
+        integration = self.integration("7d")
+        measurements = integration.collect_past_range(
+            date_start=date(2024, 1, 1), date_end=date(2024, 1, 3)
+        )
+        self.assertEqual(
+            list(measurements),
+            [
+                MeasurementTuple(date=date(2024, 1, day), value=day * 100)
+                for day in range(1, 4)
+            ],
+        )
+        self.assertEqual(len(integration.r.urls), 3)
+        self.assertTrue(all("/aggregate?" in url for url in integration.r.urls))
+        self.assertTrue(all("period=7d" in url for url in integration.r.urls))
@@ -0,0 +1,51 @@
+from unittest import TestCase
+
+from integrations.implementations.posthog import _rewrite_as_range_query
+
+
+class UnitTestCase(TestCase):
+    def test_rewrite_as_range_query(self):
+        self.assertEqual(
+            _rewrite_as_range_query(
+                "SELECT COUNT(*) as value\nFROM events\n"
+                "WHERE event = 'signup' AND toStartOfDay(timestamp) == %(date)s"
+            ),
+            "SELECT toStartOfDay(timestamp) AS date, COUNT(*) AS value\n"
+            "FROM events\n"
+            "WHERE event = 'signup' AND toStartOfDay(timestamp) >= %(date_start)s"
+            " AND toStartOfDay(timestamp) <= %(date_end)s\n"
+            "GROUP BY date\n"
+            "ORDER BY date\n"
+            "LIMIT 100",
+        )
+        # ORs nested in a condition are kept as is
+        self.assertIsNotNone(
+            _rewrite_as_range_query(
+                "SELECT count() FROM events WHERE (event = 'a' OR event = 'b')"
+                " AND toStartOfDay(timestamp) = %(date)s"
+            )
+        )
+
+    def test_rewrite_as_range_query_unsupported(self):
+        for query in [
+            # Subquery
+            "SELECT count() FROM (SELECT DISTINCT person_id FROM events"
+            " WHERE toStartOfDay(timestamp) == %(date)s)",
+            # Top-level OR
+            "SELECT count() FROM events"
+            " WHERE event = 'a' OR toStartOfDay(timestamp) == %(date)s",
+            # OR with the day filter
+            "SELECT count() FROM events"
+            " WHERE (event = 'a' OR toStartOfDay(timestamp) == %(date)s)",
+            # JOIN
+            "SELECT count() FROM events e JOIN persons p ON e.person_id = p.id"
+            " WHERE toStartOfDay(e.timestamp) == %(date)s",
+            # Already grouped
+            "SELECT count() FROM events"
+            " WHERE toStartOfDay(timestamp) == %(date)s GROUP BY event",
+            # Not an aggregate
+            "SELECT avg(value) FROM events"
+            " WHERE toStartOfDay(timestamp) == %(date)s",
+        ]:
+            with self.subTest(query=query):
+                self.assertIsNone(_rewrite_as_range_query(query))
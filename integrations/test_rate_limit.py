@@ -0,0 +1,47 @@
+import uuid
+from unittest import TestCase
+
+from integrations.rate_limit import (
+    MAX_WAIT,
+    RateLimit,
+    RateLimitExceeded,
+    TokenBucket,
+    bucket_name,
+    get_redis_client,
+)
+
+
+class UnitTestCase(TestCase):
+    def setUp(self):
+        self.name = f"test:{uuid.uuid4()}"
+
+    def tearDown(self):
+        get_redis_client().delete(f"ratelimit:{self.name}")
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(self.name, RateLimit(2, 10))
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertEqual(bucket.reserve(), 0)
+        # Bucket is empty: the next token is available after 10 / 2 seconds
+        self.assertAlmostEqual(bucket.reserve(), 5, delta=0.5)
+        # Tokens already reserved by others queue up
+        self.assertAlmostEqual(bucket.reserve(), 10, delta=0.5)
+
+    def test_token_bucket_max_wait(self):
+        bucket = TokenBucket(self.name, RateLimit(1, MAX_WAIT * 2))
+        bucket.reserve()
+        with self.assertRaises(RateLimitExceeded):
+            bucket.reserve()
+
+    def test_token_bucket_count(self):
+        bucket = TokenBucket(self.name, RateLimit(10, 10))
+        self.assertEqual(bucket.reserve(10), 0)
+        # A batch of 5 calls waits for 5 tokens
+        self.assertAlmostEqual(bucket.reserve(5), 5, delta=0.5)
+        with self.assertRaises(RateLimitExceeded) as cm:
+            bucket.reserve(MAX_WAIT)
+        self.assertAlmostEqual(cm.exception.retry_after, MAX_WAIT + 5, delta=0.5)
+
+    def test_bucket_name_hides_key(self):
+        self.assertEqual(bucket_name("github"), "github")
+        self.assertNotIn("secret_token", bucket_name("github", "secret_token"))
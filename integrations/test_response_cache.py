@@ -0,0 +1,88 @@
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from integrations.http import PooledAdapter, mount_adapter
+from integrations.response_cache import ConditionalCacheAdapter, response_cache_stats
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    etag = '"v1"'
+
+    def do_GET(self):
+        self.server.client_ports.add(self.client_address[1])
+        if self.headers.get("If-None-Match") == self.etag:
+            self.send_response(304)
+            self.send_header("ETag", self.etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = b"a,b\n1,2\n"
+        self.send_response(200)
+        self.send_header("ETag", self.etag)
+        self.send_header("Content-Type", "text/csv; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class UnitTestCase(TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.client_ports = set()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.host = f"127.0.0.1:{self.server.server_port}"
+        self.namespace = str(uuid.uuid4())
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get(self, namespace, headers=None):
+        with requests.Session() as session:
+            mount_adapter(
+                session, ConditionalCacheAdapter(PooledAdapter(), lambda: namespace)
+            )
+            return session.get(f"http://{self.host}/report.csv", headers=headers)
+
+    def test_replay_on_not_modified(self):
+        first = self.get(self.namespace)
+        second = self.get(self.namespace)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.text, first.text)
+        self.assertEqual(second.headers["Content-Type"], "text/csv; charset=utf-8")
+        self.assertEqual(
+            response_cache_stats()[self.host], {"hits": 1, "misses": 1, "stored": 1}
+        )
+        # Other credentials don't share the cache
+        self.get(str(uuid.uuid4()))
+        self.assertEqual(response_cache_stats()[self.host]["misses"], 2)
+
+    def test_no_store(self):
+        response = self.get(self.namespace, headers={"Cache-Control": "no-store"})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(self.host, response_cache_stats())
+        # Nothing was stored
+        self.get(self.namespace)
+        self.assertEqual(
+            response_cache_stats()[self.host], {"hits": 0, "misses": 1, "stored": 1}
+        )
+
+    def test_connection_reused_on_not_modified(self):
+        adapter = HTTPAdapter()
+        with requests.Session() as session:
+            mount_adapter(
+                session, ConditionalCacheAdapter(adapter, lambda: self.namespace)
+            )
+            for _ in range(3):
+                session.get(f"http://{self.host}/report.csv")
+        # Replayed responses released their connection
+        self.assertEqual(len(self.server.client_ports), 1)
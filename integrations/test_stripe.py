@@ -0,0 +1,67 @@
+from datetime import date, datetime
+from typing import List
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from integrations.base import MeasurementTuple
+from integrations.implementations.stripe import Stripe
+
+# Creation times, in the local time like the days they are bucketed in
+CUSTOMERS = [
+    {"id": f"cus_{i}", "created": int(created.timestamp())}
+    for i, created in enumerate(
+        [
+            datetime(2023, 12, 31, 12),
+            datetime(2024, 1, 2, 0, 0, 1),
+            datetime(2024, 1, 2, 23, 59),
+            datetime(2024, 1, 4, 8),
+        ]
+    )
+]
+
+
+class FakeListSession:
+    """Answers /v1/customers with `page_size` customers per page"""
+
+    def __init__(self, page_size: int):
+        self.page_size = page_size
+        self.requests: List[dict] = []
+
+    def get(self, url, params):
+        self.requests.append(params)
+        customers = [c for c in CUSTOMERS if c["created"] <= params["created[lte]"]]
+        index = 0
+        if "starting_after" in params:
+            index = [c["id"] for c in customers].index(params["starting_after"]) + 1
+        page = customers[index : index + self.page_size]
+        response = MagicMock()
+        response.json.return_value = {
+            "data": page,
+            "has_more": index + self.page_size < len(customers),
+        }
+        return response
+
+
+class UnitTestCase(TestCase):
+    def test_collect_past_range_customer_count(self):
+        integration = Stripe(
+            {"metric": "customer_count"}, {"stripe_user_id": "acct"}, lambda c: None
+        )
+        integration.r = FakeListSession(page_size=2)
+        measurements = integration.collect_past_range(
+            date_start=date(2024, 1, 1), date_end=date(2024, 1, 3)
+        )
+        self.assertEqual(
+            measurements,
+            [
+                MeasurementTuple(date=date(2024, 1, 1), value=1),
+                MeasurementTuple(date=date(2024, 1, 2), value=3),
+                MeasurementTuple(date=date(2024, 1, 3), value=3),
+            ],
+        )
+        # Customers are listed once for the whole range, up to its last day
+        self.assertEqual(len(integration.r.requests), 2)
+        self.assertEqual(
+            integration.r.requests[0]["created[lte]"],
+            int(datetime(2024, 1, 3, 23, 59, 59).timestamp()),
+        )
@@ -0,0 +1,88 @@
+import os
+import time
+from datetime import date, datetime, timedelta
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from integrations.base import MeasurementTuple
+from integrations.implementations.twitter import Twitter
+
+# Mentions per UTC day
+MENTIONS = {date(2024, 1, 1): 3, date(2024, 1, 3): 5, date(2024, 1, 4): 7}
+
+
+class FakeCountsSession:
+    """Answers /tweets/counts/recent with one bucket per day, a page each"""
+
+    def __init__(self):
+        self.requests = []
+
+    def get(self, url, params):
+        self.requests.append(params)
+        start = datetime.fromisoformat(params["start_time"].replace("Z", "+00:00"))
+        end = datetime.fromisoformat(params["end_time"].replace("Z", "+00:00"))
+        if params.get("next_token"):
+            start = datetime.fromisoformat(params["next_token"])
+        # Days without mentions have no bucket
+        buckets = []
+        if start.date() in MENTIONS:
+            buckets.append(
+                {
+                    "start": start.isoformat().replace("+00:00", "Z"),
+                    "tweet_count": MENTIONS[start.date()],
+                }
+            )
+        next_start = start + timedelta(days=1)
+        response = MagicMock()
+        response.json.return_value = {
+            "data": buckets,
+            "meta": {
+                "next_token": next_start.isoformat() if next_start < end else None
+            },
+        }
+        return response
+
+
+class UnitTestCase(TestCase):
+    def setUp(self):
+        self.integration = Twitter({"account": "@acme", "metric": "mention_count"})
+        self.integration.session = FakeCountsSession()
+
+    def test_collect_past_range(self):
+        measurements = self.integration.collect_past_range(
+            date_start=date(2024, 1, 1), date_end=date(2024, 1, 3)
+        )
+        self.assertEqual(
+            measurements,
+            [
+                MeasurementTuple(date=date(2024, 1, 1), value=3),
+                MeasurementTuple(date=date(2024, 1, 2), value=0),
+                MeasurementTuple(date=date(2024, 1, 3), value=5),
+            ],
+        )
+        # Same counts as collecting each day on its own
+        self.assertEqual(
+            measurements,
+            [self.integration.collect_past(date(2024, 1, day)) for day in range(1, 4)],
+        )
+
+    def test_collect_past_range_utc(self):
+        # Days don't depend on the timezone of the server
+        try:
+            with patch.dict(os.environ, {"TZ": "America/New_York"}):
+                time.tzset()
+                measurements = self.integration.collect_past_range(
+                    date_start=date(2024, 1, 3), date_end=date(2024, 1, 4)
+                )
+        finally:
+            time.tzset()
+        self.assertEqual(
+            self.integration.session.requests[0]["start_time"], "2024-01-03T00:00:00Z"
+        )
+        self.assertEqual(
+            measurements,
+            [
+                MeasurementTuple(date=date(2024, 1, 3), value=5),
+                MeasurementTuple(date=date(2024, 1, 4), value=7),
+            ],
+        )
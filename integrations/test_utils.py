@@ -1,7 +1,15 @@
 from unittest import TestCase
 
 from integrations import INTEGRATION_CLASSES
-from integrations.utils import deofuscate_protected_fields, obfuscate_protected_fields
+from integrations.utils import (
+    deofuscate_protected_fields,
+    obfuscate_protected_fields,
+    paginate,
+    paginate_offset,
+    pagination_stats,
+)
+
+ROWS = list(range(25))
 
 
 class UnitTestCase(TestCase):
@@ -64,3 +72,28 @@ class UnitTestCase(TestCase):
                 "sql_query_template": "y",
             },
         )
+
+    def test_paginate_offset(self):
+        offsets = []
+
+        def fetch_rows(offset):
+            offsets.append(offset)
+            return ROWS[offset : offset + 10]
+
+        for prefetch in [False, True]:
+            offsets.clear()
+            rows = list(paginate_offset(fetch_rows, page_size=10, prefetch=prefetch))
+            self.assertEqual(rows, ROWS)
+            self.assertEqual(offsets, [0, 10, 20])
+        self.assertEqual(pagination_stats()[fetch_rows.__qualname__]["pages"], 6)
+
+    def test_paginate_cursor(self):
+        def fetch_page(cursor):
+            start = int(cursor or 0)
+            next_cursor = str(start + 10) if start + 10 < len(ROWS) else None
+            return ROWS[start : start + 10], next_cursor
+
+        # Rows are yielded lazily: only the first page is fetched
+        self.assertEqual(next(iter(paginate(fetch_page))), 0)
+        self.assertEqual(pagination_stats()[fetch_page.__qualname__]["pages"], 1)
+        self.assertEqual(list(paginate(fetch_page, prefetch=True)), ROWS)
@@ -1,6 +1,24 @@
 import copy
+import logging
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date
-from typing import Any, Dict, Iterable, List, Optional, Protocol, Type, TypeVar, cast
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Protocol,
+    Tuple,
+    Type,
+    TypeVar,
+    cast,
+)
 
 import pandas as pd
 from environs import Env
@@ -10,6 +28,8 @@ from .base import Integration, MeasurementTuple
 env = Env()
 env.read_env()  # read .env file, if it exists
 
+logger = logging.getLogger(__name__)
+
 
 def get_secret(key):
     return env.str(key, default=None)
@@ -97,6 +117,104 @@ def fill_mesurement_range(
     ]
 
 
+# Pagination
+
+R = TypeVar("R")
+# Identifies a page: an offset, a cursor, a page token, a next link..
+K = TypeVar("K")
+
+_pagination_stats: Dict[str, Dict[str, float]] = defaultdict(
+    lambda: {"pages": 0, "seconds": 0.0, "max_seconds": 0.0}
+)
+_pagination_stats_lock = threading.Lock()
+
+
+def pagination_stats() -> Dict[str, Dict[str, float]]:
+    """Number of pages fetched and time spent fetching them, per paginated query"""
+    with _pagination_stats_lock:
+        return {name: dict(stats) for name, stats in _pagination_stats.items()}
+
+
+def _record_page_latency(name: str, seconds: float) -> None:
+    logger.debug(f"Fetched page of {name} in {seconds:.3f}s")
+    with _pagination_stats_lock:
+        stats = _pagination_stats[name]
+        stats["pages"] += 1
+        stats["seconds"] += seconds
+        stats["max_seconds"] = max(stats["max_seconds"], seconds)
+
+
+def paginate(
+    fetch_page: Callable[[Optional[K]], Tuple[List[R], Optional[K]]],
+    first: Optional[K] = None,
+    prefetch: bool = False,
+) -> Iterator[R]:
+    """
+    Lazily yields the rows of all pages. `fetch_page` is called with the key
+    of the page to fetch (`first` for the first page), and returns its rows
+    along with the key of the next page, or None if it is the last one.
+
+    With `prefetch`, the next page is fetched in the background while rows
+    of the current one are consumed. The consumer must then not use the
+    session of `fetch_page` while iterating, and OAuth2 integrations must
+    call `refresh_token_ahead` beforehand.
+    """
+    name = getattr(fetch_page, "__qualname__", repr(fetch_page))
+
+    def timed_fetch_page(key: Optional[K]) -> Tuple[List[R], Optional[K]]:
+        start = time.monotonic()
+        page = fetch_page(key)
+        _record_page_latency(name, time.monotonic() - start)
+        return page
+
+    if not prefetch:
+        key = first
+        while True:
+            rows, key = timed_fetch_page(key)
+            yield from rows
+            if key is None:
+                return
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(timed_fetch_page, first)
+        while True:
+            rows, key = future.result()
+            if key is not None:
+                future = executor.submit(timed_fetch_page, key)
+            yield from rows
+            if key is None:
+                return
+
+
+def paginate_offset(
+    fetch_page: Callable[[int], List[R]],
+    page_size: int,
+    first: int = 0,
+    prefetch: bool = False,
+) -> Iterator[R]:
+    """
+    Paginates APIs that take an offset (start row, start index..) and return
+    at most `page_size` rows. A shorter page is the last one.
+    """
+
+    def fetch_offset_page(offset: Optional[int]) -> Tuple[List[R], Optional[int]]:
+        assert offset is not None
+        rows = fetch_page(offset)
+        assert len(rows) <= page_size, (
+            f"More rows returned ({len(rows)}) than requested ({page_size}). "
+            "Does this API support pagination?"
+        )
+        if len(rows) < page_size:
+            return rows, None
+        return rows, offset + len(rows)
+
+    # Report latencies under the name of the actual query
+    fetch_offset_page.__qualname__ = getattr(
+        fetch_page, "__qualname__", repr(fetch_page)
+    )
+    return paginate(fetch_offset_page, first=first, prefetch=prefetch)
+
+
 def obfuscate_protected_fields(
     config: Dict[str, Any],
     integration_class: Type[Integration],
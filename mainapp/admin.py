@@ -24,6 +24,31 @@ class MetricAdmin(admin.ModelAdmin):
     form = MetricAdminForm
 
 
+class CollectionRunAdmin(admin.ModelAdmin):
+    list_display = [
+        "created_at",
+        "scheduled_count",
+        "started_count",
+        "succeeded_count",
+        "failed_count",
+        "wall_clock_duration",
+    ]
+
+
+class BackfillAdmin(admin.ModelAdmin):
+    list_display = [
+        "created_at",
+        "metric",
+        "date_start",
+        "date_end",
+        "shard_count",
+        "finished_shard_count",
+        "collected_count",
+        "finished_at",
+        "failed_at",
+    ]
+
+
 admin.site.register(models.User)
 admin.site.register(models.Metric, MetricAdmin)
 admin.site.register(models.Measurement)
@@ -31,3 +56,5 @@ admin.site.register(models.Dashboard)
 admin.site.register(models.Organization)
 admin.site.register(models.OrganizationUser)
 admin.site.register(models.OrganizationInvitation)
+admin.site.register(models.CollectionRun, CollectionRunAdmin)
+admin.site.register(models.Backfill, BackfillAdmin)
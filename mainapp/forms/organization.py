@@ -24,9 +24,7 @@ class OrganizationForm(BaseModelForm):
             self.fields["slack_notifications_channel"].widget = forms.Select(
                 choices=(
                     (k, k)
-                    for k in slack_notifications.list_public_channels(
-                        self.instance.slack_notifications_credentials
-                    )
+                    for k in slack_notifications.list_public_channels(self.instance)
                 )
             )
         else:
@@ -37,6 +35,14 @@ class OrganizationForm(BaseModelForm):
             # This is a CreateForm
             return Organization.create(**self.cleaned_data)
         else:
+            if "slack_notifications_channel" in self.changed_data:
+                # Notifications are sent using the ID, which doesn't require
+                # listing channels
+                self.instance.slack_notifications_channel_id = (
+                    slack_notifications.find_channel_id(self.instance)
+                    if self.instance.slack_notifications_credentials
+                    else None
+                )
             return super().save(commit)
 
     class Meta:
@@ -0,0 +1,72 @@
+# Generated by Django 5.0.14 on 2026-10-17 06:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mainapp", "0024_metric_enable_spike_notifications_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CollectionRun",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "window",
+                    models.DurationField(
+                        help_text="Period over which the collection tasks were spread"
+                    ),
+                ),
+                ("scheduling_finished_at", models.DateTimeField(blank=True, null=True)),
+                ("scheduled_count", models.PositiveIntegerField(default=0)),
+                ("started_count", models.PositiveIntegerField(default=0)),
+                ("succeeded_count", models.PositiveIntegerField(default=0)),
+                ("failed_count", models.PositiveIntegerField(default=0)),
+                ("first_started_at", models.DateTimeField(blank=True, null=True)),
+                ("last_finished_at", models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name="metric",
+            name="integration_id",
+            field=models.CharField(
+                choices=[
+                    ("bluesky", "bluesky"),
+                    ("facebook", "facebook"),
+                    ("github", "github"),
+                    ("google_analytics", "google_analytics"),
+                    ("google_bigquery", "google_bigquery"),
+                    ("google_cloud_protected_api", "google_cloud_protected_api"),
+                    ("google_play_store", "google_play_store"),
+                    ("google_search_console", "google_search_console"),
+                    ("google_sheets", "google_sheets"),
+                    ("grafana", "grafana"),
+                    ("hubspot", "hubspot"),
+                    ("instagram", "instagram"),
+                    ("linkedin", "linkedin"),
+                    ("mailchimp", "mailchimp"),
+                    ("pipedrive", "pipedrive"),
+                    ("plausible", "plausible"),
+                    ("postgresql", "postgresql"),
+                    ("posthog", "posthog"),
+                    ("stripe", "stripe"),
+                    ("threads", "threads"),
+                    ("twitter", "twitter"),
+                    ("youtube", "youtube"),
+                ],
+                max_length=128,
+            ),
+        ),
+    ]
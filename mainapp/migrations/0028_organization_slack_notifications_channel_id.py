@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-17 06:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mainapp", "0027_backfillcheckpoint"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="organization",
+            name="slack_notifications_channel_id",
+            field=models.CharField(blank=True, max_length=32, null=True),
+        ),
+    ]
@@ -1,4 +1,6 @@
 # Re-export
+from .backfill import Backfill, BackfillCheckpoint  # noqa
+from .collection_run import CollectionRun  # noqa
 from .dashboard import Dashboard  # noqa
 from .marker import Marker  # noqa
 from .measurement import Measurement  # noqa
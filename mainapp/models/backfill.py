@@ -0,0 +1,56 @@
+from django.db import models
+from django.db.models import F
+from django.db.models.functions import Now
+
+from .metric import Metric
+from .user import User
+
+
+class Backfill(models.Model):
+    """Progress of a `backfill_task`, which is split in date shards"""
+
+    metric = models.ForeignKey(Metric, on_delete=models.CASCADE)
+    requested_by = models.ForeignKey(User, on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True)
+    date_start = models.DateField()
+    date_end = models.DateField()
+    shard_count = models.PositiveIntegerField(default=0)
+    finished_shard_count = models.PositiveIntegerField(default=0)
+    collected_count = models.PositiveIntegerField(default=0)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    failed_at = models.DateTimeField(blank=True, null=True)
+
+    # The following are called concurrently by the shards, and therefore
+    # use single UPDATE statements instead of read-modify-write
+    @classmethod
+    def add_progress(cls, pk: int, collected_count: int, shard_finished: bool) -> None:
+        cls.objects.filter(pk=pk).update(
+            collected_count=F("collected_count") + collected_count,
+            finished_shard_count=F("finished_shard_count") + int(shard_finished),
+        )
+
+    @classmethod
+    def mark_failed(cls, pk: int) -> bool:
+        """Returns True for the first failure only"""
+        return bool(
+            cls.objects.filter(pk=pk, failed_at__isnull=True).update(failed_at=Now())
+        )
+
+    def __str__(self):
+        return f"{self.metric} from {self.date_start} to {self.date_end} ({self.finished_shard_count}/{self.shard_count} shards)"
+
+
+class BackfillCheckpoint(models.Model):
+    """
+    Range of dates completely collected by a backfill. Checkpoints are
+    removed once the backfill finishes, and are otherwise used to resume it.
+    """
+
+    metric = models.ForeignKey(Metric, on_delete=models.CASCADE)
+    backfill = models.ForeignKey(Backfill, on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True)
+    date_start = models.DateField()
+    date_end = models.DateField()
+
+    def __str__(self):
+        return f"{self.metric} from {self.date_start} to {self.date_end}"
@@ -0,0 +1,52 @@
+from datetime import timedelta
+from typing import Optional
+
+from django.db import models
+from django.db.models import F
+from django.db.models.functions import Coalesce, Now
+
+
+class CollectionRun(models.Model):
+    """Summary of a `collect_all_latest_task` run"""
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    window = models.DurationField(
+        help_text="Period over which the collection tasks were spread"
+    )
+    scheduling_finished_at = models.DateTimeField(blank=True, null=True)
+    scheduled_count = models.PositiveIntegerField(default=0)
+    started_count = models.PositiveIntegerField(default=0)
+    succeeded_count = models.PositiveIntegerField(default=0)
+    failed_count = models.PositiveIntegerField(default=0)
+    first_started_at = models.DateTimeField(blank=True, null=True)
+    last_finished_at = models.DateTimeField(blank=True, null=True)
+
+    # The following are called concurrently by workers, and therefore
+    # use single UPDATE statements instead of read-modify-write
+    @classmethod
+    def mark_started(cls, pk: int) -> None:
+        cls.objects.filter(pk=pk).update(
+            started_count=F("started_count") + 1,
+            first_started_at=Coalesce(F("first_started_at"), Now()),
+        )
+
+    @classmethod
+    def mark_succeeded(cls, pk: int) -> None:
+        cls.objects.filter(pk=pk).update(
+            succeeded_count=F("succeeded_count") + 1, last_finished_at=Now()
+        )
+
+    @classmethod
+    def mark_failed(cls, pk: int) -> None:
+        cls.objects.filter(pk=pk).update(
+            failed_count=F("failed_count") + 1, last_finished_at=Now()
+        )
+
+    @property
+    def wall_clock_duration(self) -> Optional[timedelta]:
+        if not self.last_finished_at:
+            return None
+        return self.last_finished_at - self.created_at
+
+    def __str__(self):
+        return f"{self.created_at:%Y-%m-%d %H:%M} ({self.succeeded_count}/{self.scheduled_count} succeeded, {self.failed_count} failed)"
@@ -66,16 +66,23 @@ class Metric(models.Model):
     def save_integration_credentials(self):
         self.save()
 
+    def fetch_config_schema(self) -> Dict:
+        with self.integration_instance as inst:
+            # Note: the call might crash for some reason.
+            # We don't want to have a fallback here as there
+            # is no way the user can recover from this
+            # (it could be any error!)
+            return inst.callable_config_schema()
+
     def callable_config_schema(model_instance: Optional["Metric"] = None) -> Dict:
         # See https://django-jsonform.readthedocs.io/en/latest/fields-and-widgets.html#accessing-model-instance-in-callable-schema
         # `model_instance` will be None while creating new object
         if model_instance and model_instance.integration_id:
-            # Check if a callable schema exists
+            # Imported here, as tasks depend on models
+            from ..tasks import config_schemas
+
             instance_class = INTEGRATION_CLASSES[model_instance.integration_id]
-            if (
-                instance_class.callable_config_schema.__qualname__.split(".")[0]
-                == instance_class.__name__
-            ):
+            if config_schemas.has_callable_config_schema(instance_class):
                 # We will here attempt to __init__ and __enter__ an
                 # integration. This can cause it to crash if it e.g. hasn't
                 # been authenticated yet
@@ -85,12 +92,17 @@ class Metric(models.Model):
                     not model_instance.can_web_auth
                     or model_instance.integration_credentials
                 ):
-                    with model_instance.integration_instance as inst:
-                        # Note: the call might crash for some reason.
-                        # We don't want to have a fallback here as there
-                        # is no way the user can recover from this
-                        # (it could be any error!)
-                        return inst.callable_config_schema()
+                    # Listing accounts, projects.. can take seconds: schemas
+                    # are cached, and refreshed in the background once saved
+                    return config_schemas.get_config_schema(
+                        instance_class,
+                        model_instance.integration_config,
+                        model_instance.integration_credentials,
+                        model_instance.fetch_config_schema,
+                        metric_id=(
+                            None if model_instance._state.adding else model_instance.pk
+                        ),
+                    )
             # There's no callable schema
             return instance_class.config_schema
         # No model instance, return empty schema
@@ -125,6 +125,10 @@ class Organization(models.Model):
     slack_notifications_channel = models.CharField(
         max_length=128, blank=True, null=True
     )
+    # Resolved from the channel name, which can't be used to upload files
+    slack_notifications_channel_id = models.CharField(
+        max_length=32, blank=True, null=True
+    )
 
     @classmethod
     def create(cls, owner: "User", **kwargs) -> "Organization":
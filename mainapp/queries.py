@@ -1,11 +1,21 @@
 from datetime import date
-from typing import Iterable, List, Optional, Tuple
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Set, Tuple
 from uuid import UUID
 
 from django.db import connection
 
+from integrations.base import MeasurementTuple
+
 from .models import Measurement, Metric
 
+UPSERT_BATCH_SIZE = 500
+
+
+class UpsertResult(NamedTuple):
+    inserted: int
+    updated: int
+    unchanged: int
+
 
 def query_measurements_without_gaps(
     start_date: date, end_date: date, metric_id: UUID
@@ -80,3 +90,90 @@ def query_topk_dates(metric_id: UUID, topk=3) -> Iterable[date]:
             sort_field_arg
         )[:3]
     )
+
+
+def upsert_measurements(
+    metric_id: UUID, measurements: Sequence[MeasurementTuple]
+) -> UpsertResult:
+    """Inserts or updates measurements in a single statement, using the
+    `unique_measurement` (metric, date) constraint. Rows whose value didn't
+    change are left untouched (and keep their `updated_at`)."""
+    # A single INSERT can't affect the same row twice, so only the last
+    # value for each date is kept (like successive `update_or_create` calls)
+    values_by_date: Dict[date, float] = {m.date: m.value for m in measurements}
+    if not values_by_date:
+        return UpsertResult(inserted=0, updated=0, unchanged=0)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            INSERT INTO mainapp_measurement (metric_id, date, value, updated_at)
+            SELECT %s, UNNEST(%s::date[]), UNNEST(%s::double precision[]), NOW()
+            ON CONFLICT (metric_id, date) DO UPDATE
+            SET value = EXCLUDED.value, updated_at = EXCLUDED.updated_at
+            WHERE mainapp_measurement.value IS DISTINCT FROM EXCLUDED.value
+            RETURNING (xmax = 0) AS inserted;
+        """,
+            [metric_id, list(values_by_date.keys()), list(values_by_date.values())],
+        )
+        # Rows skipped by the WHERE clause are not returned
+        results: List[Tuple[bool]] = cursor.fetchall()
+    inserted = sum(1 for (is_insert,) in results if is_insert)
+    updated = len(results) - inserted
+    return UpsertResult(
+        inserted=inserted,
+        updated=updated,
+        unchanged=len(values_by_date) - inserted - updated,
+    )
+
+
+class MeasurementWriter:
+    """
+    Buffers measurements of a metric and upserts them in batches.
+    Pending measurements are written when the context exits, including when
+    an exception interrupted the collection (so that what was collected so
+    far is kept, as it would have been with row-by-row writes).
+    """
+
+    def __init__(self, metric_id: UUID, batch_size: int = UPSERT_BATCH_SIZE):
+        self.metric_id = metric_id
+        self.batch_size = batch_size
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+        # Last measurement that made it to the database
+        self.last_written: Optional[MeasurementTuple] = None
+        self.written_dates: Set[date] = set()
+        self._buffer: List[MeasurementTuple] = []
+
+    def __enter__(self) -> "MeasurementWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.flush()
+
+    @property
+    def count(self) -> int:
+        return self.inserted + self.updated + self.unchanged
+
+    def write(self, measurement: MeasurementTuple) -> None:
+        self._buffer.append(measurement)
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def write_all(self, measurements: Iterable[MeasurementTuple]) -> None:
+        for measurement in measurements:
+            self.write(measurement)
+
+    def flush(self) -> None:
+        if not self._buffer:
+            return
+        result = upsert_measurements(self.metric_id, self._buffer)
+        self.inserted += result.inserted
+        self.updated += result.updated
+        self.unchanged += result.unchanged
+        self.last_written = self._buffer[-1]
+        self.written_dates.update(m.date for m in self._buffer)
+        self._buffer = []
+
+    def __str__(self):
+        return f"{self.inserted} inserted, {self.updated} updated, {self.unchanged} unchanged"
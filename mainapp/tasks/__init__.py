@@ -4,80 +4,130 @@ from datetime import date, datetime, timedelta, timezone
 from email.mime.image import MIMEImage
 from pprint import pformat
 from random import random
-from typing import Optional
+from typing import List, Optional
 from uuid import UUID
 
 import requests
-from celery import shared_task
-from celery.signals import task_failure
+from celery import chain, chord, group, shared_task
+from celery.signals import task_failure, worker_process_shutdown
 from celery.utils.log import get_task_logger
 from django.core.mail import EmailMultiAlternatives, mail_admins, send_mail
+from django.db import transaction
+from django.db.models.functions import Now
 from django.urls import reverse
 from django.utils.dateparse import parse_date, parse_duration
 from requests.exceptions import RequestException
 
-from config.settings import CSRF_TRUSTED_ORIGINS
+from config.settings import COLLECT_ALL_LATEST_WINDOW, CSRF_TRUSTED_ORIGINS
+from integrations import http, response_cache, utils
+from integrations.base import MeasurementTuple
+from integrations.rate_limit import RateLimitExceeded
 from mainapp.models.user import User
 from mainapp.tasks.error_handling import notify_metric_exception
 
-from ..models import Measurement, Metric, Organization
+from ..models import (
+    Backfill,
+    BackfillCheckpoint,
+    CollectionRun,
+    Measurement,
+    Metric,
+    Organization,
+)
+from ..queries import MeasurementWriter, upsert_measurements
 from ..utils import charts
-from . import metric_analyse, slack_notifications
+from . import (
+    coalescing,
+    config_schemas,
+    metric_analyse,
+    scheduling,
+    slack_notifications,
+)
 from .google_spreadsheet_export import spreadsheet_export
 
 BASE_URL = CSRF_TRUSTED_ORIGINS[0]
+# Checkpoints of backfills which didn't finish are used to resume them,
+# unless they are too old
+BACKFILL_CHECKPOINT_MAX_AGE = timedelta(days=7)
 
 logger = get_task_logger(__name__)
 
 
 @shared_task(max_retries=5, autoretry_for=(RequestException,), retry_backoff=10)
-def collect_latest_task(metric_id: UUID) -> None:
+def collect_latest_task(
+    metric_id: UUID, collection_run_id: Optional[int] = None
+) -> None:
     logger.info(f"Start collect_latest_task(metric_id={metric_id})")
+    if collection_run_id and not collect_latest_task.request.retries:
+        CollectionRun.mark_started(collection_run_id)
     metric = Metric.objects.get(pk=metric_id)
 
     metric.last_collect_attempt = datetime.now(timezone.utc)
     metric.save()
 
     integration_instance = metric.integration_instance
-
-    if metric.can_backfill:
-        # Check if we should gather previously missing datapoints
-        # by getting last measurement
-        last_measurement = (
-            Measurement.objects.filter(metric=metric_id).order_by("-date").first()
-        )
-        date_end = date.today() - timedelta(days=1)
-        if metric.should_backfill_daily:
-            date_start = integration_instance.earliest_backfill()
-        elif last_measurement:
-            date_start = min(last_measurement.date + timedelta(days=1), date_end)
+    # Results fetched for other metrics are only reused within a nightly run:
+    # they can be as old as the run
+    reuse = collection_run_id is not None
+
+    try:
+        if metric.can_backfill:
+            date_start, date_end = scheduling.collection_range(metric)
+            with MeasurementWriter(metric.pk) as writer:
+                if coalescing.can_coalesce(date_start, date_end):
+                    # Metrics sharing integration, config and credentials only
+                    # fetch once, and metrics that can be batched together are
+                    # collected at once
+                    writer.write_all(
+                        coalescing.fetch_once(
+                            coalescing.collection_fingerprint(
+                                metric, date_start, date_end
+                            ),
+                            lambda: coalescing.fetch_batch(
+                                metric, date_start, date_end
+                            ),
+                            reuse=reuse,
+                        )
+                    )
+                else:
+                    with integration_instance as inst:
+                        writer.write_all(
+                            inst.collect_past_range(
+                                date_start=date_start, date_end=date_end
+                            )
+                        )
+            logger.info(f"Saved measurements for metric_id={metric_id}: {writer}")
         else:
-            date_start = date_end
-        with integration_instance as inst:
-            measurements_iterator = inst.collect_past_range(
-                date_start=date_start,
-                date_end=date_end,
+            # For integration that can't backfill
+            def fetch_latest() -> List[MeasurementTuple]:
+                with integration_instance as inst:
+                    return [inst.collect_latest()]
+
+            upsert_measurements(
+                metric.pk,
+                coalescing.fetch_once(
+                    coalescing.collection_fingerprint(metric),
+                    fetch_latest,
+                    reuse=reuse,
+                ),
             )
-            for measurement in measurements_iterator:
-                Measurement.objects.update_or_create(
-                    metric=metric,
-                    date=measurement.date,
-                    defaults={
-                        "value": measurement.value,
-                    },
-                )
-    else:
-        # For integration that can't backfill
-        with integration_instance as inst:
-            measurement = inst.collect_latest()
-        Measurement.objects.update_or_create(
-            metric=metric,
-            date=measurement.date,
-            defaults={
-                "value": measurement.value,
-            },
+    except RateLimitExceeded as e:
+        if e.retry_after is None:
+            raise
+        # Requests can be sent again after that long
+        raise collect_latest_task.retry(exc=e, countdown=int(e.retry_after) + 1)
+    except coalescing.FetchInProgress:
+        # Check for the result later, without holding a worker meanwhile.
+        # If the other task fails, its lock is released and we will fetch.
+        logger.info(f"Waiting for the measurements of metric_id={metric_id}")
+        raise collect_latest_task.retry(
+            countdown=coalescing.WAIT_COUNTDOWN,
+            # Waiting is bounded by the lock timeout
+            max_retries=None,
         )
 
+    if collection_run_id:
+        CollectionRun.mark_succeeded(collection_run_id)
+
     # Check notify
     logger.info(f"Will start check_notify_metric_changed_task(metric_id={metric_id})")
     check_notify_metric_changed_task.delay(metric_id)
@@ -85,23 +135,43 @@ def collect_latest_task(metric_id: UUID) -> None:
 
 @shared_task()
 def collect_all_latest_task() -> None:
-    for metric in Metric.objects.all():
-        collect_latest_task.delay(metric.id)
-        verify_inactive_task.delay(metric.id)
+    window = timedelta(seconds=COLLECT_ALL_LATEST_WINDOW)
+    run = CollectionRun.objects.create(window=window)
+    # Tasks are spread over the window in proportion to the weight of their
+    # integration, to avoid hitting the broker and third-party APIs all at once
+    total_weight = scheduling.total_integration_weight()
+    scheduled_weight = 0.0
+    scheduled_count = 0
+    for chunk in scheduling.iter_metric_id_chunks():
+        signatures = []
+        for metric_id, integration_id in chunk:
+            # Metrics created while scheduling are not part of `total_weight`
+            countdown = (
+                window.total_seconds() * min(scheduled_weight / total_weight, 1)
+                if total_weight
+                else 0
+            )
+            scheduled_weight += scheduling.integration_weight(integration_id)
+            signatures += [
+                collect_latest_task.si(metric_id, collection_run_id=run.pk).set(
+                    countdown=countdown
+                ),
+                verify_inactive_task.si(metric_id).set(countdown=countdown),
+            ]
+        # A group publishes all its tasks using a single producer
+        group(signatures).apply_async()
+        scheduled_count += len(chunk)
+        CollectionRun.objects.filter(pk=run.pk).update(scheduled_count=scheduled_count)
+    logger.info(f"Scheduled {scheduled_count} metrics over {window}")
+    CollectionRun.objects.filter(pk=run.pk).update(scheduling_finished_at=Now())
 
 
-@shared_task(max_retries=10)
+@shared_task()
 def backfill_task(
     requester_user_id: int,
     metric_id: UUID,
     since: Optional[str] = None,
-    num_collected: float = 0,
 ) -> None:
-    if backfill_task.request.retries:
-        logger.info(
-            f"Retrying backfill_task {backfill_task.request.retries}/{backfill_task.max_retries} resuming at {since}"
-        )
-
     metric = Metric.objects.get(pk=metric_id)
 
     if not since:
@@ -124,60 +194,159 @@ def backfill_task(
     )
     last_measurement_date = last_measurement.date if last_measurement else date.max
     with metric.integration_instance as inst:
-        # Clear existing data for this range
         date_start = max(
             min(last_measurement_date, start_date), inst.earliest_backfill()
         )
         date_end = date.today() - timedelta(days=1)
-        Measurement.objects.filter(
-            metric=metric.id, date__gte=date_start, date__lte=date_end
+        # Ranges completed by a previous backfill which didn't finish
+        # (e.g. failed or interrupted) are not collected again
+        checkpoints = BackfillCheckpoint.objects.filter(metric=metric_id)
+        checkpoints.filter(
+            created_at__lt=datetime.now(timezone.utc) - BACKFILL_CHECKPOINT_MAX_AGE
         ).delete()
+        shards = scheduling.backfill_shards(
+            date_start,
+            date_end,
+            inst.backfill_shard_days,
+            completed=checkpoints.values_list("date_start", "date_end"),
+        )
+        concurrency = min(inst.backfill_concurrency, len(shards))
+
+    backfill = Backfill.objects.create(
+        metric=metric,
+        requested_by_id=requester_user_id,
+        date_start=date_start,
+        date_end=date_end,
+        shard_count=len(shards),
+    )
+    logger.info(
+        f"Backfilling metric_id={metric_id} from {date_start} to {date_end} in {len(shards)} shards"
+    )
+    if not shards:
+        backfill_finished_task.delay(backfill.pk)
+        return
+    # Shards are distributed over `concurrency` chains running in parallel.
+    # The chord calls `backfill_finished_task` once all of them succeeded.
+    chains = [
+        chain(
+            *[
+                backfill_shard_task.si(
+                    backfill.pk, shard_start.isoformat(), shard_end.isoformat()
+                )
+                for shard_start, shard_end in shards[i::concurrency]
+            ]
+        )
+        for i in range(concurrency)
+    ]
+    chord(chains)(backfill_finished_task.si(backfill.pk))
+
 
+@shared_task(max_retries=10)
+def backfill_shard_task(
+    backfill_id: int,
+    date_start: str,
+    date_end: str,
+    since: Optional[str] = None,
+) -> None:
+    if backfill_shard_task.request.retries:
+        logger.info(
+            f"Retrying backfill_shard_task {backfill_shard_task.request.retries}/{backfill_shard_task.max_retries} resuming at {since}"
+        )
+
+    backfill = Backfill.objects.select_related("metric").get(pk=backfill_id)
+    metric = backfill.metric
+    shard_start = date.fromisoformat(since or date_start)
+    shard_end = date.fromisoformat(date_end)
+    with metric.integration_instance as inst:
         measurements_iterator = inst.collect_past_range(
-            date_start=date_start,
-            date_end=date_end,
+            date_start=shard_start,
+            date_end=shard_end,
         )
-        # Save
-        retry_since = since
+        # Save. Existing measurements are overwritten in place, so that they
+        # stay visible until the backfill completes.
+        writer = MeasurementWriter(metric.pk)
         try:
-            for measurement in measurements_iterator:
-                Measurement.objects.update_or_create(
-                    metric=metric,
-                    date=measurement.date,
-                    defaults={
-                        "value": measurement.value,
-                        "metric": metric,
-                    },
+            # Pending measurements are flushed when exiting, even on errors
+            with writer:
+                writer.write_all(measurements_iterator)
+        except Exception as e:
+            # Measurements are collected in chronological order:
+            # keep track of what was completed
+            if writer.last_written:
+                _checkpoint_backfill(
+                    backfill, shard_start, writer.last_written.date, writer
                 )
-                num_collected += 1
-                retry_since = (measurement.date + timedelta(days=1)).isoformat()
-        except RequestException as e:
-            # Only retry certain HTTP codes
-            if e.response is None:
-                raise e
-            if e.response.status_code not in [429]:
+            if not isinstance(e, RequestException):
                 raise e
+            Backfill.add_progress(backfill_id, writer.count, shard_finished=False)
+            retry_since = (
+                (writer.last_written.date + timedelta(days=1)).isoformat()
+                if writer.last_written
+                else since
+            )
+            # Only retry certain HTTP codes, or when our own rate limiter
+            # prevented the request from being sent
+            if not isinstance(e, RateLimitExceeded):
+                if e.response is None:
+                    raise e
+                if e.response.status_code not in [429]:
+                    raise e
             # This will retry the task. Countdown needs to be manually set, but
             # max_retries will follow task configuration
-            countdown = 10 * (2 ** (backfill_task.request.retries + 1))
+            countdown = 10 * (2 ** (backfill_shard_task.request.retries + 1))
             # Add some randomness as well to avoid thundering herd problem
             r = (random() - 0.5) / 5  # [-0.5, 0.5] / 5 = [-0.1, 0.1] = ±10%
             countdown *= 1 + r
-            raise backfill_task.retry(
+            if isinstance(e, RateLimitExceeded) and e.retry_after is not None:
+                countdown = max(countdown, e.retry_after)
+            raise backfill_shard_task.retry(
                 exc=e,
                 countdown=int(countdown),
                 kwargs={
-                    "requester_user_id": requester_user_id,
-                    "metric_id": metric_id,
+                    "backfill_id": backfill_id,
+                    "date_start": date_start,
+                    "date_end": date_end,
                     "since": retry_since,
-                    "num_collected": num_collected,
                 },
             )
     # Success
-    requester_user = User.objects.get(pk=requester_user_id)
+    _checkpoint_backfill(backfill, shard_start, shard_end, writer)
+    Backfill.add_progress(backfill_id, writer.count, shard_finished=True)
+    logger.info(
+        f"Backfilled metric_id={metric.pk} from {shard_start} to {shard_end}: {writer}"
+    )
+
+
+def _checkpoint_backfill(
+    backfill: Backfill, date_start: date, date_end: date, writer: MeasurementWriter
+) -> None:
+    with transaction.atomic():
+        # Measurements which weren't collected again no longer exist upstream
+        Measurement.objects.filter(
+            metric=backfill.metric_id, date__gte=date_start, date__lte=date_end
+        ).exclude(date__in=writer.written_dates).delete()
+        BackfillCheckpoint.objects.create(
+            metric_id=backfill.metric_id,
+            backfill=backfill,
+            date_start=date_start,
+            date_end=date_end,
+        )
+
+
+@shared_task()
+def backfill_finished_task(backfill_id: int) -> None:
+    Backfill.objects.filter(pk=backfill_id).update(finished_at=Now())
+    backfill = Backfill.objects.select_related("metric", "requested_by").get(
+        pk=backfill_id
+    )
+    # Next backfills will start from scratch
+    BackfillCheckpoint.objects.filter(metric=backfill.metric_id).delete()
+    metric = backfill.metric
+    requester_user = backfill.requested_by
+    logger.info(f"Backfilled metric_id={metric.pk}: {backfill}")
     message = f"""Hello {requester_user.first_name} 👋
 
-Metric "{metric.name}" has successfully been backfilled with {num_collected} measurements.
+Metric "{metric.name}" has successfully been backfilled with {backfill.collected_count} measurements.
     """
     send_mail(
         subject=f"Your metric {metric.name} has successfully been backfilled",
@@ -260,8 +429,7 @@ def check_notify_metric_changed_task(metric_id: UUID) -> None:
             logger.info(f"Sending slack notification for metric_id={metric_id}")
             link = f"{BASE_URL}{reverse('metric-details', args=[metric_id])}"
             slack_notifications.notify_channel(
-                organization.slack_notifications_credentials,
-                organization.slack_notifications_channel,
+                organization,
                 img_data,
                 f"New changes in metric <{link}|*{metric.name}*>",
             )
@@ -294,6 +462,16 @@ To fix this error, you might have to reconfigure your metric by following the li
                 )
 
 
+@worker_process_shutdown.connect()
+def log_http_stats(*args, **kwargs) -> None:
+    # Connections are pooled, and cache counters kept, per worker process
+    logger.info(f"HTTP connection pool usage: {pformat(http.pool_stats())}")
+    logger.info(
+        f"HTTP response cache usage: {pformat(response_cache.response_cache_stats())}"
+    )
+    logger.info(f"Pagination latencies: {pformat(utils.pagination_stats())}")
+
+
 @task_failure.connect()
 def celery_task_failure_email(sender, *args, **kwargs) -> None:
     exception = kwargs["exception"]
@@ -302,6 +480,9 @@ def celery_task_failure_email(sender, *args, **kwargs) -> None:
 
     if sender == collect_latest_task:
         metric_pk = kwargs["args"][0]
+        collection_run_id = kwargs["kwargs"].get("collection_run_id")
+        if collection_run_id:
+            CollectionRun.mark_failed(collection_run_id)
         metric = Metric.objects.get(pk=metric_pk)
         if notify_metric_exception(
             metric=metric,
@@ -329,6 +510,30 @@ def celery_task_failure_email(sender, *args, **kwargs) -> None:
             inlude_debug_info=requester_user.is_staff,
         ):
             return
+    elif sender == backfill_shard_task:
+        if kwargs["args"]:
+            backfill_id, *_ = kwargs["args"]
+        else:
+            backfill_id = kwargs["kwargs"]["backfill_id"]
+        # Only the first failing shard notifies: the others are part of the
+        # same failed backfill
+        if not Backfill.mark_failed(backfill_id):
+            return
+        backfill = Backfill.objects.select_related("metric", "requested_by").get(
+            pk=backfill_id
+        )
+        metric = backfill.metric
+        requester_user = backfill.requested_by
+        num_retries = sender.request.retries
+        if notify_metric_exception(
+            metric=metric,
+            friendly_context_message=f"Unfortunately, something went wrong when attempting to backfill the {metric.name} metric after {num_retries} retries.",
+            exception=exception,
+            recipient_email=requester_user.email,
+            recipient_friendly_name=requester_user.first_name,
+            inlude_debug_info=requester_user.is_staff,
+        ):
+            return
 
     # Generic handler for unhandled exceptions
     extras = {}
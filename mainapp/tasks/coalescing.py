@@ -0,0 +1,192 @@
+import hashlib
+import json
+from datetime import date
+from typing import Callable, List, Optional
+
+from celery.utils.log import get_task_logger
+from django.core.cache import cache
+
+from config.settings import CELERY_TASK_TIME_LIMIT, COLLECT_ALL_LATEST_WINDOW
+from integrations import INTEGRATION_CLASSES
+from integrations.base import MeasurementTuple
+
+from ..models import Metric
+from .scheduling import collection_ranges
+
+logger = get_task_logger(__name__)
+
+# Results are kept for the duration of a nightly run, so that metrics
+# scheduled later in the window can reuse them
+RESULT_TIMEOUT = COLLECT_ALL_LATEST_WINDOW + CELERY_TASK_TIME_LIMIT
+# A fetch can't take longer than a task
+LOCK_TIMEOUT = CELERY_TASK_TIME_LIMIT
+# Tasks waiting for the result of another one check again after that long
+WAIT_COUNTDOWN = 30  # seconds
+# Results are cached in Redis: longer ranges (e.g. daily backfills) are
+# streamed to the db instead
+COALESCE_MAX_DAYS = 31
+
+
+class FetchInProgress(Exception):
+    """Another task is fetching the same measurements"""
+
+
+def _result_key(fingerprint: str) -> str:
+    return f"coalescing:result:{fingerprint}"
+
+
+def _lock_key(fingerprint: str) -> str:
+    return f"coalescing:lock:{fingerprint}"
+
+
+def credentials_identity(credentials: Optional[dict]) -> Optional[str]:
+    if not credentials:
+        return None
+    # Duplicated metrics refresh their OAuth access tokens independently,
+    # but the grant they originate from stays the same
+    for key in ["refresh_token", "access_token"]:
+        if credentials.get(key):
+            return credentials[key]
+    return json.dumps(credentials, sort_keys=True)
+
+
+def collection_fingerprint(
+    metric: Metric, date_start: Optional[date] = None, date_end: Optional[date] = None
+) -> str:
+    """Metrics with the same fingerprint make the exact same upstream calls"""
+    payload = json.dumps(
+        [
+            metric.integration_id,
+            metric.integration_config,
+            credentials_identity(metric.integration_credentials),
+            date_start and date_start.isoformat(),
+            date_end and date_end.isoformat(),
+        ],
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def can_coalesce(date_start: Optional[date], date_end: Optional[date]) -> bool:
+    if date_start is None or date_end is None:
+        return True
+    return (date_end - date_start).days < COALESCE_MAX_DAYS
+
+
+def fetch_once(
+    fingerprint: str,
+    fetch: Callable[[], List[MeasurementTuple]],
+    reuse: bool = True,
+) -> List[MeasurementTuple]:
+    """
+    Returns the result of `fetch`, unless a result for the same fingerprint
+    was recently fetched for another metric. Raises FetchInProgress if it is
+    being fetched: the caller should try again later, instead of waiting.
+    Without `reuse` (collections outside of a nightly run, which expect fresh
+    measurements), `fetch` is always called, and its result is shared.
+    """
+    result_key = _result_key(fingerprint)
+    lock_key = _lock_key(fingerprint)
+    if not reuse:
+        result = fetch()
+        cache.set(result_key, result, timeout=RESULT_TIMEOUT)
+        return result
+    result = cache.get(result_key)
+    if result is not None:
+        logger.info(f"Reusing measurements fetched for fingerprint {fingerprint}")
+        return result
+    # If the other task fails, the lock is released without result and we
+    # will fetch ourselves
+    if not cache.add(lock_key, True, timeout=LOCK_TIMEOUT):
+        raise FetchInProgress(fingerprint)
+    try:
+        result = fetch()
+        cache.set(result_key, result, timeout=RESULT_TIMEOUT)
+        return result
+    finally:
+        cache.delete(lock_key)
+
+
+def find_batch(metric: Metric, date_start: date, date_end: date) -> List[Metric]:
+    """
+    Returns the metrics that can be collected in the same requests as `metric`:
+    same integration, credentials and `batch_key`, and same dates to collect.
+    Their fetch is claimed, so that their own task reuses the result.
+    """
+    batch_key = metric.integration_instance.batch_key()
+    if batch_key is None:
+        return []
+    identity = credentials_identity(metric.integration_credentials)
+    fingerprints = {collection_fingerprint(metric, date_start, date_end)}
+    # Credentials are obtained by the owner, which narrows down the search
+    candidates = [
+        other
+        for other in Metric.objects.filter(
+            integration_id=metric.integration_id,
+            user_id=metric.user_id,
+            # Their range would be too long to be coalesced
+            should_backfill_daily=False,
+        ).exclude(pk=metric.pk)
+        if credentials_identity(other.integration_credentials) == identity
+        and other.integration_instance.batch_key() == batch_key
+    ]
+    ranges = collection_ranges(candidates)
+    batch = []
+    for other in candidates:
+        if ranges[other.pk] != (date_start, date_end):
+            continue
+        fingerprint = collection_fingerprint(other, date_start, date_end)
+        if fingerprint in fingerprints:
+            # Already coalesced
+            continue
+        if cache.get(_result_key(fingerprint)) is not None:
+            # Already collected
+            continue
+        if not cache.add(_lock_key(fingerprint), True, timeout=LOCK_TIMEOUT):
+            # Being collected
+            continue
+        fingerprints.add(fingerprint)
+        batch.append(other)
+    return batch
+
+
+def fetch_batch(
+    metric: Metric, date_start: date, date_end: date
+) -> List[MeasurementTuple]:
+    """
+    Collects `metric` along with the metrics that can be collected in the same
+    requests. Their measurements are cached, for their own task to reuse them.
+    """
+    integration_class = INTEGRATION_CLASSES[metric.integration_id]
+    batch = find_batch(metric, date_start, date_end)
+    try:
+        if batch:
+            logger.info(f"Collecting metric_id={metric.pk} with {len(batch)} others")
+            try:
+                results = integration_class.collect_past_range_batch(
+                    [m.integration_instance for m in [metric] + batch],
+                    date_start=date_start,
+                    date_end=date_end,
+                )
+            except Exception:
+                # Don't let another metric of the batch fail this one
+                logger.warning(
+                    f"Batch collection failed for metric_id={metric.pk}",
+                    exc_info=True,
+                )
+            else:
+                for other, result in zip(batch, results[1:]):
+                    cache.set(
+                        _result_key(
+                            collection_fingerprint(other, date_start, date_end)
+                        ),
+                        result,
+                        timeout=RESULT_TIMEOUT,
+                    )
+                return results[0]
+        return integration_class.collect_past_range_batch(
+            [metric.integration_instance], date_start=date_start, date_end=date_end
+        )[0]
+    finally:
+        for other in batch:
+            cache.delete(_lock_key(collection_fingerprint(other, date_start, date_end)))
@@ -0,0 +1,130 @@
+import hashlib
+import json
+import time
+import uuid
+from typing import Callable, Dict, Optional, Type
+from uuid import UUID
+
+from celery import shared_task
+from celery.utils.log import get_task_logger
+from django.core.cache import cache
+
+from config.settings import CELERY_TASK_TIME_LIMIT
+from integrations import INTEGRATION_CLASSES
+from integrations.base import Integration
+
+from ..models import Metric
+from .coalescing import credentials_identity
+
+logger = get_task_logger(__name__)
+
+# Schemas younger than that are served without refreshing them
+FRESH_TIMEOUT = 60 * 60  # seconds
+# Older schemas are still served, while they get refreshed in the background
+STALE_TIMEOUT = 7 * 24 * 3600  # seconds
+# A refresh can't take longer than a task
+REFRESH_LOCK_TIMEOUT = CELERY_TASK_TIME_LIMIT
+
+
+def _hash(*parts) -> str:
+    # Keys can contain credentials: make sure they don't end up in Redis
+    payload = json.dumps(parts, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _generation_key(
+    integration_class: Type[Integration], credentials: Optional[dict]
+) -> str:
+    identity = credentials_identity(credentials)
+    return f"configschema:generation:{_hash(integration_class.__module__, identity)}"
+
+
+def _schema_key(
+    integration_class: Type[Integration],
+    config: Optional[dict],
+    credentials: Optional[dict],
+) -> str:
+    # Schemas can depend on the config (e.g. the properties of the selected
+    # account), and are dropped altogether when the credentials are invalidated
+    generation = cache.get(_generation_key(integration_class, credentials), "")
+    return "configschema:" + _hash(
+        integration_class.__module__,
+        credentials_identity(credentials),
+        generation,
+        config,
+    )
+
+
+def has_callable_config_schema(integration_class: Type[Integration]) -> bool:
+    return (
+        integration_class.callable_config_schema.__qualname__.split(".")[0]
+        == integration_class.__name__
+    )
+
+
+def get_config_schema(
+    integration_class: Type[Integration],
+    config: Optional[dict],
+    credentials: Optional[dict],
+    fetch: Callable[[], Dict],
+    metric_id: Optional[UUID] = None,
+) -> Dict:
+    """
+    Returns the callable config schema of an integration, calling `fetch`
+    only when it wasn't cached for the same config and credentials.
+    Stale schemas of saved metrics (`metric_id`) are returned as is, and
+    refreshed in the background.
+    """
+    if not has_callable_config_schema(integration_class):
+        return integration_class.config_schema
+    schema_key = _schema_key(integration_class, config, credentials)
+    cached = cache.get(schema_key)
+    if cached is not None:
+        if time.time() - cached["fetched_at"] < FRESH_TIMEOUT:
+            return cached["schema"]
+        if metric_id is not None:
+            if cache.add(f"{schema_key}:refresh", True, timeout=REFRESH_LOCK_TIMEOUT):
+                refresh_config_schema_task.delay(metric_id=metric_id)
+            return cached["schema"]
+    schema = fetch()
+    _store(schema_key, schema)
+    return schema
+
+
+def _store(schema_key: str, schema: Dict) -> None:
+    cache.set(
+        schema_key,
+        {"schema": schema, "fetched_at": time.time()},
+        timeout=STALE_TIMEOUT,
+    )
+
+
+def invalidate_config_schemas(
+    integration_class: Type[Integration], credentials: Optional[dict]
+) -> None:
+    """Drops the cached schemas of the credentials, whatever their config"""
+    cache.set(
+        _generation_key(integration_class, credentials),
+        uuid.uuid4().hex,
+        timeout=STALE_TIMEOUT,
+    )
+
+
+@shared_task
+def refresh_config_schema_task(metric_id: UUID) -> None:
+    metric = Metric.objects.get(pk=metric_id)
+    integration_class = INTEGRATION_CLASSES[metric.integration_id]
+    schema_key = _schema_key(
+        integration_class, metric.integration_config, metric.integration_credentials
+    )
+    try:
+        _store(schema_key, metric.fetch_config_schema())
+    except Exception:
+        # The stale schema keeps being served, and the error will show up
+        # once it expires
+        logger.warning(
+            f"Could not refresh the config schema of metric_id={metric_id}",
+            exc_info=True,
+        )
+    finally:
+        cache.delete(f"{schema_key}:refresh")
@@ -0,0 +1,117 @@
+from datetime import date, timedelta
+from typing import Dict, Iterable, Iterator, List, Tuple
+from uuid import UUID
+
+from django.db.models import Count, Max
+
+from integrations import INTEGRATION_CLASSES
+
+from ..models import Measurement, Metric
+
+METRIC_ID_CHUNK_SIZE = 500
+
+
+def collection_range(metric: Metric) -> Tuple[date, date]:
+    """Dates to collect during the nightly collection of a backfillable metric"""
+    return collection_ranges([metric])[metric.pk]
+
+
+def collection_ranges(metrics: List[Metric]) -> Dict[UUID, Tuple[date, date]]:
+    """`collection_range` of several metrics, using a single query"""
+    date_end = date.today() - timedelta(days=1)
+    # Check if we should gather previously missing datapoints
+    # by getting last measurements
+    last_dates = dict(
+        Measurement.objects.filter(
+            metric__in=[m.pk for m in metrics if not m.should_backfill_daily]
+        )
+        .order_by()
+        .values("metric")
+        .annotate(last_date=Max("date"))
+        .values_list("metric", "last_date")
+    )
+    ranges = {}
+    for metric in metrics:
+        if metric.should_backfill_daily:
+            date_start = metric.integration_instance.earliest_backfill()
+        elif metric.pk in last_dates:
+            date_start = min(last_dates[metric.pk] + timedelta(days=1), date_end)
+        else:
+            date_start = date_end
+        ranges[metric.pk] = (date_start, date_end)
+    return ranges
+
+
+def remaining_ranges(
+    date_start: date, date_end: date, completed: Iterable[Tuple[date, date]]
+) -> List[Tuple[date, date]]:
+    """Returns the parts of [date_start, date_end] not covered by `completed`"""
+    remaining = []
+    for completed_start, completed_end in sorted(completed):
+        if completed_end < date_start:
+            continue
+        if completed_start > date_end:
+            break
+        if completed_start > date_start:
+            remaining.append((date_start, completed_start - timedelta(days=1)))
+        date_start = completed_end + timedelta(days=1)
+    if date_start <= date_end:
+        remaining.append((date_start, date_end))
+    return remaining
+
+
+def backfill_shards(
+    date_start: date,
+    date_end: date,
+    shard_days: int,
+    completed: Iterable[Tuple[date, date]] = (),
+) -> List[Tuple[date, date]]:
+    """
+    Splits the parts of a backfill range which haven't been completed yet
+    in consecutive shards of at most `shard_days`
+    """
+    shards = []
+    for range_start, range_end in remaining_ranges(date_start, date_end, completed):
+        while range_start <= range_end:
+            shard_end = min(range_start + timedelta(days=shard_days - 1), range_end)
+            shards.append((range_start, shard_end))
+            range_start = shard_end + timedelta(days=1)
+    return shards
+
+
+def integration_weight(integration_id: str) -> float:
+    integration_class = INTEGRATION_CLASSES.get(integration_id)
+    if not integration_class:
+        return 1
+    return integration_class.collect_weight
+
+
+def total_integration_weight() -> float:
+    # Aggregated in the db so that we don't have to go through all metrics twice
+    return sum(
+        integration_weight(row["integration_id"]) * row["count"]
+        for row in Metric.objects.order_by()
+        .values("integration_id")
+        .annotate(count=Count("id"))
+    )
+
+
+def iter_metric_id_chunks(
+    chunk_size: int = METRIC_ID_CHUNK_SIZE,
+) -> Iterator[List[Tuple[UUID, str]]]:
+    """
+    Yields chunks of (metric_id, integration_id) for all metrics.
+    Uses keyset pagination (instead of OFFSET) and only fetches the columns
+    required for scheduling (e.g. not the credentials).
+    """
+    last_id = None
+    while True:
+        queryset = Metric.objects.order_by("id")
+        if last_id is not None:
+            queryset = queryset.filter(id__gt=last_id)
+        chunk = list(queryset.values_list("id", "integration_id")[:chunk_size])
+        if chunk:
+            yield chunk
+        if len(chunk) < chunk_size:
+            return
+        last_id = chunk[-1][0]
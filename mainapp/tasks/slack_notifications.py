@@ -1,14 +1,16 @@
 import secrets
-from typing import Tuple
+from typing import Iterator, List, Optional, Tuple
 
 from celery.utils.log import get_task_logger
+from django.core.cache import cache
 from django.http import HttpRequest
 from django.urls import reverse
 from requests_oauthlib import OAuth2Session
 from slack_sdk import WebClient
+from slack_sdk.errors import SlackApiError
 
 from config.settings import DEBUG
-from integrations.utils import get_secret
+from integrations.utils import get_secret, paginate
 
 from ..models import Organization
 
@@ -19,6 +21,13 @@ client_secret = get_secret("SLACK_CLIENT_SECRET")
 authorization_url = "https://slack.com/oauth/v2/authorize"
 token_url = "https://slack.com/api/oauth.v2.access"
 scopes = ["files:write,chat:write,channels:read,channels:join"]
+# Maximum accepted by `conversations.list`
+CHANNELS_PAGE_LIMIT = 1000
+# Channels created (or renamed) since then won't show up in the form
+CHANNELS_TIMEOUT = 60 * 60  # seconds
+# Joining is only attempted again once that long has passed, or when the bot
+# was removed from the channel
+JOINED_TIMEOUT = 30 * 24 * 3600  # seconds
 
 
 def authorize(request: HttpRequest) -> Tuple[str, str]:
@@ -58,35 +67,122 @@ def process_authorize_callback(
     credentials = client.token
     org = Organization.objects.get(pk=organization_id)
     org.slack_notifications_credentials = credentials
+    # The workspace might have changed: channels will be looked up again
+    org.slack_notifications_channel_id = None
     org.save()
+    forget_channels(org)
     return reverse("organization_edit", args=[organization_id])
 
 
-def query_public_channels(credentials: dict, cursor=None):
+def _session(credentials: dict) -> OAuth2Session:
     # `token_type` is set to `bot` and this doesn't fare well with oauthlib
     credentials = {**credentials, "token_type": "bearer"}
-    session = OAuth2Session(
+    # Note: token never expires
+    return OAuth2Session(
         client_id,
         token=credentials,
     )
-    url = "https://slack.com/api/conversations.list"
-    if cursor:
-        url += f"?cursor={cursor}"
-    response = session.get(url)
-    response.raise_for_status()
-    obj = response.json()
-    assert obj["ok"] == True, str(obj)
-    next_cursor = obj["response_metadata"].get("next_cursor")
-    if next_cursor:
-        return obj["channels"] + query_public_channels(credentials, next_cursor)
-    return obj["channels"]
 
 
-def list_public_channels(credentials: dict):
-    return sorted(f"#{obj['name']}" for obj in query_public_channels(credentials))
+def query_public_channels(credentials: dict) -> Iterator[dict]:
+    session = _session(credentials)
+
+    def fetch_page(cursor: Optional[str]) -> Tuple[List[dict], Optional[str]]:
+        params = {
+            "types": "public_channel",
+            "exclude_archived": "true",
+            # Slack may return fewer channels per page, but not more
+            "limit": CHANNELS_PAGE_LIMIT,
+        }
+        if cursor:
+            params["cursor"] = cursor
+        response = session.get(
+            "https://slack.com/api/conversations.list", params=params
+        )
+        response.raise_for_status()
+        obj = response.json()
+        assert obj["ok"] == True, str(obj)
+        return obj["channels"], obj["response_metadata"].get("next_cursor") or None
+
+    return paginate(fetch_page)
+
+
+def _channels_key(organization: Organization) -> str:
+    return f"slack:channels:{organization.pk}"
+
+
+def _joined_key(organization: Organization, channel_id: str) -> str:
+    return f"slack:joined:{organization.pk}:{channel_id}"
 
 
-def notify_channel(credentials: dict, channel_name: str, img_data: bytes, message: str):
+def get_public_channels(organization: Organization) -> List[dict]:
+    """
+    Returns the public channels (id, name and whether the bot is a member)
+    of the organization's workspace. Listing them takes a request per
+    page, so they're cached.
+    """
+    assert organization.slack_notifications_credentials
+    channels = cache.get(_channels_key(organization))
+    if channels is None:
+        channels = [
+            {
+                "id": obj["id"],
+                "name": obj["name"],
+                "is_member": obj.get("is_member", False),
+            }
+            for obj in query_public_channels(
+                organization.slack_notifications_credentials
+            )
+        ]
+        cache.set(_channels_key(organization), channels, timeout=CHANNELS_TIMEOUT)
+    return channels
+
+
+def list_public_channels(organization: Organization) -> List[str]:
+    return sorted(f"#{obj['name']}" for obj in get_public_channels(organization))
+
+
+def find_channel_id(organization: Organization) -> Optional[str]:
+    channel_name = (organization.slack_notifications_channel or "").replace("#", "")
+    if not channel_name:
+        return None
+    return next(
+        (
+            obj["id"]
+            for obj in get_public_channels(organization)
+            if obj["name"] == channel_name
+        ),
+        None,
+    )
+
+
+def forget_channels(organization: Organization) -> None:
+    """To be called when the organization's workspace might have changed"""
+    cache.delete(_channels_key(organization))
+
+
+def _join_channel(organization: Organization, channel_id: str) -> None:
+    joined_key = _joined_key(organization, channel_id)
+    if cache.get(joined_key):
+        return
+    if not any(
+        obj["id"] == channel_id and obj["is_member"]
+        for obj in get_public_channels(organization)
+    ):
+        assert organization.slack_notifications_credentials
+        response = _session(organization.slack_notifications_credentials).post(
+            "https://slack.com/api/conversations.join",
+            data={
+                "channel": channel_id,
+            },
+        )
+        response.raise_for_status()
+        obj = response.json()
+        assert obj["ok"] == True, str(obj)
+    cache.set(joined_key, True, timeout=JOINED_TIMEOUT)
+
+
+def notify_channel(organization: Organization, img_data: bytes, message: str):
     """
     Sharing to private channels won't be possible here.
     It turns out that a bot token can't upload a file somewhere, and then make it public so it can be
@@ -97,39 +193,45 @@ def notify_channel(credentials: dict, channel_name: str, img_data: bytes, messag
     the `chat:write.public` scope. However, turns out that bots can't upload to channels they are not
     part of. We therefore need to join the channel first.
     """
-
-    channel_id = next(
-        obj["id"]
-        for obj in query_public_channels(credentials)
-        if obj["name"] == channel_name.replace("#", "")
-    )
-
-    # `token_type` is set to `bot` and this doesn't fare well with oauthlib
-    credentials = {**credentials, "token_type": "bearer"}
-    # Note: token never expires
-    session = OAuth2Session(
-        client_id,
-        token=credentials,
-    )
+    assert organization.slack_notifications_credentials
+    channel_id = organization.slack_notifications_channel_id
+    if not channel_id:
+        # Organizations configured before channel IDs were stored
+        channel_id = find_channel_id(organization)
+        if channel_id is None:
+            raise ValueError(
+                f"Channel {organization.slack_notifications_channel} wasn't found"
+            )
+        Organization.objects.filter(pk=organization.pk).update(
+            slack_notifications_channel_id=channel_id
+        )
+        organization.slack_notifications_channel_id = channel_id
 
     # Check if there's a need to join the public channel
     # (slack bots can't upload files to channel they don't belong to)
-    response = session.post(
-        "https://slack.com/api/conversations.join",
-        data={
-            "channel": channel_id,
-        },
-    )
-    response.raise_for_status()
-    obj = response.json()
-    assert obj["ok"] == True, str(obj)
+    _join_channel(organization, channel_id)
 
     # Upload image
-    client = WebClient(token=credentials["access_token"])
-    response = client.files_upload_v2(
+    client = WebClient(
+        token=organization.slack_notifications_credentials["access_token"]
+    )
+    try:
+        response = _upload(client, channel_id, img_data, message)
+    except SlackApiError as e:
+        if e.response.get("error") != "not_in_channel":
+            raise
+        # The bot was removed from the channel since it joined
+        cache.delete(_joined_key(organization, channel_id))
+        forget_channels(organization)
+        _join_channel(organization, channel_id)
+        response = _upload(client, channel_id, img_data, message)
+    assert response.get("ok", False) == True, str(response)
+
+
+def _upload(client: WebClient, channel_id: str, img_data: bytes, message: str):
+    return client.files_upload_v2(
         channel=channel_id,
         title="Uploaded file",
         initial_comment=message,
         content=img_data,
     )
-    assert response.get("ok", False) == True, str(response)
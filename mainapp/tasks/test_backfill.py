@@ -0,0 +1,151 @@
+from datetime import date, timedelta
+from typing import List, Optional, Set
+from unittest.mock import patch
+
+from celery.exceptions import Retry
+from django.core import mail
+from django.test import TestCase
+
+from config import celery_app
+from integrations import INTEGRATION_CLASSES
+from integrations.base import Integration, MeasurementTuple
+from integrations.rate_limit import RateLimitExceeded
+from mainapp.models import Backfill, BackfillCheckpoint, Measurement, Metric, User
+from mainapp.tasks import backfill_shard_task, backfill_task
+
+DATE_END = date.today() - timedelta(days=1)
+# 4 shards of 5 days
+DATE_START = DATE_END - timedelta(days=19)
+
+
+class ShardedIntegration(Integration):
+    backfill_shard_days = 5
+    backfill_concurrency = 2
+    # Days collected by all instances, and the days failing collection
+    collected: List[date] = []
+    failing_date: Optional[date] = None
+    rate_limited_dates: Set[date] = set()
+
+    def can_backfill(self):
+        return True
+
+    def collect_past_range(self, date_start, date_end):
+        for i in range((date_end - date_start).days + 1):
+            day = date_start + timedelta(days=i)
+            if day == self.failing_date:
+                raise ValueError("Collection failed")
+            if day in self.rate_limited_dates:
+                # Succeeds once retried
+                self.rate_limited_dates.remove(day)
+                raise RateLimitExceeded("Rate limited", retry_after=0)
+            self.collected.append(day)
+            yield MeasurementTuple(date=day, value=day.toordinal())
+
+
+class UnitTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="user", email="user@example.com")
+        self.metric = Metric.objects.create(
+            name="metric", user=self.user, integration_id="sharded"
+        )
+        ShardedIntegration.collected = []
+        ShardedIntegration.failing_date = None
+        ShardedIntegration.rate_limited_dates = set()
+        # Chords run in the test process
+        celery_app.conf.update(task_always_eager=True, task_eager_propagates=True)
+        integration_classes = patch.dict(
+            INTEGRATION_CLASSES, {"sharded": ShardedIntegration}
+        )
+        integration_classes.start()
+        self.addCleanup(integration_classes.stop)
+
+    def tearDown(self):
+        celery_app.conf.update(task_always_eager=False, task_eager_propagates=False)
+
+    def backfill(self):
+        backfill_task(self.user.pk, self.metric.pk, since=DATE_START.isoformat())
+
+    def measurement_dates(self):
+        return sorted(
+            Measurement.objects.filter(metric=self.metric).values_list(
+                "date", flat=True
+            )
+        )
+
+    def test_backfill(self):
+        self.backfill()
+        all_dates = [DATE_START + timedelta(days=i) for i in range(20)]
+        self.assertEqual(self.measurement_dates(), all_dates)
+        self.assertEqual(sorted(ShardedIntegration.collected), all_dates)
+        backfill = Backfill.objects.get()
+        self.assertEqual(
+            (
+                backfill.shard_count,
+                backfill.finished_shard_count,
+                backfill.collected_count,
+            ),
+            (4, 4, 20),
+        )
+        self.assertIsNotNone(backfill.finished_at)
+        # Next backfills start from scratch
+        self.assertFalse(BackfillCheckpoint.objects.exists())
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_resume_failed_backfill(self):
+        # Fails in the middle of the second shard
+        ShardedIntegration.failing_date = DATE_START + timedelta(days=7)
+        with self.assertRaises(ValueError):
+            self.backfill()
+        self.assertIsNone(Backfill.objects.get().finished_at)
+        # What was collected can be resumed from
+        checkpoints = set(
+            BackfillCheckpoint.objects.values_list("date_start", "date_end")
+        )
+        self.assertIn(
+            (DATE_START + timedelta(days=5), DATE_START + timedelta(days=6)),
+            checkpoints,
+        )
+        collected = set(ShardedIntegration.collected)
+
+        ShardedIntegration.collected = []
+        ShardedIntegration.failing_date = None
+        self.backfill()
+        # Checkpointed days aren't collected again
+        self.assertFalse(collected & set(ShardedIntegration.collected))
+        self.assertEqual(
+            self.measurement_dates(),
+            [DATE_START + timedelta(days=i) for i in range(20)],
+        )
+        self.assertFalse(BackfillCheckpoint.objects.exists())
+
+    def test_retry_rate_limited_shard(self):
+        ShardedIntegration.rate_limited_dates = {DATE_START + timedelta(days=2)}
+        backfill = Backfill.objects.create(
+            metric=self.metric,
+            requested_by=self.user,
+            date_start=DATE_START,
+            date_end=DATE_END,
+            shard_count=1,
+        )
+        shard = (backfill.pk, DATE_START.isoformat(), DATE_END.isoformat())
+        with patch.object(
+            backfill_shard_task, "retry", side_effect=Retry()
+        ) as retry, self.assertRaises(Retry):
+            backfill_shard_task(*shard)
+        # The retry resumes after the last collected day
+        retry_kwargs = retry.call_args.kwargs["kwargs"]
+        self.assertEqual(
+            retry_kwargs["since"], (DATE_START + timedelta(days=2)).isoformat()
+        )
+        self.assertEqual(
+            list(BackfillCheckpoint.objects.values_list("date_start", "date_end")),
+            [(DATE_START, DATE_START + timedelta(days=1))],
+        )
+        backfill_shard_task(**retry_kwargs)
+        all_dates = [DATE_START + timedelta(days=i) for i in range(20)]
+        self.assertEqual(ShardedIntegration.collected, all_dates)
+        self.assertEqual(self.measurement_dates(), all_dates)
+        backfill.refresh_from_db()
+        self.assertEqual(
+            (backfill.finished_shard_count, backfill.collected_count), (1, 20)
+        )
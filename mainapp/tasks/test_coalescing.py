@@ -0,0 +1,119 @@
+import uuid
+from datetime import date, timedelta
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from integrations.base import MeasurementTuple
+from mainapp.models import Metric, User
+from mainapp.tasks.coalescing import (
+    FetchInProgress,
+    _lock_key,
+    can_coalesce,
+    collection_fingerprint,
+    fetch_once,
+    find_batch,
+)
+
+
+class UnitTestCase(TestCase):
+    def test_collection_fingerprint(self):
+        def metric(access_token, config):
+            return Metric(
+                integration_id="github",
+                integration_config=config,
+                integration_credentials={
+                    "access_token": access_token,
+                    "refresh_token": "refresh",
+                },
+            )
+
+        day = date(2024, 1, 1)
+        self.assertEqual(
+            collection_fingerprint(metric("a", {"repo": "x"}), day, day),
+            collection_fingerprint(metric("b", {"repo": "x"}), day, day),
+        )
+        self.assertNotEqual(
+            collection_fingerprint(metric("a", {"repo": "x"}), day, day),
+            collection_fingerprint(metric("a", {"repo": "y"}), day, day),
+        )
+        self.assertNotEqual(
+            collection_fingerprint(metric("a", {"repo": "x"}), day, day),
+            collection_fingerprint(metric("a", {"repo": "x"})),
+        )
+
+    def test_fetch_once(self):
+        fingerprint = f"test:{uuid.uuid4()}"
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            return [MeasurementTuple(date=date(2024, 1, 1), value=1)]
+
+        self.assertEqual(fetch_once(fingerprint, fetch), fetch_once(fingerprint, fetch))
+        self.assertEqual(len(calls), 1)
+
+    def test_fetch_once_without_reuse(self):
+        fingerprint = f"test:{uuid.uuid4()}"
+        fetch_once(fingerprint, lambda: [])
+        result = [MeasurementTuple(date=date(2024, 1, 1), value=1)]
+        # Fresh measurements are fetched, and shared with the next metrics
+        self.assertEqual(fetch_once(fingerprint, lambda: result, reuse=False), result)
+        self.assertEqual(fetch_once(fingerprint, lambda: []), result)
+
+    def test_fetch_once_failure(self):
+        fingerprint = f"test:{uuid.uuid4()}"
+
+        def fail():
+            raise ValueError()
+
+        with self.assertRaises(ValueError):
+            fetch_once(fingerprint, fail)
+        # Lock is released: the next metric fetches again
+        self.assertEqual(fetch_once(fingerprint, lambda: []), [])
+
+    def test_fetch_once_in_progress(self):
+        fingerprint = f"test:{uuid.uuid4()}"
+        cache.add(_lock_key(fingerprint), True)
+        # Waiting metrics don't fetch
+        with self.assertRaises(FetchInProgress):
+            fetch_once(fingerprint, lambda: [])
+        cache.delete(_lock_key(fingerprint))
+
+    def test_can_coalesce(self):
+        day = date(2024, 1, 1)
+        self.assertTrue(can_coalesce(day, day))
+        self.assertTrue(can_coalesce(None, None))
+        self.assertFalse(can_coalesce(day - timedelta(days=365), day))
+
+    def test_find_batch(self):
+        user = User.objects.create(username="user")
+        site_url = f"https://{uuid.uuid4()}.com"
+
+        def metric(metric, site_url=site_url, refresh_token="refresh"):
+            return Metric.objects.create(
+                name=metric,
+                user=user,
+                integration_id="google_search_console",
+                integration_config={
+                    "site_url": site_url,
+                    "metric": metric,
+                    "filters": [],
+                },
+                integration_credentials={
+                    "access_token": "access",
+                    "refresh_token": refresh_token,
+                },
+            )
+
+        clicks = metric("clicks")
+        impressions = metric("impressions")
+        metric("ctr", site_url="https://other.com")
+        metric("position", refresh_token="other")
+
+        day = date.today() - timedelta(days=1)
+        batch = find_batch(clicks, day, day)
+        self.assertEqual(batch, [impressions])
+        # Fetch of the batched metric is claimed
+        self.assertEqual(find_batch(clicks, day, day), [])
+        cache.delete(_lock_key(collection_fingerprint(impressions, day, day)))
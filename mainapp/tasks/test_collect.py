@@ -1,6 +1,9 @@
+from unittest.mock import patch
+
 from django.test import TestCase
 
 from config.settings import DATABASES
+from integrations.implementations import postgresql
 from mainapp.models.measurement import Measurement
 from mainapp.models.metric import Metric
 from mainapp.models.user import User
@@ -25,6 +28,13 @@ class UnitTestCase(TestCase):
             },
         )
 
+    def tearDown(self):
+        # Pooled connections would prevent the test database from being dropped
+        with patch.object(postgresql, "POSTGRESQL_POOL_MAX_IDLE", -1):
+            postgresql.get_pool(
+                self.metric.integration_config["database_connection"]
+            ).close_stale()
+
     def test_collect_latest(self):
         self.metric.integration_config = {
             **self.metric.integration_config,
@@ -56,3 +66,15 @@ class UnitTestCase(TestCase):
         self.assertGreater(
             Measurement.objects.filter(metric_id=self.metric.pk).count(), 0
         )
+
+    def test_collect_latest_with_several_statements(self):
+        self.metric.integration_config = {
+            **self.metric.integration_config,
+            "sql_query_template": "SET LOCAL work_mem = '64MB';\nSELECT NOW() as date, 1 as value WHERE %(date_start)s < NOW() and %(date_end)s < NOW();",
+        }
+        self.metric.save()
+
+        collect_latest_task(self.metric.pk)
+        self.assertGreater(
+            Measurement.objects.filter(metric_id=self.metric.pk).count(), 0
+        )
@@ -0,0 +1,74 @@
+import time
+import uuid
+from unittest.mock import patch
+
+from django.test import TestCase
+
+from integrations.base import Integration
+from mainapp.tasks import config_schemas
+from mainapp.tasks.config_schemas import (
+    FRESH_TIMEOUT,
+    get_config_schema,
+    invalidate_config_schemas,
+)
+
+
+class ListingIntegration(Integration):
+    def callable_config_schema(self):
+        return {"type": "dict", "keys": {}}
+
+
+class UnitTestCase(TestCase):
+    def setUp(self):
+        # Unique credentials, as the cache is shared between tests
+        self.refresh_token = str(uuid.uuid4())
+        self.calls = 0
+
+    def credentials(self, access_token="a"):
+        return {"access_token": access_token, "refresh_token": self.refresh_token}
+
+    def fetch(self):
+        self.calls += 1
+        return {"type": "dict", "keys": {"calls": self.calls}}
+
+    def get(self, config=None, credentials=None, metric_id=None):
+        return get_config_schema(
+            ListingIntegration,
+            config or {},
+            credentials or self.credentials(),
+            self.fetch,
+            metric_id=metric_id,
+        )
+
+    def test_cached_per_credentials_and_config(self):
+        schema = self.get()
+        # Refreshed access tokens don't change the schema
+        self.assertEqual(self.get(credentials=self.credentials("b")), schema)
+        self.assertEqual(self.calls, 1)
+        self.get(config={"account": "x"})
+        self.assertEqual(self.calls, 2)
+
+    def test_invalidate(self):
+        self.get()
+        self.get(config={"account": "x"})
+        invalidate_config_schemas(ListingIntegration, self.credentials("b"))
+        self.get()
+        self.get(config={"account": "x"})
+        self.assertEqual(self.calls, 4)
+
+    def test_stale_refreshed_in_background(self):
+        schema = self.get()
+        metric_id = uuid.uuid4()
+        stale = time.time() + FRESH_TIMEOUT
+        with patch("time.time", return_value=stale), patch.object(
+            config_schemas.refresh_config_schema_task, "delay"
+        ) as delay:
+            # Stale schemas of new metrics are fetched again
+            self.assertNotEqual(self.get(), schema)
+            schema = self.get()
+            with patch("time.time", return_value=stale + FRESH_TIMEOUT):
+                # Saved metrics get the stale schema, refreshed only once
+                self.assertEqual(self.get(metric_id=metric_id), schema)
+                self.assertEqual(self.get(metric_id=metric_id), schema)
+        delay.assert_called_once_with(metric_id=metric_id)
+        self.assertEqual(self.calls, 2)
@@ -0,0 +1,141 @@
+from datetime import date, timedelta
+from unittest.mock import patch
+
+from django.test import TestCase
+
+from mainapp.models import Backfill, CollectionRun, Measurement, Metric, User
+from mainapp.tasks import collect_all_latest_task, scheduling
+from mainapp.tasks.scheduling import (
+    backfill_shards,
+    collection_ranges,
+    iter_metric_id_chunks,
+    total_integration_weight,
+)
+
+
+class UnitTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="user")
+        self.metrics = [
+            Metric.objects.create(
+                name=f"metric{i}",
+                user=self.user,
+                integration_id="postgresql" if i % 2 else "stripe",
+            )
+            for i in range(5)
+        ]
+
+    def test_iter_metric_id_chunks(self):
+        chunks = list(iter_metric_id_chunks(chunk_size=2))
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 1])
+        self.assertEqual(
+            [metric_id for chunk in chunks for metric_id, _ in chunk],
+            sorted(m.pk for m in self.metrics),
+        )
+
+    def test_total_integration_weight(self):
+        # 3 stripe metrics (weight 3) and 2 postgresql metrics (weight 1)
+        self.assertEqual(total_integration_weight(), 3 * 3 + 2 * 1)
+
+    def test_collect_all_latest_spread(self):
+        with patch("mainapp.tasks.group") as group:
+            collect_all_latest_task()
+        countdowns = [
+            signature.options["countdown"]
+            for call in group.call_args_list
+            for signature in call.args[0]
+        ]
+        self.assertEqual(len(countdowns), 2 * len(self.metrics))
+        self.assertEqual(countdowns[0], 0)
+        self.assertLess(max(countdowns), CollectionRun.objects.get().window.seconds)
+
+    def test_collect_all_latest_created_while_scheduling(self):
+        # All metrics were created after the total weight was computed
+        with patch.object(
+            scheduling, "total_integration_weight", return_value=0
+        ), patch("mainapp.tasks.group") as group:
+            collect_all_latest_task()
+        self.assertEqual(
+            {
+                signature.options["countdown"]
+                for call in group.call_args_list
+                for signature in call.args[0]
+            },
+            {0},
+        )
+        self.assertEqual(CollectionRun.objects.get().scheduled_count, len(self.metrics))
+
+    def test_collection_run_counters(self):
+        run = CollectionRun.objects.create(window=timedelta(minutes=30))
+        CollectionRun.mark_started(run.pk)
+        CollectionRun.mark_started(run.pk)
+        CollectionRun.mark_succeeded(run.pk)
+        CollectionRun.mark_failed(run.pk)
+        run.refresh_from_db()
+        self.assertEqual(
+            (run.started_count, run.succeeded_count, run.failed_count), (2, 1, 1)
+        )
+        self.assertIsNotNone(run.first_started_at)
+        self.assertIsNotNone(run.wall_clock_duration)
+
+    def test_collection_ranges(self):
+        date_end = date.today() - timedelta(days=1)
+        Measurement.objects.create(
+            metric=self.metrics[0], date=date_end - timedelta(days=3), value=1
+        )
+        with self.assertNumQueries(1):
+            ranges = collection_ranges(self.metrics[:2])
+        self.assertEqual(
+            ranges,
+            {
+                # Missing datapoints are gathered
+                self.metrics[0].pk: (date_end - timedelta(days=2), date_end),
+                self.metrics[1].pk: (date_end, date_end),
+            },
+        )
+
+    def test_backfill_shards(self):
+        self.assertEqual(
+            backfill_shards(date(2024, 1, 1), date(2024, 1, 25), shard_days=10),
+            [
+                (date(2024, 1, 1), date(2024, 1, 10)),
+                (date(2024, 1, 11), date(2024, 1, 20)),
+                (date(2024, 1, 21), date(2024, 1, 25)),
+            ],
+        )
+        self.assertEqual(backfill_shards(date(2024, 1, 2), date(2024, 1, 1), 10), [])
+
+    def test_backfill_shards_skip_completed(self):
+        self.assertEqual(
+            backfill_shards(
+                date(2024, 1, 1),
+                date(2024, 1, 31),
+                shard_days=10,
+                completed=[
+                    (date(2024, 1, 21), date(2024, 2, 10)),
+                    (date(2023, 12, 1), date(2024, 1, 5)),
+                ],
+            ),
+            [
+                (date(2024, 1, 6), date(2024, 1, 15)),
+                (date(2024, 1, 16), date(2024, 1, 20)),
+            ],
+        )
+
+    def test_backfill_progress(self):
+        backfill = Backfill.objects.create(
+            metric=self.metrics[0],
+            requested_by=self.user,
+            date_start=date(2024, 1, 1),
+            date_end=date(2024, 1, 25),
+            shard_count=3,
+        )
+        Backfill.add_progress(backfill.pk, 10, shard_finished=True)
+        Backfill.add_progress(backfill.pk, 5, shard_finished=False)
+        backfill.refresh_from_db()
+        self.assertEqual(
+            (backfill.collected_count, backfill.finished_shard_count), (15, 1)
+        )
+        # Only the first failing shard reports the failure
+        self.assertTrue(Backfill.mark_failed(backfill.pk))
+        self.assertFalse(Backfill.mark_failed(backfill.pk))
@@ -0,0 +1,112 @@
+from unittest.mock import MagicMock, patch
+
+from django.core.cache import cache
+from django.test import TestCase
+from slack_sdk.errors import SlackApiError
+
+from mainapp.forms import OrganizationForm
+from mainapp.models import Organization, User
+from mainapp.tasks import slack_notifications
+
+
+def slack_response(obj):
+    response = MagicMock()
+    response.json.return_value = obj
+    return response
+
+
+class UnitTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="user")
+        self.organization = Organization.create(
+            name="org",
+            slug="org",
+            owner=self.user,
+            slack_notifications_credentials={"access_token": "token"},
+            slack_notifications_channel="#general",
+        )
+        self.channels = [
+            {"id": "C1", "name": "general", "is_member": False},
+            {"id": "C2", "name": "random", "is_member": True},
+        ]
+        self.session = MagicMock()
+        self.session.get.side_effect = lambda *args, **kwargs: slack_response(
+            {"ok": True, "channels": self.channels, "response_metadata": {}}
+        )
+        self.session.post.return_value = slack_response({"ok": True})
+        self.client = MagicMock()
+        self.client.files_upload_v2.return_value = {"ok": True}
+        for patcher in [
+            patch.object(slack_notifications, "_session", return_value=self.session),
+            patch.object(slack_notifications, "WebClient", return_value=self.client),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        # The cache is shared between tests
+        for channel in self.channels:
+            self.addCleanup(
+                cache.delete,
+                slack_notifications._joined_key(self.organization, channel["id"]),
+            )
+        self.addCleanup(slack_notifications.forget_channels, self.organization)
+
+    def notify(self):
+        slack_notifications.notify_channel(self.organization, b"png", "message")
+
+    def test_channels_cached(self):
+        self.assertEqual(
+            slack_notifications.list_public_channels(self.organization),
+            ["#general", "#random"],
+        )
+        slack_notifications.list_public_channels(self.organization)
+        self.assertEqual(self.session.get.call_count, 1)
+
+    def test_notify_stores_channel_id(self):
+        self.notify()
+        self.organization.refresh_from_db()
+        self.assertEqual(self.organization.slack_notifications_channel_id, "C1")
+        self.assertEqual(self.client.files_upload_v2.call_args.kwargs["channel"], "C1")
+
+    def test_notify_joins_once(self):
+        self.notify()
+        self.session.post.assert_called_once()
+        # Only the upload is left
+        slack_notifications.forget_channels(self.organization)
+        self.notify()
+        self.session.post.assert_called_once()
+        self.assertEqual(self.session.get.call_count, 1)
+        self.assertEqual(self.client.files_upload_v2.call_count, 2)
+
+    def test_notify_member_channel(self):
+        self.organization.slack_notifications_channel = "#random"
+        self.notify()
+        # The bot is already a member
+        self.session.post.assert_not_called()
+
+    def test_notify_rejoins_when_removed(self):
+        self.notify()
+        self.client.files_upload_v2.side_effect = [
+            SlackApiError("", {"ok": False, "error": "not_in_channel"}),
+            {"ok": True},
+        ]
+        self.notify()
+        self.assertEqual(self.session.post.call_count, 2)
+        self.assertEqual(self.client.files_upload_v2.call_count, 3)
+
+    def test_form_resolves_channel_id(self):
+        def save(channel):
+            form = OrganizationForm(
+                instance=Organization.objects.get(pk=self.organization.pk),
+                data={
+                    "name": "org",
+                    "owner": self.user.pk,
+                    "slug": "org",
+                    "slack_notifications_channel": channel,
+                },
+            )
+            self.assertTrue(form.is_valid(), form.errors)
+            return form.save()
+
+        self.assertEqual(save("#random").slack_notifications_channel_id, "C2")
+        self.assertEqual(save("#general").slack_notifications_channel_id, "C1")
+        self.assertIsNone(save("").slack_notifications_channel_id)
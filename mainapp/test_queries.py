@@ -0,0 +1,62 @@
+from datetime import date
+
+from django.test import TestCase
+
+from integrations.base import MeasurementTuple
+from mainapp.models import Measurement, Metric, User
+from mainapp.queries import MeasurementWriter, upsert_measurements
+
+
+class UnitTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="user")
+        self.metric = Metric.objects.create(
+            name="metric",
+            user=self.user,
+            integration_id="postgresql",
+        )
+
+    def test_upsert_measurements(self):
+        result = upsert_measurements(
+            self.metric.pk,
+            [
+                MeasurementTuple(date=date(2024, 1, 1), value=1),
+                MeasurementTuple(date=date(2024, 1, 2), value=float("nan")),
+            ],
+        )
+        self.assertEqual(result, (2, 0, 0))
+        result = upsert_measurements(
+            self.metric.pk,
+            [
+                MeasurementTuple(date=date(2024, 1, 1), value=1),
+                MeasurementTuple(date=date(2024, 1, 2), value=float("nan")),
+                MeasurementTuple(date=date(2024, 1, 3), value=3),
+                # Duplicate dates within a batch: the last one wins
+                MeasurementTuple(date=date(2024, 1, 3), value=4),
+            ],
+        )
+        self.assertEqual(result, (1, 0, 2))
+        result = upsert_measurements(
+            self.metric.pk, [MeasurementTuple(date=date(2024, 1, 1), value=2)]
+        )
+        self.assertEqual(result, (0, 1, 0))
+        self.assertEqual(
+            list(
+                Measurement.objects.filter(metric=self.metric)
+                .order_by("date")
+                .values_list("value", flat=True)
+            )[::2],
+            [2, 4],
+        )
+
+    def test_measurement_writer_batches(self):
+        writer = MeasurementWriter(self.metric.pk, batch_size=2)
+        with self.assertRaises(ValueError):
+            with writer:
+                for day in range(1, 6):
+                    writer.write(MeasurementTuple(date=date(2024, 1, day), value=day))
+                raise ValueError()
+        # Pending measurements are written even if collection failed
+        self.assertEqual(writer.inserted, 5)
+        self.assertEqual(writer.last_written, (date(2024, 1, 5), 5))
+        self.assertEqual(Measurement.objects.filter(metric=self.metric).count(), 5)
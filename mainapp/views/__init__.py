@@ -12,7 +12,7 @@ from integrations import INTEGRATION_CLASSES, INTEGRATION_IDS
 from integrations.base import WebAuthIntegration
 
 from ..models import Metric
-from ..tasks import google_spreadsheet_export, slack_notifications
+from ..tasks import config_schemas, google_spreadsheet_export, slack_notifications
 
 # Re-export
 from . import (  # noqa
@@ -148,6 +148,11 @@ class AuthorizeCallbackView(LoginRequiredMixin, TemplateView):
                     # so redirect to next or root
                     return redirect(cache_obj.get("next") or "/")
 
+            # Schemas listed with previous grants may lack e.g. the newly
+            # authorized accounts
+            config_schemas.invalidate_config_schemas(
+                integration_class, integration_credentials
+            )
             # Save credentials
             if metric:
                 metric.integration_credentials = integration_credentials
@@ -43,7 +43,7 @@ from mainapp.views.dashboard import get_metric_data
 from .. import forms
 from ..forms import BackfillForm, MetricForm, MetricTransferOwnershipForm
 from ..models import Measurement, Metric, Organization, User
-from ..tasks import backfill_task
+from ..tasks import backfill_task, config_schemas
 from ..utils.charts import get_vl_spec
 from .utils import OrjsonResponse, add_next
 
@@ -114,7 +114,12 @@ def process_metric_test(
                     "datetime": datetime.now(),
                     "canBackfill": inst.can_backfill(),
                     "status": "ok",
-                    "newSchema": inst.callable_config_schema(),
+                    "newSchema": config_schemas.get_config_schema(
+                        integration_class,
+                        config,
+                        integration_credentials,
+                        inst.callable_config_schema,
+                    ),
                     "vlSpec": get_vl_spec(
                         [Measurement(**m._asdict()) for m in measurements]
                     ),